@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import Console
+import EverquestLogFile
+
+
+class AsyncLogTailer:
+    """
+    class to follow an Everquest log from an asyncio event loop, rather than from a thread of its own.
+
+    The tailer drives an EverquestLogFile (or child class, e.g. DeathLoopVaccine) object whose thread is
+    never started: it reads the log with the object's readlines(), hands each batch to the object's
+    process_lines() exactly as the parsing thread would, and makes the same checks for truncation,
+    character switches, and heartbeats while the log is quiet.  So the parsing logic runs unchanged,
+    but any number of tailers can share a single event loop, along with other async services.
+
+    While the log is quiet, the tailer waits on the inotify file descriptor with loop.add_reader() where
+    inotify is available, else it polls with asyncio.sleep().  Either way, no thread is used.
+
+    Usage, e.g.
+
+        tailer = AsyncLogTailer(DeathLoopVaccine.DeathLoopVaccine(config))
+        async for line in tailer:
+            ...
+
+    or just 'await tailer.run()' if the lines are of no interest beyond what the parser does with them
+    """
+
+    def __init__(self, parser: EverquestLogFile.EverquestLogFile, charname: str = None, filename: str = None) -> None:
+        """
+        ctor
+
+        :param parser: parser object, which must not be started
+        :param charname: character name, if a particular log is to be followed
+        :param filename: full log filename, if a particular log is to be followed.
+        If None, the latest log is followed, switching logs whenever some other character log becomes the latest
+        """
+        self.parser = parser
+        self.charname = charname
+        self.filename = filename
+
+        self._stopped = False
+        self._wakeup = None
+        self._watcher = None
+
+    def __aiter__(self):
+        return self.lines()
+
+    async def lines(self):
+        """
+        async iterator of the lines of the log, each one yielded after the parser has processed it
+        """
+        async for batch in self.batches():
+            for line in batch:
+                yield line
+
+    async def batches(self):
+        """
+        async iterator of the batches of lines read from the log, each one yielded after the parser has processed it.
+        Runs until stop() is called
+        """
+        parser = self.parser
+        self._wakeup = asyncio.Event()
+        self._watcher = parser.make_watcher()
+        try:
+            while not self._stopped:
+
+                # not parsing yet (e.g. no logs), or the log couldn't be reopened.  Try again every heartbeat
+                if not parser.is_parsing():
+                    if not self.open():
+                        await self.wait(parser.heartbeat)
+                    continue
+
+                # read everything that is available.  The parser reuses its batch list, so hand out a copy
+                lines = parser.readlines()
+                now = time.time()
+                if lines:
+                    batch = list(lines)
+                    parser.process_batch(batch, now)
+                    yield batch
+
+                # nothing new, so check for a truncated log, a character switch, or an expired heartbeat,
+                # and if none of those, wait for the logs directory to be written to
+                elif not parser.check_idle(now, switch=self.filename is None):
+                    await self.wait(parser.idle_timeout(now))
+        finally:
+            parser.close()
+            parser.close_watcher()
+
+    async def run(self) -> None:
+        """
+        follow the log until stop() is called, with the parser doing all the work
+        """
+        async for _ in self.batches():
+            pass
+
+    def open(self) -> bool:
+        """
+        open the log, starting from the checkpoint if there is one
+
+        :return: True if the log was opened
+        """
+        try:
+            if self.filename is None:
+                rv = self.parser.open_latest(resume=True)
+            else:
+                rv = self.parser.open(self.charname, self.filename, resume=True)
+        except ValueError as err:
+            EverquestLogFile.starprint(f'{err}', Console.QUIET)
+            return False
+
+        if rv:
+            EverquestLogFile.starprint(f'Now parsing character log for: [{self.parser.char_name}]')
+        return rv
+
+    async def wait(self, timeout: float) -> None:
+        """
+        wait for the logs directory to be written to, for stop() to be called, or for timeout seconds
+
+        :param timeout: maximum number of seconds to wait
+        """
+        watcher = self._watcher
+        loop = asyncio.get_running_loop()
+
+        fileno = getattr(watcher, 'fileno', None)
+        if fileno is not None:
+            loop.add_reader(fileno(), self._wakeup.set)
+        else:
+            timeout = min(timeout, watcher.poll_interval)
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if fileno is not None:
+                loop.remove_reader(fileno())
+                watcher.read_events()
+            self._wakeup.clear()
+
+    def stop(self) -> None:
+        """
+        cause the iterators and run() to finish.  Must be called from the event loop thread
+        """
+        self._stopped = True
+        if self._wakeup:
+            self._wakeup.set()
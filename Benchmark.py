@@ -0,0 +1,400 @@
+import argparse
+import configparser
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import Console
+import DeathLoopVaccine
+import EverquestLogFile
+import Replay
+
+
+#
+# benchmark suite for the log parsing hot path
+#
+# All of the log traffic is synthetic, from a seeded generator, so runs are repeatable.  Each run appends
+# one JSON record (tagged with the git commit) to the results file, and --compare shows how the latest
+# run stacks up against the most recent run from a different commit, so regressions are easy to spot, i.e.
+#
+#   py Benchmark.py --lines 500000 --compare
+#
+
+# default mix of log traffic, as relative weights
+DEFAULT_RATES = {
+    'combat': 70.0,
+    'chat': 15.0,
+    'casting': 8.0,
+    'melee': 6.0,
+    'death': 0.5,
+    'death_loop': 0.1,
+}
+
+MOBS = ['a gnoll pup', 'a decaying skeleton', 'an orc centurion', 'Lord Nagafen', 'a fire beetle', 'a large rat']
+PLAYERS = ['Aelfric', 'Brunhild', 'Cadoc', 'Durwin', 'Elowen', 'Fenwick']
+SPELLS = ['Complete Heal', 'Gate', 'Spirit of Wolf', 'Clarity', 'Fire Bolt', 'Root']
+MELEE = ['hit', 'slash', 'pierce', 'crush', 'kick', 'bash']
+CHANNELS = ['shouts', 'auctions', 'says out of character', 'tells the group']
+
+
+class LogGenerator:
+    """
+    class to generate realistic looking (but synthetic) Everquest log lines, from a seeded random generator
+    """
+
+    def __init__(self, char_name: str = 'Benchmark', seed: int = 1999, rates: dict = None,
+                 lines_per_second: float = 20.0, start_time: float = None) -> None:
+        """
+        ctor
+
+        :param char_name: name of the character whose log is being generated
+        :param seed: random generator seed, the same seed always produces the same log
+        :param rates: dictionary of traffic category -> relative weight, see DEFAULT_RATES
+        :param lines_per_second: simulated log traffic rate, which sets how fast the timestamps advance
+        :param start_time: epoch seconds of the first line, defaults to a fixed date so runs are repeatable
+        """
+        self.char_name = char_name
+        self.random = random.Random(seed)
+        rates = rates or DEFAULT_RATES
+        self.categories = list(rates.keys())
+        self.weights = list(rates.values())
+        self.lines_per_second = lines_per_second
+        self.clock = start_time if start_time is not None else time.mktime((2022, 3, 12, 20, 0, 0, 0, 0, -1))
+
+    def body(self, category: str) -> str:
+        """
+        generate the text of one line, without the timestamp
+
+        :param category: traffic category
+        :return: line text
+        """
+        r = self.random
+        if category == 'combat':
+            return f'{r.choice(MOBS).capitalize()} hits YOU for {r.randint(1, 90)} points of damage.'
+        elif category == 'chat':
+            return f"{r.choice(PLAYERS)} {r.choice(CHANNELS)}, 'LFG {r.randint(1, 60)} {r.choice(SPELLS)}'"
+        elif category == 'casting':
+            return f'You begin casting {r.choice(SPELLS)}.'
+        elif category == 'melee':
+            return f'You {r.choice(MELEE)} {r.choice(MOBS)} for {r.randint(1, 40)} points of damage.'
+        elif category == 'death':
+            return f'You have been slain by {r.choice(MOBS)}!'
+        elif category == 'death_loop':
+            return 'death_loop is not online at this time.'
+        raise ValueError(f'Unknown traffic category [{category}]')
+
+    def lines(self, count: int) -> list[str]:
+        """
+        generate a batch of lines
+
+        :param count: number of lines
+        :return: list of lines, each with its timestamp and trailing newline
+        """
+        rv = list()
+        for category in self.random.choices(self.categories, self.weights, k=count):
+            self.clock += self.random.expovariate(self.lines_per_second)
+            stamp = time.strftime('[%a %b %d %H:%M:%S %Y]', time.localtime(self.clock))
+            rv.append(f'{stamp} {self.body(category)}\n')
+        return rv
+
+
+class LatencyProbe(EverquestLogFile.EverquestLogFile):
+    """
+    log file reader that records when each probe line arrives, for the tail latency benchmark
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.arrivals = dict()
+
+    def process_line(self, line: str) -> None:
+        # probe lines carry their sequence number as the last word
+        if 'PROBE' in line:
+            self.arrivals[int(line.rsplit(' ', 1)[1])] = time.perf_counter()
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+@contextlib.contextmanager
+def console_output(stream, verbosity: int):
+    """
+    temporarily send the console output somewhere else
+
+    :param stream: file object to write to
+    :param verbosity: console verbosity level
+    """
+    console = Console.console
+    saved = (console.stream, console.verbosity)
+    console.flush()
+    console.stream, console.verbosity = stream, verbosity
+    try:
+        yield
+    finally:
+        console.flush()
+        console.stream, console.verbosity = saved
+
+
+def make_detector() -> DeathLoopVaccine.DeathLoopVaccine:
+    """
+    create a parser whose detector records death loops rather than killing anything
+
+    :return: parser object
+    """
+    return Replay.make_replay_parser(configparser.ConfigParser(), [(4, 120)], 'Benchmark')
+
+
+def bench_classifier(lines: list[str], repeat: int) -> dict:
+    """
+    measure DeathLoopVaccine line processing throughput, with and without the console echo
+
+    :param lines: generated lines
+    :param repeat: number of timing runs, the best run is reported
+    :return: dictionary of results
+    """
+    rv = dict()
+    with open(os.devnull, 'w') as devnull, console_output(devnull, Console.ECHO):
+
+        # the full process_lines() path, including echoing every line to the (null) console
+        best = float('inf')
+        for _ in range(repeat):
+            detector = make_detector()
+            start = time.perf_counter()
+            detector.process_lines(lines)
+            best = min(best, time.perf_counter() - start)
+        rv['process_lines_per_sec'] = len(lines) / best
+
+        # just the parse into an event, i.e. the timestamp and the rule classification
+        detector = make_detector()
+        classify = detector.pipeline.make_event
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for line in lines:
+                classify(line)
+            best = min(best, time.perf_counter() - start)
+        rv['classify_lines_per_sec'] = len(lines) / best
+
+    return rv
+
+
+def bench_reader(lines: list[str], repeat: int) -> dict:
+    """
+    measure how fast the block reader gets lines out of a log file
+
+    :param lines: generated lines
+    :param repeat: number of timing runs, the best run is reported
+    :return: dictionary of results
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'eqlog_Benchmark_bench.txt')
+        with open(filename, 'w') as f:
+            f.writelines(lines)
+
+        best = float('inf')
+        for _ in range(repeat):
+            elf = EverquestLogFile.EverquestLogFile(directory, os.sep, 'bench', 15)
+            elf.open('Benchmark', filename, seek_end=False)
+            count = 0
+            start = time.perf_counter()
+            while True:
+                batch = elf.readlines()
+                if not batch:
+                    break
+                count += len(batch)
+            best = min(best, time.perf_counter() - start)
+            elf.close()
+
+    return {'readlines_lines_per_sec': count / best}
+
+
+def bench_tail_latency(probes: int, interval: float, backend: str) -> dict:
+    """
+    measure the delay from a line being written to the log, to it being processed by the parsing thread
+
+    :param probes: number of probe lines to write
+    :param interval: number of seconds between probe lines
+    :param backend: log watcher backend
+    :return: dictionary of results
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'eqlog_Benchmark_bench.txt')
+        open(filename, 'w').close()
+
+        with console_output(None, Console.QUIET):
+            probe = LatencyProbe(directory, os.sep, 'bench', 3600, watch_backend=backend)
+            probe.go()
+
+            # give the watcher a moment to get going
+            time.sleep(0.2)
+
+            written = dict()
+            with open(filename, 'a') as f:
+                for n in range(probes):
+                    f.write(f'[Sat Mar 12 20:00:00 2022] PROBE {n}\n')
+                    f.flush()
+                    written[n] = time.perf_counter()
+                    time.sleep(interval)
+
+            time.sleep(0.5)
+            watcher_name = probe._watcher.name if probe._watcher else backend
+            probe.shutdown()
+
+    latencies = sorted((probe.arrivals[n] - written[n]) * 1000.0 for n in written if n in probe.arrivals)
+    if not latencies:
+        return {'tail_backend': watcher_name, 'tail_lost': probes}
+    return {
+        'tail_backend': watcher_name,
+        'tail_latency_ms_p50': statistics.median(latencies),
+        'tail_latency_ms_p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'tail_latency_ms_max': latencies[-1],
+        'tail_lost': probes - len(latencies),
+    }
+
+
+def bench_memory(generator: LogGenerator, total_lines: int, batch: int) -> dict:
+    """
+    measure memory growth of the detector over a long run
+
+    :param generator: line generator
+    :param total_lines: number of lines to process
+    :param batch: number of lines per batch
+    :return: dictionary of results
+    """
+    detector = make_detector()
+    with console_output(None, Console.QUIET):
+
+        # warm up, so one-time allocations (compiled rules etc) aren't counted as growth
+        detector.process_lines(generator.lines(batch))
+
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        done = 0
+        while done < total_lines:
+            lines = generator.lines(batch)
+            detector.process_lines(lines)
+            done += len(lines)
+            del lines
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'memory_lines': done,
+        'memory_growth_kb': (current - baseline) / 1024.0,
+        'memory_peak_kb': (peak - baseline) / 1024.0,
+    }
+
+
+def git_commit() -> str:
+    """
+    :return: the current git commit hash, or 'unknown'
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def compare(results_filename: str, latest: dict) -> None:
+    """
+    print the latest results next to the most recent results from a different commit
+
+    :param results_filename: results file
+    :param latest: latest results record
+    """
+    previous = None
+    with open(results_filename) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['commit'] != latest['commit'] and record['params'] == latest['params']:
+                previous = record
+
+    if previous is None:
+        EverquestLogFile.starprint('No earlier results with the same parameters to compare against')
+        return
+
+    EverquestLogFile.starprint(f'{"metric":<28} {previous["commit"]:>12} {latest["commit"]:>12} {"change":>8}')
+    for key, value in latest['results'].items():
+        old = previous['results'].get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            EverquestLogFile.starprint(f'{key:<28} {old:>12.1f} {value:>12.1f} {100.0 * (value - old) / old:>+7.1f}%')
+
+
+def parse_rates(text: str) -> dict:
+    """
+    parse a traffic mix such as 'combat=70,chat=15,death=1'
+
+    :param text: comma separated list of category=weight
+    :return: dictionary of category -> weight
+    """
+    rates = dict(DEFAULT_RATES)
+    for item in text.split(','):
+        category, weight = item.split('=')
+        if category not in DEFAULT_RATES:
+            raise ValueError(f'Unknown traffic category [{category}]')
+        rates[category] = float(weight)
+    return rates
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the DeathLoopVaccine log parsing hot path')
+    parser.add_argument('--lines', type=int, default=200000, help='number of generated lines for the throughput tests')
+    parser.add_argument('--seed', type=int, default=1999, help='random seed for the log generator')
+    parser.add_argument('--rates', help='traffic mix, i.e. combat=70,chat=15,casting=8,melee=6,death=0.5,death_loop=0.1')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timing runs, the best is reported')
+    parser.add_argument('--probes', type=int, default=200, help='number of probe lines for the tail latency test')
+    parser.add_argument('--probe-interval', type=float, default=0.01, help='seconds between probe lines')
+    parser.add_argument('--backend', default='auto', help='log watcher backend for the tail latency test')
+    parser.add_argument('--memory-lines', type=int, default=1000000, help='number of lines for the memory growth test')
+    parser.add_argument('--results', default='bench_results.jsonl', help='file the results are appended to')
+    parser.add_argument('--compare', action='store_true', help='compare with the latest results from another commit')
+    args = parser.parse_args()
+
+    rates = parse_rates(args.rates) if args.rates else DEFAULT_RATES
+    generator = LogGenerator(seed=args.seed, rates=rates)
+    lines = generator.lines(args.lines)
+
+    results = dict()
+    EverquestLogFile.starprint('Benchmark: classifier')
+    results.update(bench_classifier(lines, args.repeat))
+    EverquestLogFile.starprint('Benchmark: block reader')
+    results.update(bench_reader(lines, args.repeat))
+    EverquestLogFile.starprint('Benchmark: tail latency')
+    results.update(bench_tail_latency(args.probes, args.probe_interval, args.backend))
+    EverquestLogFile.starprint('Benchmark: memory growth')
+    results.update(bench_memory(LogGenerator(seed=args.seed, rates=rates), args.memory_lines, 10000))
+
+    record = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'lines': args.lines, 'seed': args.seed, 'rates': rates, 'probes': args.probes,
+                   'probe_interval': args.probe_interval, 'memory_lines': args.memory_lines},
+        'results': results,
+    }
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+    EverquestLogFile.starprint('')
+    for key, value in results.items():
+        EverquestLogFile.starprint(f'{key:<28} {value:>12.1f}' if isinstance(value, float) else f'{key:<28} {value:>12}')
+
+    if args.compare:
+        EverquestLogFile.starprint('')
+        compare(args.results, record)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+
+# number of bytes at the start of a log file that are fingerprinted, to recognize the same file later
+HEAD_BYTES = 256
+
+
+class CheckpointStore:
+    """
+    class to persist the read position and detector state of each character log, so that a restarted
+    parser can pick up where the previous one left off, rather than at the end of the file.
+
+    There is one record per log file, holding the byte offset of the first unprocessed line, along with
+    enough about the file to tell if it is still the same file: its inode, its size when the record was
+    taken, and a checksum of its first few bytes.  The record also holds whatever state the parser wants
+    to carry over (e.g. the DeathLoopVaccine death list).
+
+    All records are kept in a single small json file, which is rewritten no more than once every
+    interval seconds, by writing a temporary file and renaming it over the old one, so that a crash in
+    the middle of a save never leaves a corrupt checkpoint behind.
+    """
+
+    def __init__(self, filename: str, interval: float = 5.0, max_age: float = 3600.0) -> None:
+        """
+        ctor
+
+        :param filename: name of the checkpoint file
+        :param interval: minimum number of seconds between checkpoint file writes
+        :param max_age: records older than this many seconds are ignored, and dropped on the next save
+        """
+        self.filename = filename
+        self.interval = interval
+        self.max_age = max_age
+
+        # log filename -> record dict
+        self._records = dict()
+        self._dirty = False
+        self._last_save = 0.0
+        self._lock = threading.Lock()
+
+        self.load()
+
+    def load(self) -> None:
+        """
+        read the checkpoint file, if there is one.  An unreadable checkpoint is simply ignored, as is any record in
+        it that isn't a dict with a save time, e.g. in a checkpoint that has been edited by hand.  The other fields
+        of a record are checked when it is used, see validate()
+        """
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(records, dict):
+            records = {log_filename: record for log_filename, record in records.items()
+                       if isinstance(record, dict) and isinstance(record.get('saved'), (int, float))}
+            with self._lock:
+                self._records = records
+
+    def get(self, log_filename: str) -> dict or None:
+        """
+        :param log_filename: full log filename
+        :return: the record for this log, or None if there isn't one or it is too old
+        """
+        with self._lock:
+            record = self._records.get(log_filename)
+        if record is None or time.time() - record.get('saved', 0) > self.max_age:
+            return None
+        return record
+
+    def latest(self) -> str or None:
+        """
+        :return: the log filename with the most recently saved record, i.e. the log that was being parsed last,
+        or None if there are no records that are recent enough
+        """
+        with self._lock:
+            saved_time, log_filename = max(((record.get('saved', 0), log_filename)
+                                            for log_filename, record in self._records.items()), default=(0, None))
+        if time.time() - saved_time > self.max_age:
+            return None
+        return log_filename
+
+    def put(self, log_filename: str, record: dict) -> None:
+        """
+        replace the record for a log.  The record is written to disk by the next save()
+
+        :param log_filename: full log filename
+        :param record: record dict, see EverquestLogFile.update_checkpoint() and checkpoint_state()
+        """
+        record['saved'] = time.time()
+        with self._lock:
+            self._records[log_filename] = record
+            self._dirty = True
+
+    def save(self, force: bool = False) -> None:
+        """
+        write the records to the checkpoint file, if anything has changed
+
+        :param force: True to write now, False to write only if interval seconds have passed since the last write
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self._dirty or (not force and now - self._last_save < self.interval):
+                return
+
+            # drop the records for logs that haven't been seen in a long time
+            oldest = time.time() - self.max_age
+            self._records = {name: record for name, record in self._records.items() if record.get('saved', 0) >= oldest}
+            data = json.dumps(self._records)
+            self._dirty = False
+            self._last_save = now
+
+        try:
+            temp_filename = self.filename + '.tmp'
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_filename, self.filename)
+        except OSError:
+            # try again next time
+            with self._lock:
+                self._dirty = True
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def fingerprint(f, length: int = HEAD_BYTES) -> tuple[int, int]:
+    """
+    utility function to checksum the first bytes of an open file, to recognize it later even if
+    the inode can't be relied on.  The file position is left wherever the read ends
+
+    :param f: file object, opened in binary mode
+    :param length: number of bytes to checksum
+    :return: tuple of (number of bytes checksummed, crc32 of those bytes)
+    """
+    f.seek(0)
+    head = f.read(length)
+    return len(head), zlib.crc32(head)
+
+
+def validate(record: dict, log_filename: str) -> str or None:
+    """
+    utility function to check that a log file is still the file that a checkpoint record was taken from,
+    and that nothing has been removed from it since
+
+    :param record: checkpoint record
+    :param log_filename: full log filename
+    :return: None if the record is good, otherwise a description of why it can't be used
+    """
+    if not all(isinstance(record.get(key), int) for key in ('offset', 'head_length', 'head_crc')) or \
+            not all(isinstance(record.get(key, 0), int) for key in ('inode', 'size')):
+        return 'incomplete checkpoint record'
+
+    try:
+        with open(log_filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            head_length, head_crc = fingerprint(f, record['head_length'])
+    except OSError as err:
+        return f'unable to read log: {err}'
+
+    # some filesystems report 0 for every inode, in which case only the checksum can tell
+    if record.get('inode') and st.st_ino and record['inode'] != st.st_ino:
+        return 'log file has been replaced'
+    if st.st_size < record['offset'] or st.st_size < record.get('size', 0):
+        return 'log file has been truncated'
+    if head_length != record['head_length'] or head_crc != record['head_crc']:
+        return 'log file has been replaced'
+    return None
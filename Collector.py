@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import socket
+import time
+
+import Console
+import EverquestLogFile
+import Forwarder
+import LogRules
+
+
+# size requested for the udp socket receive buffer, in bytes
+UDP_RECEIVE_BUFFER = 4 * 1024 * 1024
+
+
+class CharacterView:
+    """
+    class to hold what is known about one character on one DeathLoopVaccine instance
+    """
+
+    def __init__(self, instance: str, char_name: str) -> None:
+        """
+        ctor
+
+        :param instance: name of the sending instance
+        :param char_name: character name
+        """
+        self.instance = instance
+        self.char_name = char_name
+
+        # totals since the collector started
+        self.deaths = 0
+        self.lives = 0
+        self.kills = 0
+
+        # number of deaths currently in the instance's death loop window
+        self.death_count = 0
+
+        # most recent event
+        self.last_kind = None
+        self.last_epoch = None
+        self.last_line = None
+
+        # time the most recent event arrived, epoch seconds
+        self.last_seen = None
+
+    def update(self, event: dict, now: float) -> None:
+        """
+        fold one event into the view
+
+        :param event: decoded event
+        :param now: time the event arrived, epoch seconds
+        """
+        kind = event.get('k')
+        if kind in (LogRules.KIND_DEATH, LogRules.KIND_TEST_DEATH):
+            self.deaths += 1
+        elif kind == LogRules.KIND_LIFE:
+            self.lives += 1
+        elif kind == Forwarder.KIND_KILL:
+            self.kills += 1
+
+        # deaths and proofs of life carry the death count after the event, a kill the count that triggered it
+        if kind == Forwarder.KIND_KILL:
+            self.death_count = 0
+        elif 'deaths' in event:
+            self.death_count = event['deaths']
+
+        self.last_kind = kind
+        self.last_epoch = event.get('t')
+        self.last_line = event.get('l')
+        self.last_seen = now
+
+
+class Collector:
+    """
+    class to receive the events sent by any number of DeathLoopVaccine instances (see Forwarder.py), and keep
+    a per-character view of them.
+
+    Frames are accepted over tcp (length prefixed) and udp (one frame per datagram), on the same port.
+    Everything runs in a single asyncio event loop, and the work per event is a dictionary lookup and a few
+    counter updates, so the cost is dominated by json decoding of the frames, which comfortably keeps up
+    with many thousands of events per second
+    """
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        # (instance, character name) -> CharacterView
+        self.views = dict()
+
+        # statistics
+        self.frames = 0
+        self.events = 0
+        self.bad_frames = 0
+        self.connections = 0
+
+    def ingest_frame(self, frame: bytes) -> None:
+        """
+        decode a frame and fold its events into the views
+
+        :param frame: encoded frame
+        """
+        try:
+            instance, events = Forwarder.decode_frame(frame)
+        except (ValueError, KeyError, TypeError):
+            self.bad_frames += 1
+            return
+
+        self.frames += 1
+        self.ingest(instance, events)
+
+    def ingest(self, instance: str, events: list[dict]) -> None:
+        """
+        fold a batch of events from one instance into the views
+
+        :param instance: name of the sending instance
+        :param events: list of decoded events
+        """
+        now = time.time()
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            key = (instance, str(event.get('c')))
+            view = self.views.get(key)
+            if view is None:
+                view = self.views[key] = CharacterView(*key)
+            view.update(event, now)
+            self.events += 1
+
+            # kills are news, everything else waits for the next report
+            if event.get('k') == Forwarder.KIND_KILL:
+                simulated = ' (simulated)' if event.get('simulated') else ''
+                EverquestLogFile.starprint(f'Collector: [{instance}] killed eqgame.exe for [{view.char_name}] '
+                                           f'after {event.get("deaths")} deaths, pids {event.get("pids")}{simulated}')
+
+    async def handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        read length prefixed frames from one tcp connection, until it closes
+
+        :param reader: stream reader
+        :param writer: stream writer
+        """
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readexactly(Forwarder.FRAME_HEADER.size)
+                (length,) = Forwarder.FRAME_HEADER.unpack(header)
+                if length > Forwarder.MAX_FRAME_BYTES:
+                    # can't be a frame, so the stream is out of step, and there's no way to find the next frame
+                    self.bad_frames += 1
+                    break
+                self.ingest_frame(await reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def report(self, elapsed: float, events_before: int) -> None:
+        """
+        print the per-character view
+
+        :param elapsed: number of seconds since the last report
+        :param events_before: event count at the last report
+        """
+        rate = (self.events - events_before) / elapsed if elapsed > 0 else 0.0
+        EverquestLogFile.starprint(f'Collector: {len(self.views)} character(s), {self.connections} connection(s), '
+                                   f'{self.events} events ({rate:.0f}/sec), {self.frames} frames, '
+                                   f'{self.bad_frames} bad frames')
+
+        now = time.time()
+        for (instance, char_name), view in sorted(self.views.items()):
+            ago = f'{now - view.last_seen:.0f}s ago' if view.last_seen else '-'
+            EverquestLogFile.starprint(f'    {instance:20} {char_name:15} in window {view.death_count:3}  '
+                                       f'deaths {view.deaths:6}  lives {view.lives:6}  kills {view.kills:4}  '
+                                       f'last {view.last_kind or "-"} {ago}')
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """
+    class to hand each udp datagram to the collector
+    """
+
+    def __init__(self, collector: Collector) -> None:
+        """
+        ctor
+
+        :param collector: collector object
+        """
+        self.collector = collector
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.collector.ingest_frame(data)
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+async def serve(collector: Collector, host: str, port: int, report_interval: float) -> None:
+    """
+    listen for frames on the tcp and udp port, and report the view every report_interval seconds, forever
+
+    :param collector: collector object
+    :param host: address to listen on
+    :param port: tcp and udp port to listen on
+    :param report_interval: number of seconds between reports, 0 to never report
+    """
+    loop = asyncio.get_running_loop()
+    server = await asyncio.start_server(collector.handle_stream, host, port)
+    transport, _ = await loop.create_datagram_endpoint(lambda: _DatagramProtocol(collector), local_addr=(host, port))
+
+    # udp has no flow control, so give bursts from many instances somewhere to wait rather than be dropped
+    sock = transport.get_extra_info('socket')
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+    except OSError:
+        pass
+    EverquestLogFile.starprint(f'Collector listening on {host}:{port}, tcp and udp')
+
+    try:
+        async with server:
+            if report_interval <= 0:
+                await server.serve_forever()
+            last_time = time.perf_counter()
+            last_events = collector.events
+            while True:
+                await asyncio.sleep(report_interval)
+                now = time.perf_counter()
+                collector.report(now - last_time, last_events)
+                last_time = now
+                last_events = collector.events
+    finally:
+        transport.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Collect the deaths, proofs of life, and process kills '
+                                                 'forwarded by any number of DeathLoopVaccine instances')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on, e.g. 0.0.0.0 for all interfaces')
+    parser.add_argument('--port', type=int, default=9188, help='tcp and udp port to listen on')
+    parser.add_argument('--report', type=float, default=10.0, help='seconds between reports of the per-character view')
+    args = parser.parse_args()
+
+    collector = Collector()
+    try:
+        asyncio.run(serve(collector, args.host, args.port, args.report))
+    except KeyboardInterrupt:
+        pass
+    Console.console.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import atexit
+import sys
+import threading
+from collections import deque
+
+
+# verbosity levels
+QUIET = 0           # only errors
+DETECTIONS = 1      # status and detection messages, i.e. everything printed with starprint()
+ECHO = 2            # detections, plus an echo of every log line
+
+LEVELS = {
+    'quiet': QUIET,
+    'detections': DETECTIONS,
+    'echo': ECHO,
+}
+
+
+class Console(threading.Thread):
+    """
+    class to write console output from a background thread, so that a slow console can never stall log parsing.
+
+    Writers just append to a queue and return.  The writer thread takes everything that has queued up,
+    and writes it to the console in a single write() call.  The queue is bounded for echoed log lines,
+    which are dropped (and counted) if the console falls too far behind.  Status and detection messages
+    are rare, and are never dropped.
+    """
+
+    def __init__(self, verbosity: int = ECHO, queue_size: int = 10000, stream=None) -> None:
+        """
+        ctor
+
+        :param verbosity: one of QUIET, DETECTIONS, ECHO
+        :param queue_size: maximum number of queued lines, before echoed log lines are dropped
+        :param stream: file object to write to, if None then whatever sys.stdout is at the time of writing
+        """
+        super().__init__(daemon=True)
+        self.verbosity = verbosity
+        self.queue_size = queue_size
+        self.stream = stream
+
+        self._queue = deque()
+        self._dropped = 0
+        self._writing = False
+        self._condition = threading.Condition()
+        self._start_lock = threading.Lock()
+
+    def configure(self, verbosity: int = None, queue_size: int = None, stream=None) -> None:
+        """
+        change the output settings
+
+        :param verbosity: one of QUIET, DETECTIONS, ECHO, or None to leave unchanged
+        :param queue_size: maximum number of queued lines, or None to leave unchanged
+        :param stream: file object to write to, or None to leave unchanged
+        """
+        if verbosity is not None:
+            self.verbosity = verbosity
+        if queue_size is not None:
+            self.queue_size = queue_size
+        if stream is not None:
+            self.stream = stream
+
+    def write(self, text: str, level: int = DETECTIONS) -> None:
+        """
+        queue a line of output.  Never blocks on the console
+
+        :param text: line to be written, without a trailing newline
+        :param level: verbosity level at which this line is to be shown
+        """
+        if level > self.verbosity:
+            return
+
+        if not self._started.is_set():
+            self._start()
+
+        with self._condition:
+            if level == ECHO and len(self._queue) >= self.queue_size:
+                self._dropped += 1
+                return
+            self._queue.append(text)
+            self._condition.notify()
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """
+        wait for everything queued so far to be written out
+
+        :param timeout: maximum number of seconds to wait
+        """
+        if not self._started.is_set():
+            return
+        with self._condition:
+            self._condition.wait_for(lambda: not self._queue and not self._writing, timeout)
+
+    def _start(self) -> None:
+        """
+        start the writer thread, the first time anything is written
+        """
+        with self._start_lock:
+            if not self._started.is_set():
+                self.start()
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        while True:
+
+            # take everything that has queued up
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue)
+                batch = self._queue
+                self._queue = deque()
+                dropped = self._dropped
+                self._dropped = 0
+                self._writing = True
+
+            if dropped:
+                batch.append(f'** Console: {dropped} log line(s) not echoed, the console could not keep up **')
+
+            stream = self.stream or sys.stdout
+            try:
+                stream.write('\n'.join(batch) + '\n')
+                stream.flush()
+            except (OSError, ValueError):
+                # nowhere to write to, e.g. the console has been closed
+                pass
+
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+# the one and only console
+console = Console()
+atexit.register(console.flush)
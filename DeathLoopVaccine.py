@@ -1,12 +1,36 @@
-import re
-import os
-import signal
-import configparser
-from datetime import datetime
+import time
+
+# when this program started, for the startup report (see Supervisor).  Taken before the rest of the imports,
+# so that the time spent importing them counts
+STARTUP_TIME = time.perf_counter()
 
-import psutil
+import configparser
+import functools
+from collections import deque
+from typing import TYPE_CHECKING
 
+import Checkpoint
+import Console
+import EventHistory
 import EverquestLogFile
+import EverquestMultiLogFile
+import Forwarder
+import KillExecutor
+import LogEvents
+import LogRules
+import ProcessTracker
+import Profiler
+import Supervisor
+import TimeIndex
+
+# psutil is imported where it's used, to keep it off the startup path, see main().  This is only for the type hints
+if TYPE_CHECKING:
+    import psutil
+
+
+# default death loop definition, i.e. DEATHS deaths in SECONDS seconds
+DEATHLOOP_DEATHS = 4
+DEATHLOOP_SECONDS = 120
 
 
 #
@@ -38,206 +62,417 @@ class DeathLoopVaccine(EverquestLogFile.EverquestLogFile):
     the class derives from the EverquestLogFile class and relies on the base class
     for the log parsing functions.
 
-    the class overloads the process_line() method to customize the parsing for this particular need
+    the class overloads the process_line() method to feed each line through an event pipeline, which
+    parses the line once, and hands the result to every registered detector.  The death loop detector
+    is always registered, along with an alert detector if there are any alert rules
     """
 
-    def __init__(self) -> None:
+    def __init__(self, config: configparser.ConfigParser = None,
+                 process_tracker: ProcessTracker.ProcessTracker = None,
+                 checkpoint: Checkpoint.CheckpointStore = None,
+                 forwarder: Forwarder.Forwarder = None) -> None:
         """
         ctor
+
+        :param config: parsed ini file contents.  If None, the ini file is read by load_config()
+        :param process_tracker: background tracker of the running eqgame.exe processes.  If None, the
+        processes are looked up at the moment a death loop is detected
+        :param checkpoint: store for the read position and detector state, so a restart can resume where
+        this parser left off.  If None, parsing always begins at the end of the log
+        :param forwarder: sender of the detected events to a central collector, or None
         """
 
         # begin by reading in the config data
-        config = configparser.ConfigParser()
-        ini_filename = 'DeathLoopVaccine.ini'
-        file_list = config.read(ini_filename)
-        if len(file_list) == 0:
-            raise ValueError(f'Unable to open ini file [{ini_filename}]')
+        if config is None:
+            config = load_config()
 
         base_dir = config.get('Everquest', 'BASE_DIRECTORY', fallback='c:\\Everquest')
         logs_dir = config.get('Everquest', 'LOGS_DIRECTORY', fallback='\\logs\\')
         server_name = config.get('Everquest', 'SERVER_NAME', fallback='P1999Green')
         heartbeat = config.getint('Everquest', 'HEARTBEAT', fallback=15)
-        self.deathloop_deaths = config.getint('DeathLoop', 'DEATHS', fallback=4)
-        self.deathloop_seconds = config.getint('DeathLoop', 'SECONDS', fallback=120)
+        poll_interval = config.getfloat('Everquest', 'POLL_INTERVAL', fallback=EverquestLogFile.POLL_INTERVAL)
+        watch_backend = config.get('Everquest', 'WATCH_BACKEND', fallback='auto')
+        deathloop_deaths = config.getint('DeathLoop', 'DEATHS', fallback=DEATHLOOP_DEATHS)
+        deathloop_seconds = config.getint('DeathLoop', 'SECONDS', fallback=DEATHLOOP_SECONDS)
+        kill_executor = KillExecutor.KillExecutor(
+            config.getfloat('DeathLoop', 'TERMINATE_DEADLINE', fallback=KillExecutor.TERMINATE_DEADLINE),
+            config.getfloat('DeathLoop', 'KILL_DEADLINE', fallback=KillExecutor.KILL_DEADLINE))
 
         # parent ctor
-        super().__init__(base_dir, logs_dir, server_name, heartbeat)
+        super().__init__(base_dir, logs_dir, server_name, heartbeat,
+                         poll_interval=poll_interval, watch_backend=watch_backend, checkpoint=checkpoint)
+
+        # every line is parsed once, against the rules for all kinds of event, and passed to each detector
+        self.pipeline = LogEvents.EventPipeline(self, LogRules.load_rules(config),
+                                                config.getint('DeathLoop', 'HISTORY_SIZE', fallback=EventHistory.HISTORY_SIZE))
+        self.deathloop = DeathLoopDetector(self, deathloop_deaths, deathloop_seconds, process_tracker, forwarder,
+                                           kill_executor)
+        self.pipeline.register(self.deathloop)
+        if config.has_section(LogRules.RULE_SECTIONS[LogRules.KIND_ALERT]):
+            self.pipeline.register(LogEvents.AlertDetector(self, config.getint('DeathLoop', 'ALERT_REPEAT', fallback=10)))
+
+        # when starting at the end of a log, look back over the last deathloop_seconds to rebuild the death list
+        if config.getboolean('DeathLoop', 'PRIME', fallback=True):
+            self.prime_seconds = deathloop_seconds
+
+        # start with the last known log from the checkpoint, and scan the logs directory once parsing is under way
+        self.fast_start = config.getboolean('Everquest', 'FAST_START', fallback=True)
+
+        # index of times to byte offsets for the open log, kept up to date in the background, see TimeIndex
+        self.time_index = None
+        self.time_index_enabled = config.getboolean('TimeIndex', 'ENABLED', fallback=True)
+        self.time_index_dir = config.get('TimeIndex', 'DIRECTORY', fallback='timeindex')
+
+    def checkpoint_state(self) -> dict:
+        """
+        the state of every detector is carried over a restart
+
+        :return: json serializable dict of parser state
+        """
+        return self.pipeline.checkpoint_state()
+
+    def restore_state(self, state: dict) -> None:
+        """
+        restore the state saved by checkpoint_state()
+
+        :param state: dict of parser state from the checkpoint
+        """
+        self.pipeline.restore_state(state)
+
+    def open(self, charname: str, filename: str, seek_end=True, offset: int = None, resume=False) -> bool:
+        """
+        open the file, and its time index.  See EverquestLogFile.open()
+
+        :param charname: character name whose log file is to be opened
+        :param filename: full log filename
+        :param seek_end:  True if parsing is to begin at the end of the file, False if at the beginning
+        :param offset: if not None, byte offset where parsing is to begin, overrides seek_end
+        :param resume: True to begin parsing from the checkpoint for the file if there is a usable one
+        :return: True if a new file was opened, False otherwise
+        """
+        rv = super().open(charname, filename, seek_end, offset, resume)
+        if rv and self.time_index_enabled:
+            try:
+                self.time_index = TimeIndex.open_index(filename, self.time_index_dir)
+            except OSError as err:
+                EverquestLogFile.starprint(f'Unable to create time index directory [{self.time_index_dir}]: {err}', Console.QUIET)
+                self.time_index_enabled = False
+            else:
+                # whatever part of the log isn't indexed yet (maybe years of it) is indexed in the background
+                self.time_index.catch_up(self.offset)
+        return rv
+
+    def process_batch(self, lines: list[str], now: float) -> None:
+        """
+        process a batch of lines, and index them once a whole block of the log has been read
+
+        :param lines: list of lines from the logfile
+        :param now: current time, epoch seconds
+        """
+        super().process_batch(lines, now)
+        if self.time_index:
+            self.time_index.catch_up(self.offset)
 
-        # list of death messages
+    def prime(self, since: float) -> None:
+        """
+        rebuild the death list and last activity time from the recent tail of the log, and report what was found
+
+        :param since: epoch seconds
+        """
+        super().prime(since)
+
+        last_activity = self.deathloop.last_activity()
+        if last_activity is not None:
+            activity = f'last player activity {time.time() - last_activity:.0f} seconds ago'
+        else:
+            activity = f'no player activity in the last {self.prime_seconds} seconds'
+        EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self.deathloop.death_list)} '
+                                   f'for [{self.char_name}], {activity}')
+
+    def line_filter(self) -> tuple[bytes] or None:
+        """
+        only the lines that could match one of the rules are of any interest, so the rest needn't even be decoded.
+        That is, unless the lines are being echoed to the console, in which case every line is needed
+
+        :return: needles for the literal prefixes of the rules, or None for every line
+        """
+        if Console.console.verbosity >= Console.ECHO and not self.catching_up:
+            return None
+
+        # the rules can refer to the character name, so rebuild them whenever the character changes
+        rules = self.pipeline.rules
+        if rules.char_name != self.char_name:
+            rules.bind(self.char_name)
+        if rules.prefixes is None:
+            return None
+        return EverquestLogFile.line_needles(rules.prefixes)
+
+    def process_line(self, line: str) -> None:
+        """
+        This method gets called by the base class parsing thread once for each parsed line.
+        We overload it here to perform our special case parsing tasks.
+
+        :param line: string with a single line from the logfile
+        """
+        # start with base class behavior, i.e. print the line to screen
+        # then parse the line, and let every detector have a look at it
+        super().process_line(line)
+        self.pipeline.process_line(line)
+
+
+class DeathLoopDetector(LogEvents.Detector):
+    """
+    detector for the death loop, i.e. deathloop_deaths deaths in deathloop_seconds, with no proof of life
+    in the interim, and the response to it, i.e. killing the eqgame.exe processes
+    """
+
+    name = 'deathloop'
+
+    def __init__(self, parser: EverquestLogFile.EverquestLogFile, deathloop_deaths: int = DEATHLOOP_DEATHS,
+                 deathloop_seconds: int = DEATHLOOP_SECONDS, process_tracker: ProcessTracker.ProcessTracker = None,
+                 forwarder: Forwarder.Forwarder = None, kill_executor: KillExecutor.KillExecutor = None) -> None:
+        """
+        ctor
+
+        :param parser: the parser feeding this detector
+        :param deathloop_deaths: number of deaths that define a death loop
+        :param deathloop_seconds: number of seconds that define a death loop
+        :param process_tracker: background tracker of the running eqgame.exe processes.  If None, the
+        processes are looked up at the moment a death loop is detected
+        :param forwarder: sender of the deaths, proofs of life, and kills to a central collector, or None
+        :param kill_executor: killer of the eqgame.exe processes.  If None, one with the default deadlines
+        """
+        super().__init__(parser)
+        self.deathloop_deaths = deathloop_deaths
+        self.deathloop_seconds = deathloop_seconds
+        self.process_tracker = process_tracker
+        self.forwarder = forwarder
+        self.kill_executor = kill_executor if kill_executor is not None else KillExecutor.KillExecutor()
+
+        # list of death messages, as (epoch seconds, line) tuples
         # this will function as a scrolling queue, with the oldest message at position 0,
-        # newest appended to the other end.  Older messages scroll off the list when more
+        # newest appended to the other end.  Older messages scroll off the left end when more
         # than deathloop_seconds have elapsed.  The list is also flushed any time
         # player activity is detected (i.e. player is not AFK).
         #
         # if/when the length of this list meets or exceeds deathloop_deaths, then
         # the deathloop response is triggered
-        self._death_list = list()
+        self.death_list = deque()
 
         # flag indicating whether the "process killer" gun is armed
-        self._kill_armed = True
+        self.kill_armed = True
+
+    def last_activity(self) -> int or None:
+        """
+        the pipeline's event history remembers the proofs of life, so there's no need to keep track here
+
+        :return: time of the most recent proof of life, epoch seconds, or None if there hasn't been any
+        """
+        return self.history.last_before(LogRules.KIND_LIFE) if self.history else None
 
     def reset(self) -> None:
         """
         Utility function to clear the death_list and reset the armed flag
         """
-        self._death_list.clear()
-        self._kill_armed = True
+        self.death_list.clear()
+        self.kill_armed = True
 
-    def process_line(self, line: str) -> None:
+    def checkpoint_state(self) -> dict:
         """
-        This method gets called by the base class parsing thread once for each parsed line.
-        We overload it here to perform our special case parsing tasks.
+        the death list, armed flag, and last activity time are carried over a restart
 
-        :param line: string with a single line from the logfile
+        :return: json serializable dict of detector state
         """
-        # start with base class behavior, i.e. print the line to screen
-        # check for death messages
-        # check for indications the player is really not AFK
-        # are we death looping?  if so, kill the process
-        super().process_line(line)
-        self.check_for_death(line)
-        self.check_not_afk(line)
+        return {
+            'deaths': list(self.death_list),
+            'kill_armed': self.kill_armed,
+            'last_activity': self.last_activity(),
+        }
+
+    def restore_state(self, state: dict) -> None:
+        """
+        restore the state saved by checkpoint_state()
+
+        :param state: dict of detector state from the checkpoint
+        """
+        self.death_list = deque((epoch, line) for epoch, line in state.get('deaths', list()))
+        self.kill_armed = state.get('kill_armed', True)
+
+        # put the last proof of life back into the history, unless the history already has a newer one
+        last_activity = state.get('last_activity')
+        if last_activity is not None and self.history is not None and self.last_activity() is None:
+            self.history.record(LogRules.KIND_LIFE, last_activity)
+
+    def process_event(self, event: LogEvents.LogEvent) -> None:
+        """
+        check for death messages
+        check for indications the player is really not AFK
+        are we death looping?  if so, kill the process
+
+        :param event: the parsed line
+        """
+        self.check_for_death(event)
+        self.check_not_afk(event)
         self.deathloop_response()
 
-    def check_for_death(self, line: str) -> None:
+    def check_for_death(self, event: LogEvents.LogEvent) -> None:
         """
         check for indications the player just died, and if we find it,
         save the message for later processing
 
-        :param line: string with a single line from the logfile
+        :param event: the parsed line
         """
-
-        # cut off the leading date-time stamp info
-        trunc_line = line[27:]
+        # purge any death messages that are too old first, so that a new death is never counted against an
+        # expired one.  This has to happen before the new death is added, because lines that can't match any rule
+        # may never reach the detector at all (see DeathLoopVaccine.line_filter()), so the purge that would have
+        # emptied the list, and re-armed the kill-gun, may be happening on the death line itself
+        self.purge_deaths(event)
 
         # does this line contain a death message
-        slain_regexp = r'^You have been slain'
-        m = re.match(slain_regexp, trunc_line)
-        if m:
+        if event.kind == LogRules.KIND_DEATH:
             # add this message to the list of death messages
-            self._death_list.append(line)
-            EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self._death_list)}')
+            self.death_list.append((event.epoch, event.line))
+            EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self.death_list)}')
+            self.forward_event(event)
 
         # a way to test - send a tell to death_loop
-        slain_regexp = r'^death_loop'
-        m = re.match(slain_regexp, trunc_line)
-        if m:
+        elif event.kind == LogRules.KIND_TEST_DEATH:
             # add this message to the list of death messages
             # since this is just for testing, disarm the kill-gun
-            self._death_list.append(line)
-            EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self._death_list)}')
-            self._kill_armed = False
+            self.death_list.append((event.epoch, event.line))
+            EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self.death_list)}')
+            self.kill_armed = False
+            self.forward_event(event)
 
+    def purge_deaths(self, event: LogEvents.LogEvent) -> None:
+        """
+        scroll any death messages older than deathloop_seconds off the death list
+
+        :param event: the parsed line, for the current time
+        """
         # only do the list-purging if there are already some death messages in the list, else skip this
-        if len(self._death_list) > 0:
+        if len(self.death_list) > 0:
 
-            # create a datetime object for this line, using the very capable datetime.strptime()
-            now = datetime.strptime(line[0:26], '[%a %b %d %H:%M:%S %Y]')
+            # the time of this line, skip the purge if it doesn't have a timestamp
+            now = event.epoch
+            if now is None:
+                return
 
             # now purge any death messages that are too old
-            done = False
-            while not done:
-                # if the list is empty, we're done
-                if len(self._death_list) == 0:
-                    self.reset()
-                    done = True
-                # if the list is not empty, check if we need to purge some old entries
+            # (a death message with no timestamp of its own is treated as already expired)
+            while len(self.death_list) > 0:
+                oldest_time = self.death_list[0][0]
+                if oldest_time is None or now - oldest_time > self.deathloop_seconds:
+                    # that death message is too old, purge it
+                    self.death_list.popleft()
+                    EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self.death_list)}')
                 else:
-                    oldest_line = self._death_list[0]
-                    oldest_time = datetime.strptime(oldest_line[0:26], '[%a %b %d %H:%M:%S %Y]')
-                    elapsed_seconds = now - oldest_time
+                    # the oldest death message is inside the window, so we're done purging
+                    break
 
-                    if elapsed_seconds.total_seconds() > self.deathloop_seconds:
-                        # that death message is too old, purge it
-                        self._death_list.pop(0)
-                        EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self._death_list)}')
-                    else:
-                        # the oldest death message is inside the window, so we're done purging
-                        done = True
+            # if the list has emptied out, re-arm
+            if len(self.death_list) == 0:
+                self.reset()
 
-    def check_not_afk(self, line: str) -> None:
+    def check_not_afk(self, event: LogEvents.LogEvent) -> None:
         """
         check for "proof of life" indications the player is really not AFK
 
-        :param line: string with a single line from the logfile
+        :param event: the parsed line
         """
-
-        # only do the proof of life checks if there are already some death messages in the list, else skip this
-        if len(self._death_list) > 0:
-
-            # check for proof of life, things that indicate the player is not actually AFK
-            # begin by assuming the player is AFK
-            afk = True
-
-            # cut off the leading date-time stamp info
-            trunc_line = line[27:]
-
-            # does this line contain a proof of life - casting
-            regexp = r'^You begin casting'
-            m = re.match(regexp, trunc_line)
-            if m:
-                # player is not AFK
-                afk = False
-                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK: {line}')
-
-            # does this line contain a proof of life - communication
-            # this captures tells, say, group, auction, and shout channels
-            regexp = f'^(You told|You say|You tell|You auction|You shout|{self.char_name} ->)'
-            m = re.match(regexp, trunc_line)
-            if m:
-                # player is not AFK
-                afk = False
-                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK: {line}')
-
-            # does this line contain a proof of life - melee
-            regexp = r'^You( try to)? (hit|slash|pierce|crush|claw|bite|sting|maul|gore|punch|kick|backstab|bash)'
-            m = re.match(regexp, trunc_line)
-            if m:
-                # player is not AFK
-                afk = False
-                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK: {line}')
-
-            # if they are not AFK, then go ahead and purge any death messages from the list
-            if not afk:
+        # check for proof of life (casting, communication, melee, or any other configured rule),
+        # things that indicate the player is not actually AFK
+        # if they are not AFK, then go ahead and purge any death messages from the list
+        if event.kind == LogRules.KIND_LIFE:
+            if len(self.death_list) > 0:
+                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK ({event.rule.name}): {event.line}')
                 self.reset()
+                self.forward_event(event)
 
     def deathloop_response(self) -> None:
         """
         are we death looping?  if so, kill the process
         """
-
         # if the death_list contains more deaths than the limit, then trigger the process kill
-        if len(self._death_list) >= self.deathloop_deaths:
+        if len(self.death_list) >= self.deathloop_deaths:
+
+            # primed deaths are only there to rebuild the death list.  Whatever they added up to has already been
+            # dealt with (or not) before this program started, and the game may well have been restarted since,
+            # so only a new death can trigger a kill
+            if self.parser.priming:
+                if len(self.death_list) == self.deathloop_deaths:
+                    EverquestLogFile.starprint(f'DeathLoopVaccine:  {len(self.death_list)} recent deaths for '
+                                               f'[{self.parser.char_name}] found while priming, not acted on.  '
+                                               f'A new death within {self.deathloop_seconds} seconds will trigger the kill')
+                return
+
+            # when catching up after a restart, the deaths may be long over.  If the whole death window has
+            # passed by the clock on the wall, then whatever happened, the game is not death looping right now
+            if self.parser.catching_up:
+                newest_time = self.death_list[-1][0]
+                if newest_time is None or time.time() - newest_time > self.deathloop_seconds:
+                    EverquestLogFile.starprint(f'DeathLoopVaccine:  {len(self.death_list)} deaths for [{self.parser.char_name}] '
+                                               f'found while catching up, but they are too old to act on')
+                    self.reset()
+                    return
+
+            # start the clock on the detection-to-kill latency
+            detect_time = time.perf_counter()
 
             EverquestLogFile.starprint('---------------------------------------------------')
             EverquestLogFile.starprint('DeathLoopVaccine - Killing all eqgame.exe processes')
             EverquestLogFile.starprint('---------------------------------------------------')
-            EverquestLogFile.starprint('DeathLoopVaccine has detected deathloop symptoms:')
+            EverquestLogFile.starprint(f'DeathLoopVaccine has detected deathloop symptoms for [{self.parser.char_name}]:')
             EverquestLogFile.starprint(f'    {self.deathloop_deaths} deaths in less than '
                                        f'{self.deathloop_seconds} seconds, with no player activity')
 
             # show all the death messages
             EverquestLogFile.starprint('Death Messages:')
-            for line in self._death_list:
+            for _, line in self.death_list:
                 EverquestLogFile.starprint('    ' + line)
 
-            # get the list of eqgame.exe process ID's, and show them
-            pid_list = get_eqgame_pid_list()
+            # get the list of eqgame.exe processes, and show them
+            # the background tracker already knows them, so only fall back to a full process scan
+            # if it has none (e.g. the game was started less than one tracker refresh ago)
+            processes = self.process_tracker.processes() if self.process_tracker else list()
+            if len(processes) == 0:
+                processes = get_eqgame_process_list()
+            pid_list = [p.pid for p in processes]
             EverquestLogFile.starprint(f'eqgame.exe process id list = {pid_list}')
 
             # kill the eqgame.exe process / processes
-            for pid in pid_list:
-                EverquestLogFile.starprint(f'Killing process [{pid}]')
-
-                # for testing the actual kill process using simulated player deaths, uncomment the following line
-                # self._kill_armed = True
-                if self._kill_armed:
-                    os.kill(pid, signal.SIGTERM)
-                else:
+            # for testing the actual kill process using simulated player deaths, uncomment the following line
+            # self.kill_armed = True
+            if self.kill_armed:
+                # all of them at once, and then make sure they are gone (see KillExecutor), without holding up the parser
+                if processes:
+                    self.kill_executor.kill(processes, detect_time)
+            else:
+                for pid in pid_list:
+                    latency_ms = (time.perf_counter() - detect_time) * 1000.0
                     EverquestLogFile.starprint('(Note: Process Kill only simulated, since death(s) were simulated)')
+                    EverquestLogFile.starprint(f'Simulated SIGTERM to [{pid}], {latency_ms:.2f} msec after detection')
+
+            # let the collector know
+            if self.forwarder:
+                self.forwarder.forward(self.parser.char_name, Forwarder.KIND_KILL, int(time.time()),
+                                       deaths=len(self.death_list), pids=pid_list, simulated=not self.kill_armed)
 
             # purge any death messages from the list
+            # and checkpoint right away, so that a restart doesn't catch up on these same deaths and kill again
             self.reset()
+            self.parser.request_checkpoint()
+
+    def forward_event(self, event: LogEvents.LogEvent) -> None:
+        """
+        send a detected event to the collector, if there is one.
+        Lines being caught up on (or primed from) may well have been sent before the restart, so they aren't sent again
+
+        :param event: the parsed line
+        """
+        if self.forwarder and not self.parser.catching_up:
+            self.forwarder.forward(self.parser.char_name, event.kind, event.epoch, event.rule.name, event.line,
+                                   deaths=len(self.death_list))
 
 
 #################################################################################################
@@ -245,6 +480,45 @@ class DeathLoopVaccine(EverquestLogFile.EverquestLogFile):
 # standalone functions
 #
 
+def load_config(ini_filename: str = 'DeathLoopVaccine.ini') -> configparser.ConfigParser:
+    """
+    read the ini file
+
+    :param ini_filename: ini filename
+    :return: ConfigParser object with the ini file contents
+    """
+    config = configparser.ConfigParser()
+    file_list = config.read(ini_filename)
+    if len(file_list) == 0:
+        raise ValueError(f'Unable to open ini file [{ini_filename}]')
+    return config
+
+
+def multi_log_factory(config: configparser.ConfigParser,
+                      process_tracker: ProcessTracker.ProcessTracker = None,
+                      checkpoint: Checkpoint.CheckpointStore = None,
+                      forwarder: Forwarder.Forwarder = None) -> EverquestMultiLogFile.EverquestMultiLogFile:
+    """
+    create a parser that follows every active character log on the server, each with its own
+    DeathLoopVaccine detector state
+
+    :param config: parsed ini file contents
+    :param process_tracker: background tracker of the running eqgame.exe processes, shared by all characters
+    :param checkpoint: store for the read position and death list of every character log
+    :param forwarder: sender of the detected events of every character to a central collector, or None
+    :return: multi log parser object
+    """
+    return EverquestMultiLogFile.EverquestMultiLogFile(
+        functools.partial(DeathLoopVaccine, config, process_tracker, checkpoint, forwarder),
+        config.get('Everquest', 'BASE_DIRECTORY', fallback='c:\\Everquest'),
+        config.get('Everquest', 'LOGS_DIRECTORY', fallback='\\logs\\'),
+        config.get('Everquest', 'SERVER_NAME', fallback='P1999Green'),
+        config.getint('Everquest', 'HEARTBEAT', fallback=15),
+        config.getint('Everquest', 'STALE_SECONDS', fallback=900),
+        poll_interval=config.getfloat('Everquest', 'POLL_INTERVAL', fallback=EverquestLogFile.POLL_INTERVAL),
+        watch_backend=config.get('Everquest', 'WATCH_BACKEND', fallback='auto'))
+
+
 def get_eqgame_pid_list() -> list[int]:
     """
     get list of process ID's for eqgame.exe, using psutil module
@@ -252,12 +526,22 @@ def get_eqgame_pid_list() -> list[int]:
 
     :return: list of process ID integers
     """
+    return [p.pid for p in get_eqgame_process_list()]
+
+
+def get_eqgame_process_list() -> list['psutil.Process']:
+    """
+    get list of the eqgame.exe processes, using psutil module
+
+    :return: list of psutil.Process objects
+    """
+    import psutil
 
-    pid_list = list()
+    process_list = list()
     for p in psutil.process_iter(['name']):
         if p.info['name'] == 'eqgame.exe':
-            pid_list.append(p.pid)
-    return pid_list
+            process_list.append(p)
+    return process_list
 
 
 #################################################################################################
@@ -272,18 +556,94 @@ def main():
     EverquestLogFile.starprint('-------------------------------------------------')
     EverquestLogFile.starprint('')
 
-    # create and start the DLV parser
-    dlv = DeathLoopVaccine()
-    dlv.go()
+    # create and start the DLV parser, under the watchful eye of a supervisor which will
+    # restart it if it dies, and shut it down cleanly on ctrl-c
+    config = load_config()
+
+    # console output level, and how far the console may fall behind before echoed lines are dropped
+    verbosity = config.get('Console', 'VERBOSITY', fallback='echo').lower()
+    if verbosity not in Console.LEVELS:
+        raise ValueError(f'Unknown console VERBOSITY [{verbosity}], expected one of {list(Console.LEVELS)}')
+    Console.console.configure(verbosity=Console.LEVELS[verbosity],
+                              queue_size=config.getint('Console', 'QUEUE_SIZE', fallback=10000))
+
+    # keep track of the running eqgame.exe processes in the background, so they are known before they're needed.
+    # the tracker thread is also what imports psutil, so that slow import happens while the parser starts up
+    process_tracker = ProcessTracker.ProcessTracker(
+        refresh_interval=config.getfloat('DeathLoop', 'PROCESS_REFRESH', fallback=2.0))
+    process_tracker.start()
+
+    # remember where parsing left off, so that a restart can catch up on anything written in the meantime
+    checkpoint = None
+    checkpoint_file = config.get('Checkpoint', 'FILE', fallback='DeathLoopVaccine.checkpoint')
+    if checkpoint_file:
+        checkpoint = Checkpoint.CheckpointStore(checkpoint_file,
+                                                interval=config.getfloat('Checkpoint', 'INTERVAL', fallback=5.0),
+                                                max_age=config.getfloat('Checkpoint', 'MAX_AGE', fallback=3600.0))
+
+    # optionally send the deaths, proofs of life, and kills to a central collector, see Collector.py
+    forwarder = None
+    if config.getboolean('Forwarder', 'ENABLED', fallback=False):
+        forwarder = Forwarder.Forwarder(config.get('Forwarder', 'HOST', fallback='127.0.0.1'),
+                                        config.getint('Forwarder', 'PORT', fallback=9188),
+                                        protocol=config.get('Forwarder', 'PROTOCOL', fallback=Forwarder.PROTOCOL_TCP),
+                                        instance=config.get('Forwarder', 'INSTANCE', fallback='') or None,
+                                        queue_size=config.getint('Forwarder', 'QUEUE_SIZE', fallback=10000),
+                                        batch_size=config.getint('Forwarder', 'BATCH_SIZE', fallback=200),
+                                        flush_interval=config.getfloat('Forwarder', 'FLUSH_INTERVAL', fallback=0.5))
+        forwarder.start()
+        EverquestLogFile.starprint(f'Forwarding events to {forwarder.protocol}://{forwarder.host}:{forwarder.port} '
+                                   f'as [{forwarder.instance}]')
+
+    if config.getboolean('Everquest', 'MULTI_LOG', fallback=False):
+        factory = functools.partial(multi_log_factory, config, process_tracker, checkpoint, forwarder)
+    else:
+        factory = functools.partial(DeathLoopVaccine, config, process_tracker, checkpoint, forwarder)
+
+    # optional statistics on the parser, served over http to the local machine only
+    # when turned off, the parser isn't touched at all
+    if config.getboolean('Metrics', 'ENABLED', fallback=False):
+        # imported here, since the http server takes a while to import, and most of the time it isn't wanted
+        import Metrics
+        metrics = Metrics.Metrics()
+        factory = metrics.instrument_factory(factory)
+        port = config.getint('Metrics', 'PORT', fallback=9187)
+        try:
+            Metrics.MetricsServer(metrics, port).start()
+            EverquestLogFile.starprint(f'Serving metrics at http://127.0.0.1:{port}/metrics')
+        except OSError as err:
+            EverquestLogFile.starprint(f'Unable to serve metrics on port {port}: {err}', Console.QUIET)
+
+    # profiling of the parser, for a few seconds at a time, on a signal (or right away if enabled in the ini file).
+    # until a profiling session is started, the parser isn't touched at all
+    profiler = Profiler.Profiler(config.get('Profiling', 'DIRECTORY', fallback='profiles'),
+                                 config.getfloat('Profiling', 'SECONDS', fallback=Profiler.PROFILE_SECONDS),
+                                 config.get('Profiling', 'MODE', fallback=Profiler.MODE_SAMPLE))
+    factory = profiler.instrument_factory(factory)
+    profiler.install_signal_handler()
+
+    supervisor = Supervisor.Supervisor(factory,
+                                       restart_delay=config.getfloat('Supervisor', 'RESTART_DELAY', fallback=5.0),
+                                       cpu_report_interval=config.getfloat('Supervisor', 'CPU_REPORT', fallback=300.0),
+                                       start_time=STARTUP_TIME)
+    supervisor.install_signal_handlers()
+    supervisor.start()
+    if config.getboolean('Profiling', 'ENABLED', fallback=False):
+        profiler.start()
 
     EverquestLogFile.starprint(f'Checking for '
-                               f'{dlv.deathloop_deaths} deaths in '
-                               f'{dlv.deathloop_seconds} seconds, '
+                               f'{config.getint("DeathLoop", "DEATHS", fallback=DEATHLOOP_DEATHS)} deaths in '
+                               f'{config.getint("DeathLoop", "SECONDS", fallback=DEATHLOOP_SECONDS)} seconds, '
                                f'with no player activity in the interim (AFK)')
 
+    # block here until ctrl-c or a termination signal
     # note that as soon as the main thread ends, so will the child threads
-    while True:
-        pass
+    supervisor.run()
+    if checkpoint:
+        checkpoint.save(force=True)
+    if forwarder:
+        forwarder.stop()
+    Console.console.flush()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,227 @@
+import bisect
+from array import array
+
+
+# default number of events of each kind that are remembered
+HISTORY_SIZE = 4096
+
+
+class TimeRing:
+    """
+    class to hold the times of the most recent capacity events, in a fixed size ring of 64 bit integers.
+
+    The times are kept in non-decreasing order, so that they can be searched with a binary search.
+    Log timestamps are local time, and so can step backwards (e.g. when daylight saving time ends), in which
+    case the earlier time is stored as a repeat of the latest one
+    """
+
+    def __init__(self, capacity: int = HISTORY_SIZE) -> None:
+        """
+        ctor
+
+        :param capacity: maximum number of event times held, after which the oldest is overwritten
+        """
+        if capacity < 1:
+            raise ValueError(f'TimeRing capacity must be at least 1, not {capacity}')
+        self.capacity = capacity
+        self._epochs = array('q', bytes(8 * capacity))
+
+        # physical index of the oldest time, the number of times held, and the newest time
+        self._start = 0
+        self._len = 0
+        self._last = None
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, index: int) -> int:
+        """
+        :param index: logical index, 0 is the oldest time, -1 the newest
+        :return: epoch seconds
+        """
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('TimeRing index out of range')
+        return self._epochs[(self._start + index) % self.capacity]
+
+    def append(self, epoch: int) -> None:
+        """
+        add a time, overwriting the oldest one if the ring is full
+
+        :param epoch: epoch seconds
+        """
+        if self._last is not None and epoch < self._last:
+            epoch = self._last
+        self._last = epoch
+
+        if self._len < self.capacity:
+            index = self._start + self._len
+            self._epochs[index - self.capacity if index >= self.capacity else index] = epoch
+            self._len += 1
+        else:
+            self._epochs[self._start] = epoch
+            self._start += 1
+            if self._start == self.capacity:
+                self._start = 0
+
+    def clear(self) -> None:
+        """
+        forget all the times
+        """
+        self._start = 0
+        self._len = 0
+        self._last = None
+
+    def bisect_left(self, epoch: int) -> int:
+        """
+        :param epoch: epoch seconds
+        :return: logical index of the first time at or after epoch, len() if there isn't one
+        """
+        return self._bisect(bisect.bisect_left, epoch, False)
+
+    def bisect_right(self, epoch: int) -> int:
+        """
+        :param epoch: epoch seconds
+        :return: logical index of the first time after epoch, len() if there isn't one
+        """
+        return self._bisect(bisect.bisect_right, epoch, True)
+
+    def _bisect(self, search, epoch: int, right: bool) -> int:
+        """
+        binary search of the ring, which is (at most) two sorted runs of the underlying array: the oldest
+        times run from the start to the end of the array, and the newest wrap around to its beginning
+
+        :param search: bisect.bisect_left or bisect.bisect_right
+        :param epoch: epoch seconds
+        :param right: True for bisect_right
+        :return: logical index
+        """
+        end = self._start + self._len
+        if end <= self.capacity:
+            return search(self._epochs, epoch, self._start, end) - self._start
+
+        # the answer lies in the wrapped run if its first time comes before epoch (or at it, for bisect_right)
+        wrapped_end = end - self.capacity
+        first = self._epochs[0]
+        if first < epoch or (right and first == epoch):
+            return (self.capacity - self._start) + search(self._epochs, epoch, 0, wrapped_end)
+        return search(self._epochs, epoch, self._start, self.capacity) - self._start
+
+
+class EventHistory:
+    """
+    class to remember when recent events of each kind happened, in fixed memory, so that detectors can
+    ask questions like "how many deaths since t" or "when was the last proof of life before t" without
+    keeping the log lines themselves.
+
+    Each kind is given a small integer code, and has a TimeRing of its own, so a flood of one kind of event
+    (e.g. melee during a long fight) never pushes the rarer kinds (e.g. deaths) out of the history.
+    Every query is a binary search, O(log n), and memory is capacity * 8 bytes per kind, however long
+    the session runs
+    """
+
+    def __init__(self, capacity: int = HISTORY_SIZE) -> None:
+        """
+        ctor
+
+        :param capacity: number of events of each kind that are remembered
+        """
+        self.capacity = capacity
+
+        # kind -> event code, and the ring for each event code
+        self.codes = dict()
+        self._rings = list()
+
+    def code(self, kind: str) -> int:
+        """
+        :param kind: event kind, e.g. 'death'
+        :return: the event code for the kind, assigned on first use
+        """
+        rv = self.codes.get(kind)
+        if rv is None:
+            rv = self.codes[kind] = len(self._rings)
+            self._rings.append(TimeRing(self.capacity))
+        return rv
+
+    def record(self, kind: str, epoch: int) -> None:
+        """
+        add an event
+
+        :param kind: event kind
+        :param epoch: time of the event, epoch seconds
+        """
+        code = self.codes.get(kind)
+        if code is None:
+            code = self.code(kind)
+        self._rings[code].append(epoch)
+
+    def clear(self, kinds: str or tuple[str] = None) -> None:
+        """
+        forget events
+
+        :param kinds: kind, or tuple of kinds, to forget, if None all of them
+        """
+        for ring in self._select(kinds) if kinds is not None else self._rings:
+            ring.clear()
+
+    def count_since(self, kinds: str or tuple[str], since: int) -> int:
+        """
+        :param kinds: kind, or tuple of kinds
+        :param since: epoch seconds
+        :return: number of events of the kinds at or after since
+        """
+        return sum(len(ring) - ring.bisect_left(since) for ring in self._select(kinds))
+
+    def count_between(self, kinds: str or tuple[str], start: int, end: int) -> int:
+        """
+        :param kinds: kind, or tuple of kinds
+        :param start: epoch seconds, inclusive
+        :param end: epoch seconds, exclusive
+        :return: number of events of the kinds in [start, end)
+        """
+        return sum(max(0, ring.bisect_left(end) - ring.bisect_left(start)) for ring in self._select(kinds))
+
+    def times_since(self, kinds: str or tuple[str], since: int) -> list[int]:
+        """
+        :param kinds: kind, or tuple of kinds
+        :param since: epoch seconds
+        :return: sorted list of the times of the events of the kinds at or after since
+        """
+        rv = list()
+        for ring in self._select(kinds):
+            rv.extend(ring[i] for i in range(ring.bisect_left(since), len(ring)))
+        rv.sort()
+        return rv
+
+    def last_before(self, kinds: str or tuple[str], before: int = None) -> int or None:
+        """
+        :param kinds: kind, or tuple of kinds
+        :param before: epoch seconds, if None the most recent event of the kinds is returned
+        :return: time of the most recent event of the kinds at or before 'before', None if there isn't one
+        """
+        rv = None
+        for ring in self._select(kinds):
+            index = len(ring) if before is None else ring.bisect_right(before)
+            if index > 0 and (rv is None or ring[index - 1] > rv):
+                rv = ring[index - 1]
+        return rv
+
+    def oldest(self, kinds: str or tuple[str]) -> int or None:
+        """
+        :param kinds: kind, or tuple of kinds
+        :return: time of the oldest event of the kinds still remembered, None if there isn't one, i.e. how far back
+        the answers to the other queries can be trusted
+        """
+        times = [ring[0] for ring in self._select(kinds) if len(ring)]
+        return min(times) if times else None
+
+    def _select(self, kinds: str or tuple[str]) -> list[TimeRing]:
+        """
+        :param kinds: kind, or tuple of kinds
+        :return: list of the rings for the kinds that have been seen
+        """
+        if isinstance(kinds, str):
+            code = self.codes.get(kinds)
+            return [self._rings[code]] if code is not None else []
+        return [self._rings[self.codes[kind]] for kind in kinds if kind in self.codes]
@@ -1,14 +1,50 @@
-import glob
+import mmap
 import os
-import re
 import threading
 import time
+import traceback
+
+import Checkpoint
+import Console
+import LogDirectoryIndex
+import LogFileWatcher
 
 
 # allow for testing, by forcing the bot to read an old log file
 TEST_ELF = False
 # TEST_ELF = True
 
+# number of bytes requested from the log file on each block read
+BLOCK_SIZE = 64 * 1024
+
+# default number of seconds between log file checks, when the polling watcher backend is in use
+POLL_INTERVAL = 0.1
+
+# a newer character log is only switched to once the current log has been quiet for this many seconds,
+# so that two characters logging at once don't cause the parser to flip back and forth
+SWITCH_GRACE = 1.0
+
+# number of seconds between scans for a newer character log while the current log is quiet, when
+# the watcher backend can't report which files changed
+SWITCH_CHECK_INTERVAL = 1.0
+
+# number of seconds between checks that the current log hasn't been replaced by a new file of the same name
+FILE_CHECK_INTERVAL = 1.0
+
+# maximum number of bytes at the end of a log that are scanned when priming the parser
+PRIME_MAX_BYTES = 16 * 1024 * 1024
+
+# every log line begins with a '[Www Mmm dd HH:MM:SS YYYY] ' timestamp, so the rest of the line begins at this byte offset
+BODY_OFFSET = 27
+
+# month abbreviations used in the log timestamps
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+# the most recently parsed timestamp, as a (timestamp string, epoch seconds) tuple.
+# log lines arrive in bursts that share the same second, so this one entry memo catches nearly all of them
+_last_timestamp = ('', 0)
+
 
 class EverquestLogFile(threading.Thread):
     """
@@ -24,7 +60,10 @@ class EverquestLogFile(threading.Thread):
     # about unreferenced attribute
     _started: threading.Event
 
-    def __init__(self, base_directory: str, logs_directory: str, server_name: str, heartbeat: int) -> None:
+    def __init__(self, base_directory: str, logs_directory: str, server_name: str, heartbeat: int,
+                 block_size: int = BLOCK_SIZE, poll_interval: float = POLL_INTERVAL,
+                 watch_backend: str = LogFileWatcher.BACKEND_AUTO,
+                 checkpoint: Checkpoint.CheckpointStore = None) -> None:
         """
         ctor
 
@@ -32,6 +71,11 @@ class EverquestLogFile(threading.Thread):
         :param logs_directory: Logs directory, typically '\\logs\\'
         :param server_name: Name of the server, i.e. 'P1999Green'
         :param heartbeat: Number of seconds of logfile inactivity before a check is made to re-determine most recent logfile
+        :param block_size: Number of bytes to request from the log file on each block read
+        :param poll_interval: Number of seconds between log file checks, when polling for changes
+        :param watch_backend: How to wait for log file changes, one of 'auto', 'inotify', or 'poll'
+        :param checkpoint: store for the read position and parser state, so a restart can resume where
+        this parser left off.  If None, parsing always begins at the end of the log
         """
         # parent ctor
         # the daemon=True parameter causes this child thread object to terminate
@@ -46,9 +90,73 @@ class EverquestLogFile(threading.Thread):
         self.filename = self.build_filename(self.char_name)
         self.file = None
 
+        # block reader state
+        # the file is read in binary chunks of block_size bytes.  Any trailing partial line (i.e. the game client
+        # was in the middle of writing it) is held in _partial until the rest of it arrives on a later read.
+        # _lines is the batch buffer handed to process_lines(), and is cleared and reused on every read
+        self.block_size = block_size
+        self.offset = 0
+        self._partial = b''
+        self._lines = list()
+
+        # number of complete lines read from the log, including any that line_filter() screened out
+        self.lines_read = 0
+
+        # the watcher blocks the parsing thread until the logs directory is written to.
+        # it is created when the parsing thread starts running
+        self.poll_interval = poll_interval
+        self.watch_backend = watch_backend
+        self._watcher = None
+
+        # index of the character logs in the logs directory, to find the latest one
+        self._index = LogDirectoryIndex.LogDirectoryIndex(base_directory + logs_directory, server_name)
+        self._last_switch_check = 0.0
+
+        # True when a newer log has been seen, but the switch to it is waiting for SWITCH_GRACE to pass
+        self._switch_pending = False
+
+        # identity of the open log, to detect it being truncated or replaced
+        self._inode = None
+        self._head = (0, 0)
+        self._last_file_check = 0.0
+
+        # checkpoint state.  While catching_up is True, the parser is replaying the part of the log that
+        # was written while it wasn't running, and the lines are not echoed
+        self.checkpoint = checkpoint
+        self.catching_up = False
+
+        # True while prime() is processing the recent tail of the log (along with catching_up).  Primed lines
+        # rebuild the parser state, but anything they would trigger has already happened, see prime()
+        self.priming = False
+        self._catch_up_start = (0, 0.0)
+        self._last_checkpoint = 0.0
+        self._checkpoint_due = False
+
+        # when parsing begins at the end of a log, the lines from the last prime_seconds seconds
+        # are processed first (in catch-up mode), so the parser isn't starting from a blank slate.  0 to disable
+        self.prime_seconds = 0
+
+        # set fast_start to True to begin with the last known log from the checkpoint, rather than scanning the
+        # logs directory for the latest log first.  The scan is then done once the parser is up and running,
+        # see open_last_known() and reconcile()
+        self.fast_start = False
+        self._reconcile_due = False
+
+        # for the startup report (see Supervisor), the time.perf_counter() when the parser first read up to the end of
+        # the log (i.e. was ready, with the recent past primed or the missed part caught up on), and when the first
+        # line was read from the log (or primed), which may be much later, if the game is quiet
+        self.ready_time = None
+        self.first_line_time = None
+
         self._parsing = threading.Event()
         self._parsing.clear()
 
+        # set when the parsing thread is to exit for good, see shutdown()
+        self._shutdown = threading.Event()
+
+        # exception that terminated the parsing thread, if any
+        self.exception = None
+
         self.prevtime = time.time()
         self.heartbeat = heartbeat
 
@@ -83,32 +191,25 @@ class EverquestLogFile(threading.Thread):
         """
         return self._parsing.is_set()
 
-    def open_latest(self, seek_end=True) -> bool:
+    def open_latest(self, seek_end=True, rescan=True, resume=False) -> bool:
         """
         open the file with most recent mod time (i.e. latest).
 
         :param seek_end:  True if parsing is to begin at the end of the file, False if at the beginning
+        :param rescan: True to rescan the logs directory first, False if the directory index is known to be current
+        :param resume: True to begin parsing from the checkpoint for the file, if there is a usable one
         :return: True if a new file was opened, False otherwise
         """
-        # get a list of all log files, and sort on mod time, latest at top
-        mask = self.base_directory + self.logs_directory + 'eqlog_*_' + self.server_name + '.txt'
-        files = glob.glob(mask)
-        files.sort(key=os.path.getmtime, reverse=True)
+        # find the latest log file
+        if rescan:
+            self._index.rescan()
+        latest = self._index.latest()
 
         # if no files are found to parse, bail out with an exception
-        if len(files) == 0:
+        if latest is None:
             raise ValueError(f'Unable to open any log files in directory [{self.base_directory}]')
 
-        latest_file = files[0]
-
-        # extract the character name from the filename
-        # note that windows pathnames must use double-backslashes in the pathname
-        # note that backslashes in regular expressions are double-double-backslashes
-        # this expression replaces double \\ with quadruple \\\\, as well as the filename mask asterisk to a
-        # named regular expression
-        charname_regexp = mask.replace('\\', '\\\\').replace('eqlog_*_', 'eqlog_(?P<charname>[\\w ]+)_')
-        m = re.match(charname_regexp, latest_file)
-        char_name = m.group('charname')
+        latest_file, char_name = latest
 
         rv = False
 
@@ -122,15 +223,76 @@ class EverquestLogFile(threading.Thread):
         elif self.is_parsing() and (self.filename != latest_file):
             # stop parsing old and open the new file
             self.close()
-            rv = self.open(char_name, latest_file, seek_end)
+            rv = self.open(char_name, latest_file, seek_end, resume=resume)
 
         # if we aren't parsing any file, then open latest
         elif not self.is_parsing():
-            rv = self.open(char_name, latest_file, seek_end)
+            rv = self.open(char_name, latest_file, seek_end, resume=resume)
 
         return rv
 
-    def open(self, charname: str, filename: str, seek_end=True) -> bool:
+    def open_last_known(self) -> bool:
+        """
+        open the log that was parsed most recently, according to the checkpoint, without scanning the logs
+        directory first.  A logs directory with years of character logs in it can take a while to scan, and
+        the last known log is nearly always still the latest one anyway.  The scan is done by reconcile()
+        instead, the first time the parsing thread finds the log has nothing new
+
+        :return: True if the last known log was opened, False if there isn't one and the directory must be scanned
+        """
+        if self.checkpoint is None:
+            return False
+
+        filename = self.checkpoint.latest()
+        if filename is None:
+            return False
+
+        # the checkpoint may be from a different server or logs directory, or the log may have been deleted since
+        charname = self._index.charname(filename)
+        if charname is None or not os.path.exists(filename):
+            return False
+
+        starprint(f'Fast start with the last known log, for [{charname}]')
+        if not self.open(charname, filename, resume=True):
+            return False
+
+        self._reconcile_due = True
+        return True
+
+    def reconcile(self) -> bool:
+        """
+        the full scan of the logs directory that open_last_known() put off, to check that the last known log
+        is still the latest one, and switch to the latest one if it isn't (i.e. a different character was played
+        while this program wasn't running).  Called from the parsing thread whenever the log has nothing new,
+        until it has been done
+
+        :return: True if a new logfile was opened
+        """
+        self._reconcile_due = False
+
+        start_time = time.perf_counter()
+        self._index.rescan()
+        latest = self._index.latest()
+        elapsed_ms = (time.perf_counter() - start_time) * 1000.0
+
+        if latest is None or latest[0] == self.filename:
+            starprint(f'Scanned {len(self._index)} character logs in {elapsed_ms:.1f} msec, '
+                      f'[{self.char_name}] is still the latest')
+            return False
+
+        # the new log is opened the same way as at startup, i.e. from its checkpoint if it has one
+        latest_file, char_name = latest
+        starprint(f'Scanned {len(self._index)} character logs in {elapsed_ms:.1f} msec, '
+                  f'[{char_name}] is more recent than [{self.char_name}]')
+        self.close()
+        if not self.open(char_name, latest_file, resume=True):
+            return False
+
+        # so the next fast start goes straight to this log, even if nothing is written to it before then
+        self.update_checkpoint(force=True)
+        return True
+
+    def open(self, charname: str, filename: str, seek_end=True, offset: int = None, resume=False) -> bool:
         """
         open the file.
         seek file position to end of file if passed parameter 'seek_end' is true
@@ -138,39 +300,198 @@ class EverquestLogFile(threading.Thread):
         :param charname: character name whose log file is to be opened
         :param filename: full log filename
         :param seek_end:  True if parsing is to begin at the end of the file, False if at the beginning
+        :param offset: if not None, byte offset where parsing is to begin, overrides seek_end
+        :param resume: True to begin parsing from the checkpoint for the file if there is a usable one,
+        in which case the missed part of the log is replayed in catch-up mode.  Ignored if offset is given
         :return: True if a new file was opened, False otherwise
         """
+        self.catching_up = False
+        if resume and offset is None:
+            offset = self.resume_offset(charname, filename)
+            self.catching_up = offset is not None
+
         try:
-            self.file = open(filename, 'r', errors='ignore')
-            if seek_end:
+            self.file = open(filename, 'rb')
+            self._inode = os.fstat(self.file.fileno()).st_ino
+            self._head = Checkpoint.fingerprint(self.file)
+            if offset is not None:
+                self.file.seek(offset)
+            elif seek_end:
                 self.file.seek(0, os.SEEK_END)
+            else:
+                self.file.seek(0)
+            self.offset = self.file.tell()
+            self._partial = b''
+            self._catch_up_start = (self.offset, time.perf_counter())
 
             self.char_name = charname
             self.filename = filename
             self.set_parsing()
+
+            # starting at the end, with nothing to catch up on, so look back over the recent past instead
+            if offset is None and seek_end and self.prime_seconds > 0:
+                self.prime(time.time() - self.prime_seconds)
             return True
         except OSError as err:
-            starprint('OS error: {0}'.format(err))
-            starprint('Unable to open filename: [{}]'.format(filename))
+            starprint('OS error: {0}'.format(err), Console.QUIET)
+            starprint('Unable to open filename: [{}]'.format(filename), Console.QUIET)
             return False
 
+    def resume_offset(self, charname: str, filename: str) -> int or None:
+        """
+        look up the checkpoint for a log file, and if it is still good, restore the parser state from it
+
+        :param charname: character name whose log file is being opened
+        :param filename: full log filename
+        :return: byte offset where the previous parser left off, or None if there is no usable checkpoint
+        """
+        if self.checkpoint is None:
+            return None
+
+        record = self.checkpoint.get(filename)
+        if record is None:
+            return None
+
+        problem = Checkpoint.validate(record, filename)
+        if problem:
+            starprint(f'Checkpoint for [{charname}] not used, {problem}')
+            return None
+
+        self.restore_state(record.get('state', dict()))
+        starprint(f'Resuming [{charname}] from checkpoint, {os.path.getsize(filename) - record["offset"]} bytes to catch up on')
+        return record['offset']
+
+    def prime(self, since: float) -> None:
+        """
+        process the lines at the end of the log that were written at or after 'since', in catch-up mode.
+        The lines are only there to rebuild the parser state (e.g. the DeathLoopVaccine death list), so while
+        they are processed, priming is True as well, and child classes must not act on them (e.g. kill the game,
+        which may well have been restarted since)
+
+        The log is memory mapped, and scanned backwards from the current read position one line at a time,
+        until a line with an older timestamp is found.  So only the recent tail of the log is ever touched,
+        no matter how large the log has grown
+
+        :param since: epoch seconds
+        """
+        start_time = time.perf_counter()
+        end = self.offset
+        if end == 0:
+            return
+
+        try:
+            with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+                # only complete lines, the read position may be in the middle of one being written
+                stop = mm.rfind(b'\n', 0, end) + 1
+                start = stop
+                limit = max(0, stop - PRIME_MAX_BYTES)
+                while start > limit:
+
+                    # beginning of the line that ends just before 'start'
+                    line_start = mm.rfind(b'\n', 0, start - 1) + 1
+                    epoch = parse_timestamp(mm[line_start:line_start + 26].decode('ascii', errors='ignore'))
+                    if epoch is not None and epoch < since:
+                        break
+                    start = line_start
+
+                data = mm[start:stop]
+        except (OSError, ValueError):
+            return
+
+        if not data:
+            return
+
+        lines = decode_lines(data).splitlines(keepends=True)
+        self.catching_up = True
+        self.priming = True
+        try:
+            self.process_lines(lines)
+        finally:
+            self.catching_up = False
+            self.priming = False
+        if self.first_line_time is None:
+            self.first_line_time = time.perf_counter()
+
+        elapsed = (time.perf_counter() - start_time) * 1000.0
+        starprint(f'Primed [{self.char_name}] with the last {len(lines)} line(s) of the log, '
+                  f'{len(data)} bytes in {elapsed:.2f} msec')
+
     def close(self) -> None:
         """
         close the file
         """
-        self.file.close()
+        if self.file:
+            self.file.close()
         self.clear_parsing()
 
     def readline(self) -> str or None:
         """
         get the next line
-        :return: a string containing the next line, or None if no new lines to be read
+        :return: a string containing the next line, empty string if no complete line is available yet,
+        or None if the file is not being parsed
         """
         if self.is_parsing():
-            return self.file.readline()
+            data = self.file.readline()
+
+            # hold on to a partial line until the rest of it is written
+            if not data.endswith(b'\n'):
+                self._partial += data
+                return ''
+
+            data = self._partial + data
+            self._partial = b''
+            self.offset += len(data)
+            return decode_lines(data)
         else:
             return None
 
+    def readlines(self) -> list[str] or None:
+        """
+        block read version of readline().
+        read everything that is currently available (in chunks of block_size bytes) and split it into lines.
+
+        Any trailing partial line is carried over and completed on a later call.
+        The returned list is an internal buffer that is reused on the next call, so callers must not hold on to it.
+
+        If line_filter() returns any needles, only the lines that begin with one of them (after the timestamp) are
+        decoded and returned, the rest are skipped over as raw bytes, without ever becoming strings
+
+        :return: list of complete lines (possibly empty), or None if the file is not being parsed
+        """
+        if not self.is_parsing():
+            return None
+
+        needles = self.line_filter()
+        self._lines.clear()
+        while True:
+            chunk = self.file.read(self.block_size)
+            if not chunk:
+                break
+
+            # only the data up through the last newline is complete, the rest waits for the next read
+            data = self._partial + chunk
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                self._partial = data
+            else:
+                self._partial = data[end:]
+                self.offset += end
+                self.lines_read += data.count(b'\n', 0, end)
+                if needles is None:
+                    self._lines.extend(decode_lines(data[:end]).splitlines(keepends=True))
+                else:
+                    self._lines.extend(decode_lines(data[start:data.find(b'\n', start, end) + 1])
+                                       for start in candidate_starts(data, end, needles))
+
+            # a short read means we have caught up with the writer
+            if len(chunk) < self.block_size:
+                break
+
+        if self.first_line_time is None and self.lines_read:
+            self.first_line_time = time.perf_counter()
+        return self._lines
+
     def go(self) -> bool:
         """
         call this method to kick off the parsing thread
@@ -198,7 +519,9 @@ class EverquestLogFile(threading.Thread):
             # open the latest file
             else:
                 # open the latest file, and kick off the parsing process
-                rv = self.open_latest()
+                # picking up where the last parser left off, if there is a checkpoint for it.
+                # a fast start goes straight to the last known log instead, and looks for a later one afterwards
+                rv = (self.fast_start and self.open_last_known()) or self.open_latest(resume=True)
 
             # if the log file was successfully opened, then initiate parsing
             if rv:
@@ -210,10 +533,12 @@ class EverquestLogFile(threading.Thread):
                 # create the background thread and kick it off
                 if not self._started.is_set():
                     self.start()
+                elif self._watcher:
+                    self._watcher.wakeup()
 
             else:
-                starprint('ERROR: Could not open character log file for: [{}]'.format(self.char_name))
-                starprint('Log filename: [{}]'.format(self.filename))
+                starprint('ERROR: Could not open character log file for: [{}]'.format(self.char_name), Console.QUIET)
+                starprint('Log filename: [{}]'.format(self.filename), Console.QUIET)
 
         return rv
 
@@ -222,56 +547,350 @@ class EverquestLogFile(threading.Thread):
         call this function when ready to stop (opposite of go() function)
         """
         self.close()
+        if self._watcher:
+            self._watcher.wakeup()
+
+    def shutdown(self) -> None:
+        """
+        stop parsing, and cause the parsing thread to exit.
+        unlike stop(), the parsing cannot be restarted with go() afterwards
+        """
+        self._shutdown.set()
+        self.stop()
 
     def run(self) -> None:
         """
         override the thread.run() method
         this method will execute in its own thread
+
+        any exception that escapes the parsing loop is saved in self.exception, so
+        a supervisor can tell a crashed thread from one that was shut down
         """
-        # run forever
-        while True:
+        try:
+            self.parse()
+        except Exception as exc:
+            # a read racing with a shutdown is not a crash
+            if self._shutdown.is_set():
+                return
+            self.exception = exc
+            starprint(f'Parsing thread for [{self.char_name}] terminated by exception: {exc!r}', Console.QUIET)
+            traceback.print_exc()
+            self.close()
+        finally:
+            self.close_watcher()
+
+    def make_watcher(self) -> LogFileWatcher.PollingWatcher or LogFileWatcher.InotifyWatcher:
+        """
+        create the watcher for the logs directory, which the parsing loop waits on
+
+        :return: watcher object
+        """
+        self._watcher = LogFileWatcher.make_watcher(self.watch_backend,
+                                                    self.base_directory + self.logs_directory,
+                                                    self.poll_interval)
+        starprint(f'Watching for log file changes using the [{self._watcher.name}] backend')
+        return self._watcher
+
+    def close_watcher(self) -> None:
+        """
+        release the watcher for the logs directory
+        """
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
+
+    def parse(self) -> None:
+        """
+        the parsing loop, which runs in the parsing thread until shutdown() is called
+        """
+        self.make_watcher()
+
+        # run until shut down
+        while not self._shutdown.is_set():
 
             # process the log file lines here
             if self.is_parsing():
 
-                # read a line
-                line = self.readline()
+                # read everything that is available
+                lines = self.readlines()
                 now = time.time()
-                if line:
-                    self.prevtime = now
+                if lines:
+                    self.process_batch(lines, now)
 
-                    # process this line
-                    self.process_line(line)
+                # if we didn't read a line, and there's no other log to switch to, block until the logs
+                # directory is written to, but no longer than it takes for the heartbeat to expire
+                elif not self.check_idle(now):
+                    self._watcher.wait(self.idle_timeout(now))
 
-                else:
+            # not parsing, so sleep until go() or shutdown() wakes us up
+            else:
+                self._watcher.wait(self.heartbeat)
 
-                    # don't check the heartbeat if we are just testing
-                    if not TEST_ELF:
+    def process_batch(self, lines: list[str], now: float) -> None:
+        """
+        process a batch of lines from readlines(), and do the bookkeeping that goes with it
+
+        :param lines: list of lines from the logfile
+        :param now: current time, epoch seconds
+        """
+        self.prevtime = now
 
-                        # check the heartbeat.  Has our logfile gone silent?
-                        elapsed_seconds = (now - self.prevtime)
+        # process this batch of lines
+        # readlines() reads right up to the end of the file, so any catching up is done after one batch
+        self.process_lines(lines)
+        self.finish_catch_up()
+        self.update_checkpoint()
 
-                        if elapsed_seconds > self.heartbeat:
-                            starprint('[{}] heartbeat over limit, elapsed seconds = {:.2f}'.format(self.char_name, elapsed_seconds))
-                            self.prevtime = now
+    def check_idle(self, now: float, switch: bool = True) -> bool:
+        """
+        the checks to make whenever the log has nothing new: has the log been truncated or replaced,
+        has a character switch happened, and has the heartbeat expired
 
-                            # attempt to open latest log file - returns True if a new logfile is opened
-                            if self.open_latest():
-                                starprint('Now parsing character log for: [{}]'.format(self.char_name))
+        :param now: current time, epoch seconds
+        :param switch: True to switch to whichever character log is the latest, False to stick with the current one
+        :return: True if the log was reopened, or a new log opened, i.e. there may be lines to read right away
+        """
+        self.finish_catch_up()
 
-                    # if we didn't read a line, pause just for a 100 msec blink
-                    time.sleep(0.1)
+        # don't check the heartbeat if we are just testing
+        if TEST_ELF:
+            return False
+
+        # has the log been truncated, or replaced by a new file?
+        if self.check_file(now):
+            return True
+
+        if not switch:
+            return False
+
+        # after a fast start, the logs directory hasn't been scanned yet, so make sure we have the latest log
+        if self._reconcile_due and self.reconcile():
+            starprint('Now parsing character log for: [{}]'.format(self.char_name))
+            return True
+
+        # has some other character log become the latest, i.e. a character switch?
+        if self.check_switch(now):
+            starprint('Now parsing character log for: [{}]'.format(self.char_name))
+            return True
+
+        # check the heartbeat.  Has our logfile gone silent?
+        elapsed_seconds = (now - self.prevtime)
+
+        if elapsed_seconds > self.heartbeat:
+            starprint('[{}] heartbeat over limit, elapsed seconds = {:.2f}'.format(self.char_name, elapsed_seconds))
+            self.prevtime = now
+
+            # attempt to open latest log file - returns True if a new logfile is opened
+            # if the watcher keeps the directory index current, there is no need to rescan
+            if self.open_latest(rescan=not self._watcher.reports_changes):
+                starprint('Now parsing character log for: [{}]'.format(self.char_name))
+                return True
+
+        return False
+
+    def idle_timeout(self, now: float) -> float:
+        """
+        :param now: current time, epoch seconds
+        :return: number of seconds to wait for the log to be written to, before the next check_idle()
+        """
+        if TEST_ELF:
+            return self.poll_interval
+
+        # a pending character switch is due as soon as the grace period is up
+        if self._switch_pending:
+            return min(self.heartbeat, SWITCH_GRACE) - (now - self.prevtime)
+        return self.heartbeat - (now - self.prevtime)
+
+    def check_switch(self, now: float) -> bool:
+        """
+        bring the directory index up to date, and switch to a newer character log if there is one.
+        called from the parsing thread whenever the current log has nothing new
+
+        :param now: current time, epoch seconds
+        :return: True if a new logfile was opened
+        """
+        changes = self._watcher.pop_changes()
+
+        # the watcher can't say which files changed, so rescan once in a while
+        if changes is None:
+            if now - self._last_switch_check >= SWITCH_CHECK_INTERVAL:
+                self._last_switch_check = now
+                self._index.rescan()
+            elif not self._switch_pending:
+                return False
+
+        # only the changed files need to be looked at, and only if any of them are character logs
+        elif not self._index.update(changes) and not self._switch_pending:
+            return False
+
+        latest = self._index.latest()
+        if latest is None or latest[0] == self.filename:
+            self._switch_pending = False
+            return False
+
+        # the current log is still busy, so put off the switch until the grace period is up
+        if now - self.prevtime < SWITCH_GRACE:
+            self._switch_pending = True
+            return False
+        self._switch_pending = False
+
+        # start reading the new log from where it was before it woke up, so the first lines aren't missed
+        latest_file, char_name = latest
+        offset = self._index.previous_size(latest_file)
+        if offset is not None and offset > self._index.size(latest_file):
+            offset = None
+        self.close()
+        return self.open(char_name, latest_file, offset=offset)
+
+    def check_file(self, now: float) -> bool:
+        """
+        detect the current log being truncated, or replaced by a new file with the same name, and if so
+        start over at the beginning of it.  Called from the parsing thread whenever the current log has nothing new
+
+        :param now: current time, epoch seconds
+        :return: True if parsing was restarted at the beginning of the log
+        """
+        # a file that is now shorter than where we are reading has been truncated
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+        except (OSError, ValueError):
+            return False
+
+        if size < self.offset:
+            starprint(f'Log for [{self.char_name}] has been truncated, parsing from the beginning')
+            self.file.seek(0)
+            self.offset = 0
+            self._partial = b''
+            return True
+
+        # the open file handle keeps reading the old file after a replacement, so check the name as well
+        if now - self._last_file_check < FILE_CHECK_INTERVAL:
+            return False
+        self._last_file_check = now
+
+        try:
+            inode = os.stat(self.filename).st_ino
+        except OSError:
+            return False
+
+        if inode and self._inode and inode != self._inode:
+            starprint(f'Log for [{self.char_name}] has been replaced, parsing the new file from the beginning')
+            self.close()
+            return self.open(self.char_name, self.filename, offset=0)
+
+        return False
+
+    def finish_catch_up(self) -> None:
+        """
+        leave catch-up mode, once the parser has read up to the end of the log
+        """
+        if self.ready_time is None:
+            self.ready_time = time.perf_counter()
+
+        if self.catching_up:
+            self.catching_up = False
+            start_offset, start_time = self._catch_up_start
+            elapsed = time.perf_counter() - start_time
+            if self.offset > start_offset:
+                starprint(f'Caught up on [{self.char_name}], {self.offset - start_offset} bytes in {elapsed:.3f} seconds')
+
+    def update_checkpoint(self, force: bool = False) -> None:
+        """
+        pass the current read position and parser state to the checkpoint store.
+        Must only be called between batches, when every line up to self.offset has been processed
+
+        :param force: True to checkpoint (and save) now, rather than once every checkpoint interval
+        """
+        if self.checkpoint is None or self._inode is None:
+            return
+
+        force = force or self._checkpoint_due
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint < self.checkpoint.interval:
+            return
+
+        # a log that was shorter than the fingerprint when it was opened gets a longer fingerprint now
+        head_length, head_crc = self._head
+        if head_length < Checkpoint.HEAD_BYTES and self.offset > head_length and not self.file.closed:
+            self._head = Checkpoint.fingerprint(self.file, min(self.offset, Checkpoint.HEAD_BYTES))
+            self.file.seek(self.offset + len(self._partial))
+            head_length, head_crc = self._head
+
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+        except (OSError, ValueError):
+            size = self.offset
+
+        self._last_checkpoint = now
+        self._checkpoint_due = False
+        self.checkpoint.put(self.filename, {
+            'offset': self.offset,
+            'inode': self._inode,
+            'size': size,
+            'head_length': head_length,
+            'head_crc': head_crc,
+            'state': self.checkpoint_state(),
+        })
+        self.checkpoint.save(force)
+
+    def request_checkpoint(self) -> None:
+        """
+        checkpoint at the end of the batch of lines being processed, rather than waiting for the checkpoint interval
+        """
+        self._checkpoint_due = True
+
+    def checkpoint_state(self) -> dict:
+        """
+        virtual method, to be overridden in derived classes that have parsing state worth carrying over a restart
+
+        :return: json serializable dict of parser state
+        """
+        return dict()
+
+    def restore_state(self, state: dict) -> None:
+        """
+        virtual method, to be overridden in derived classes, to restore the state saved by checkpoint_state()
+
+        :param state: dict of parser state from the checkpoint
+        """
+        pass
+
+    def line_filter(self) -> tuple[bytes] or None:
+        """
+        virtual method, to be overridden in derived classes that are only interested in some of the lines.
+        See line_needles() and candidate_starts()
+
+        Default behavior is to pass every line to process_lines()
+
+        :return: needles, one of which a line must begin with (after the timestamp) to be passed to process_lines(),
+        or None for every line
+        """
+        return None
+
+    def process_lines(self, lines: list[str]) -> None:
+        """
+        virtual method, called by the parsing thread with each batch of lines read from the logfile.
+
+        Default behavior is to call process_line() for each line, so child classes that only care about
+        one line at a time need not override this.  Note the list is reused by the reader after this call returns.
+
+        :param lines: list of lines from logfile to be processed
+        """
+        for line in lines:
+            self.process_line(line)
 
     def process_line(self, line: str) -> None:
         """
         virtual method, to be overridden in derived classes to do whatever specialized
         parsing is required for that application.
 
-        Default behavior is to simply print() the line
+        Default behavior is to simply echo the line to the console
 
         :param line: line from logfile to be processed
         """
-        print(line.rstrip())
+        # lines that are being caught up on are old news
+        if not self.catching_up:
+            Console.console.write(line.rstrip(), Console.ECHO)
 
 
 #################################################################################################
@@ -279,13 +898,96 @@ class EverquestLogFile(threading.Thread):
 # standalone functions
 #
 
-def starprint(line: str) -> None:
+def parse_timestamp(line: str) -> int or None:
+    """
+    utility function to convert the leading '[Www Mmm dd HH:MM:SS YYYY]' timestamp of a log line to epoch seconds.
+
+    The fields are sliced out of their fixed positions, rather than parsed with datetime.strptime(), and
+    the result for the most recent timestamp is remembered, so repeated lines from the same second are nearly free
+
+    :param line: line from the logfile
+    :return: local time in seconds since the epoch, or None if the line does not start with a timestamp
+    """
+    global _last_timestamp
+
+    stamp = line[0:26]
+    last_stamp, last_epoch = _last_timestamp
+    if stamp == last_stamp:
+        return last_epoch
+
+    if len(stamp) != 26 or stamp[0] != '[' or stamp[25] != ']':
+        return None
+
+    try:
+        epoch = int(time.mktime((int(stamp[21:25]), MONTHS[stamp[5:8]], int(stamp[9:11]),
+                                 int(stamp[12:14]), int(stamp[15:17]), int(stamp[18:20]), 0, 0, -1)))
+    except (KeyError, ValueError, OverflowError):
+        return None
+
+    _last_timestamp = (stamp, epoch)
+    return epoch
+
+
+def decode_lines(data: bytes) -> str:
+    """
+    utility function to convert raw logfile bytes to text.
+    Undecodable bytes are dropped, and windows line endings are converted, same as a text mode read would do
+
+    :param data: raw bytes from the logfile
+    :return: decoded string
+    """
+    return data.decode('utf-8', errors='ignore').replace('\r\n', '\n')
+
+
+def line_needles(prefixes: list[str]) -> tuple[bytes]:
+    """
+    utility function to turn the text that the interesting lines begin with (after the timestamp) into needles
+    for candidate_starts().  Each needle includes the end of the timestamp, so it can only be found in one place
+
+    :param prefixes: list of literal line prefixes, see LogRules.RuleSet.prefixes
+    :return: tuple of needles
+    """
+    return tuple(b'] ' + prefix.encode('utf-8') for prefix in prefixes)
+
+
+def candidate_starts(data: bytes, end: int, needles: tuple[bytes]) -> list[int]:
+    """
+    utility function to find the lines in a buffer of raw log data that begin (after the timestamp) with
+    one of the needles, without splitting or decoding the buffer.
+
+    Each needle is searched for across the whole buffer with bytes.find(), which runs at memory speed, and only
+    for a hit is the start of its line looked up, to check the hit is right after the timestamp.  So the
+    cost of the lines that don't match, which is nearly all of them, is close to nothing
+
+    :param data: raw log data
+    :param end: length of the part of data to search, which must end with a complete line
+    :param needles: see line_needles()
+    :return: sorted list of the offsets in data of the beginnings of the candidate lines
+    """
+    rv = list()
+    hit = BODY_OFFSET - 2
+    for needle in needles:
+        pos = data.find(needle, hit, end)
+        while pos >= 0:
+            start = data.rfind(b'\n', 0, pos) + 1
+            if pos - start == hit:
+                rv.append(start)
+            pos = data.find(needle, pos + 1, end)
+
+    # a line only ever matches one needle (see LogRules.RuleSet.prefixes), so there are no duplicates to remove
+    if len(needles) > 1:
+        rv.sort()
+    return rv
+
+
+def starprint(line: str, level: int = Console.DETECTIONS) -> None:
     """
     utility function to print with leading and trailing ** indicators
 
     :param line: line to be printed
+    :param level: console verbosity level at which the line is to be shown, see Console
     """
-    print(f'** {line.rstrip():<100} **')
+    Console.console.write(f'** {line.rstrip():<100} **', level)
 
 
 #
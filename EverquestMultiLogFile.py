@@ -0,0 +1,249 @@
+import threading
+import time
+import traceback
+from typing import Callable
+
+import Console
+import EverquestLogFile
+import LogDirectoryIndex
+import LogFileWatcher
+
+
+class EverquestMultiLogFile(threading.Thread):
+    """
+    class to follow every active character log for a server at once, from a single thread.
+
+    Each active log gets its own EverquestLogFile object, created by the passed factory, which holds the
+    per-file read state as well as any per-character parsing state of the child class (e.g. the
+    DeathLoopVaccine death list).  Those objects are only used for their readlines() and process_batch()
+    methods, and their own threads are never started.  All of the files are serviced from this one thread,
+    which blocks on a single watcher for the logs directory.
+
+    A log is considered active if it has been written to within the last stale_seconds.  Logs that go
+    quiet for longer than that are closed and dropped, and are picked up again if they become active.
+    If the watcher can report which files changed, a log that becomes active is picked up right away,
+    otherwise it is found by a periodic rescan of the logs directory.
+    """
+
+    # minimum number of seconds between directory scans that are triggered by activity in the logs directory
+    RESCAN_INTERVAL = 1.0
+
+    def __init__(self, factory: Callable[[], EverquestLogFile.EverquestLogFile], base_directory: str,
+                 logs_directory: str, server_name: str, heartbeat: int, stale_seconds: int,
+                 poll_interval: float = EverquestLogFile.POLL_INTERVAL,
+                 watch_backend: str = LogFileWatcher.BACKEND_AUTO) -> None:
+        """
+        ctor
+
+        :param factory: callable that creates a new EverquestLogFile (or child class) object, one per character
+        :param base_directory: Base installation directory for Everquest
+        :param logs_directory: Logs directory, typically '\\logs\\'
+        :param server_name: Name of the server, i.e. 'P1999Green'
+        :param heartbeat: Number of seconds between periodic scans for new and stale logs
+        :param stale_seconds: Number of seconds of logfile inactivity before a log is dropped
+        :param poll_interval: Number of seconds between log file checks, when polling for changes
+        :param watch_backend: How to wait for log file changes, one of 'auto', 'inotify', or 'poll'
+        """
+        super().__init__(daemon=True)
+
+        self.factory = factory
+        self.base_directory = base_directory
+        self.logs_directory = logs_directory
+        self.server_name = server_name
+        self.heartbeat = heartbeat
+        self.stale_seconds = stale_seconds
+        self.poll_interval = poll_interval
+        self.watch_backend = watch_backend
+
+        # name used in status messages, for compatibility with EverquestLogFile
+        self.char_name = 'All characters'
+
+        # active logs, keyed by filename
+        self.tails = dict()
+
+        # index of the character logs in the logs directory
+        self._index = LogDirectoryIndex.LogDirectoryIndex(base_directory + logs_directory, server_name)
+
+        # size of every log file as of the last scan, so a log that becomes active can be read
+        # from the point where it was last seen, rather than missing whatever was written before the scan
+        self._sizes = dict()
+
+        self._parsing = threading.Event()
+        self._shutdown = threading.Event()
+        self._watcher = None
+        self._last_scan = 0.0
+
+        # for the startup report, the time.perf_counter() when every log had first been read up to the end, and when
+        # the first line of any log was read, see EverquestLogFile
+        self.ready_time = None
+        self.first_line_time = None
+
+        # exception that terminated the parsing thread, if any
+        self.exception = None
+
+    def is_parsing(self) -> bool:
+        """
+        are the logs being actively parsed
+
+        :return: boolean True/False
+        """
+        return self._parsing.is_set()
+
+    def scan(self, initial: bool = False, rescan: bool = True) -> int:
+        """
+        start following any log that has become active, and drop any that have gone stale
+
+        :param initial: True on the first scan, when active logs are to be followed from their current end
+        :param rescan: True to rescan the logs directory first, False if the directory index is known to be current
+        :return: number of logs newly followed
+        """
+        added = 0
+        now = time.time()
+        self._last_scan = time.monotonic()
+        if rescan:
+            self._index.rescan()
+
+        for filename, charname, size in self._index.active(now - self.stale_seconds):
+            if filename not in self.tails:
+
+                # start where we last saw the file end, or at the beginning if the file is brand new.
+                # on the first scan, start from the checkpoint if there is one, else from the end of the file
+                if initial:
+                    offset = None
+                else:
+                    offset = min(self._sizes.get(filename, 0), size)
+
+                tail = self.factory()
+                if tail.open(charname, filename, offset=offset, resume=initial):
+                    tail.prevtime = now
+                    self.tails[filename] = tail
+                    added += 1
+                    EverquestLogFile.starprint(f'Now parsing character log for: [{charname}]')
+
+        # drop the logs which have gone quiet
+        for filename, tail in list(self.tails.items()):
+            if self._index.size(filename) is None or (now - tail.prevtime) > self.stale_seconds:
+                EverquestLogFile.starprint(f'No activity for [{tail.char_name}], no longer parsing')
+                tail.update_checkpoint(force=True)
+                tail.close()
+                del self.tails[filename]
+
+        self._sizes = {filename: size for filename, _, size in self._index.active(0)}
+        return added
+
+    def go(self) -> bool:
+        """
+        call this method to kick off the parsing thread
+
+        :return: True if parsing was started
+        """
+        if self.is_parsing():
+            EverquestLogFile.starprint('Already parsing character logs')
+            return False
+
+        self.scan(initial=True)
+        self._parsing.set()
+
+        # the logs that were primed when they were opened have already had lines processed
+        self.first_line_time = min((tail.first_line_time for tail in self.tails.values()
+                                    if tail.first_line_time is not None), default=None)
+        EverquestLogFile.starprint(f'Now parsing {len(self.tails)} active character log(s) for server [{self.server_name}]')
+
+        if not self._started.is_set():
+            self.start()
+        elif self._watcher:
+            self._watcher.wakeup()
+        return True
+
+    def stop(self) -> None:
+        """
+        call this function when ready to stop (opposite of go() function)
+        """
+        self._parsing.clear()
+        for tail in self.tails.values():
+            tail.close()
+        self.tails.clear()
+        if self._watcher:
+            self._watcher.wakeup()
+
+    def shutdown(self) -> None:
+        """
+        stop parsing, and cause the parsing thread to exit
+        """
+        self._shutdown.set()
+        self.stop()
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        try:
+            self.parse()
+        except Exception as exc:
+            if self._shutdown.is_set():
+                return
+            self.exception = exc
+            EverquestLogFile.starprint(f'Parsing thread for [{self.char_name}] terminated by exception: {exc!r}',
+                                       Console.QUIET)
+            traceback.print_exc()
+            self.stop()
+        finally:
+            if self._watcher:
+                self._watcher.close()
+                self._watcher = None
+
+    def parse(self) -> None:
+        """
+        the parsing loop, which services every active log until shutdown() is called
+        """
+        self._watcher = LogFileWatcher.make_watcher(self.watch_backend,
+                                                    self.base_directory + self.logs_directory,
+                                                    self.poll_interval)
+        EverquestLogFile.starprint(f'Watching for log file changes using the [{self._watcher.name}] backend')
+
+        while not self._shutdown.is_set():
+
+            if not self.is_parsing():
+                self._watcher.wait(self.heartbeat)
+                continue
+
+            # drain every active log
+            now = time.time()
+            read_any = False
+            for tail in list(self.tails.values()):
+                lines = tail.readlines()
+                if self.first_line_time is None:
+                    self.first_line_time = tail.first_line_time
+                if lines:
+                    read_any = True
+                    tail.process_batch(lines, now)
+                else:
+                    tail.finish_catch_up()
+
+                    # has the log been truncated, or replaced by a new file?
+                    read_any |= tail.check_file(now)
+
+            if self.ready_time is None:
+                self.ready_time = time.perf_counter()
+
+            # rescan every heartbeat regardless
+            # any newly followed log is read straight away, on the next pass through the loop
+            since_scan = time.monotonic() - self._last_scan
+            if since_scan > self.heartbeat:
+                read_any |= self.scan() > 0
+
+            # the watcher knows which files changed, so a log we aren't following can be picked up right away
+            elif self._watcher.reports_changes:
+                changes = self._watcher.pop_changes()
+                others = {name for name in changes if self._index.directory + name not in self.tails}
+                if others and self._index.update(others):
+                    read_any |= self.scan(rescan=False) > 0
+
+            # polling, so if none of the logs we follow had anything new, a log we aren't following
+            # may have woken up.  Rescan, but not too often
+            elif not read_any and since_scan > self.RESCAN_INTERVAL:
+                read_any |= self.scan() > 0
+
+            if not read_any:
+                self._watcher.wait(self.heartbeat)
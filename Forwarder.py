@@ -0,0 +1,246 @@
+import json
+import random
+import socket
+import struct
+import threading
+from collections import deque
+
+import Console
+import EverquestLogFile
+
+
+# transport protocols
+PROTOCOL_TCP = 'tcp'
+PROTOCOL_UDP = 'udp'
+
+# each tcp frame is preceded by its length, as a 4 byte unsigned big-endian integer
+FRAME_HEADER = struct.Struct('!I')
+
+# largest frame that will be sent or accepted.  UDP frames must also fit in a single datagram
+MAX_FRAME_BYTES = 60 * 1024
+
+# reconnect backoff, in seconds
+BACKOFF_MIN = 0.5
+BACKOFF_MAX = 30.0
+
+# event kinds, over and above the rule kinds (death, test_death, life)
+KIND_KILL = 'kill'
+
+
+class Forwarder(threading.Thread):
+    """
+    class to send detected events (deaths, proof of life, process kills) to a central collector, so that
+    a fleet of machines can be watched from one place.  See Collector.py for the receiving end.
+
+    Events are queued by forward(), which never blocks, and are sent from a background thread in batches.
+    Each batch is one compact frame: a json object {"i": instance name, "e": [event, ...]}, where each
+    event is {"t": epoch seconds, "c": character, "k": kind, "r": rule name, "l": log line} plus any
+    extra fields.  Over tcp, each frame is preceded by its length (4 bytes, big-endian), over udp each
+    frame is one datagram.
+
+    If the collector can't be reached, the thread keeps trying, with exponential backoff, and events wait
+    in the queue.  The queue is bounded, and if it fills up, the oldest events are dropped (and counted).
+    """
+
+    def __init__(self, host: str, port: int, protocol: str = PROTOCOL_TCP, instance: str = None,
+                 queue_size: int = 10000, batch_size: int = 200, flush_interval: float = 0.5) -> None:
+        """
+        ctor
+
+        :param host: collector host name or address
+        :param port: collector port
+        :param protocol: 'tcp' or 'udp'
+        :param instance: name of this instance, as shown by the collector.  Defaults to the host name
+        :param queue_size: maximum number of events waiting to be sent
+        :param batch_size: maximum number of events in one frame
+        :param flush_interval: number of seconds a partial batch may wait for more events before it is sent
+        """
+        super().__init__(daemon=True)
+        protocol = protocol.lower()
+        if protocol not in (PROTOCOL_TCP, PROTOCOL_UDP):
+            raise ValueError(f'Unknown forwarder protocol [{protocol}], expected tcp or udp')
+
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.instance = instance or socket.gethostname()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._socket = None
+        self._backoff = BACKOFF_MIN
+
+        # statistics
+        self.sent = 0
+        self.dropped = 0
+
+    def forward(self, char_name: str, kind: str, epoch: int or None, rule_name: str = None,
+                line: str = None, **extra) -> None:
+        """
+        queue an event to be sent.  Never blocks
+
+        :param char_name: character name
+        :param kind: event kind, e.g. 'death', 'life', 'kill'
+        :param epoch: time of the event, epoch seconds
+        :param rule_name: name of the rule that matched, if any
+        :param line: log line, if any
+        :param extra: any other fields to send
+        """
+        event = {'t': epoch, 'c': char_name, 'k': kind}
+        if rule_name:
+            event['r'] = rule_name
+        if line:
+            event['l'] = line.rstrip()
+        event.update(extra)
+
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(event)
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """
+        send whatever is queued (if the collector can be reached within timeout seconds), and stop the thread
+
+        :param timeout: maximum number of seconds to wait
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        while True:
+
+            # wait for a full batch, or for the flush interval to pass with something queued
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopping or len(self._queue) >= self.batch_size,
+                                         self.flush_interval)
+                if not self._queue:
+                    if self._stopping:
+                        break
+                    continue
+                count = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(count)]
+                stopping = self._stopping
+
+            sent = self.send(batch)
+            if sent == len(batch):
+                self._backoff = BACKOFF_MIN
+                continue
+
+            # couldn't send it all, so put the rest of the batch back at the front of the queue, and back off.
+            # the events that were sent must not be sent again, or the collector would count them twice
+            batch = batch[sent:]
+            with self._condition:
+                space = self._queue.maxlen - len(self._queue)
+                self.dropped += max(0, len(batch) - space)
+                self._queue.extendleft(reversed(batch[:space]))
+            if stopping:
+                break
+
+            # jitter, so that a fleet of instances doesn't reconnect in lockstep when the collector comes back
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopping, self._backoff * random.uniform(0.5, 1.0))
+            self._backoff = min(self._backoff * 2, BACKOFF_MAX)
+
+        self.close()
+
+    def send(self, batch: list[dict]) -> int:
+        """
+        send a batch of events to the collector, connecting first if need be.
+        A batch that is too big for one frame is sent as several, and if one of them fails, the rest aren't sent
+
+        :param batch: list of events
+        :return: number of events sent, from the start of the batch, i.e. len(batch) if the whole batch was sent
+        """
+        sent = 0
+        try:
+            if self._socket is None:
+                self.connect()
+            for frame, count in encode_frames(self.instance, batch):
+                if self.protocol == PROTOCOL_TCP:
+                    self._socket.sendall(FRAME_HEADER.pack(len(frame)) + frame)
+                else:
+                    self._socket.send(frame)
+                sent += count
+        except OSError as err:
+            if self._backoff == BACKOFF_MIN:
+                EverquestLogFile.starprint(f'Forwarder: unable to send to {self.host}:{self.port}: {err}', Console.QUIET)
+            self.close()
+
+        self.sent += sent
+        return sent
+
+    def connect(self) -> None:
+        """
+        connect to the collector
+        """
+        if self.protocol == PROTOCOL_TCP:
+            self._socket = socket.create_connection((self.host, self.port), timeout=5.0)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            # udp is connectionless, but connecting sets the default destination, and reports some errors
+            address = socket.getaddrinfo(self.host, self.port, type=socket.SOCK_DGRAM)[0]
+            self._socket = socket.socket(address[0], socket.SOCK_DGRAM)
+            self._socket.connect(address[4])
+
+    def close(self) -> None:
+        """
+        close the connection to the collector
+        """
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def encode_frames(instance: str, events: list[dict]) -> list[tuple[bytes, int]]:
+    """
+    utility function to encode a batch of events as one or more frames, each no larger than MAX_FRAME_BYTES
+
+    :param instance: name of the sending instance
+    :param events: list of events
+    :return: list of tuples of (encoded frame, number of events in it), with the events in their original order
+    """
+    frame = json.dumps({'i': instance, 'e': events}, separators=(',', ':')).encode('utf-8')
+    if len(frame) <= MAX_FRAME_BYTES:
+        return [(frame, len(events))]
+
+    # a single event that is too big on its own can only be because of the log line, so send it without
+    if len(events) == 1:
+        event = dict(events[0])
+        event.pop('l', None)
+        return [(json.dumps({'i': instance, 'e': [event]}, separators=(',', ':')).encode('utf-8'), 1)]
+
+    # too big, so split the batch in half
+    half = len(events) // 2
+    return encode_frames(instance, events[:half]) + encode_frames(instance, events[half:])
+
+
+def decode_frame(frame: bytes) -> tuple[str, list[dict]]:
+    """
+    utility function to decode a frame
+
+    :param frame: encoded frame
+    :return: tuple of (instance name, list of events)
+    """
+    data = json.loads(frame)
+    return str(data['i']), list(data['e'])
@@ -0,0 +1,324 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import Console
+import EverquestLogFile
+import ProcessTracker
+
+# psutil is imported where it's used, see KillExecutor.  This is only for the type hints
+if TYPE_CHECKING:
+    import psutil
+
+
+# default number of seconds the processes are given to exit after SIGTERM, before they are sent SIGKILL
+TERMINATE_DEADLINE = 5.0
+
+# default number of seconds to wait for the processes to exit after SIGKILL, before giving up on them
+KILL_DEADLINE = 2.0
+
+# the processes are waited on in slices of this many seconds.  psutil.wait_procs() waits on the processes one at
+# a time, so a long wait could notice a process exiting long after it did, and get its time to exit wrong
+WAIT_SLICE = 0.05
+
+# outcome of each kill, see KillJob.results
+EXITED = 'exited'           # exited after SIGTERM
+KILLED = 'killed'           # had to be sent SIGKILL, and then exited
+SURVIVED = 'survived'       # still running, even after SIGKILL
+GONE = 'gone'               # had already exited before it could be signalled
+DENIED = 'denied'           # not allowed to signal it
+
+
+class KillExecutor:
+    """
+    class to kill a set of processes, and make sure they are really gone.
+
+    Every process is sent SIGTERM at once, rather than one after the other, so no process waits on another.
+    Then they are given terminate_deadline seconds to exit, and any that haven't (i.e. a hung client, which
+    could otherwise go right on death looping) are sent SIGKILL.  The time each process took to exit is logged.
+
+    The signals are sent from the calling thread, so there is no delay in sending them, but the waiting is done
+    in a background thread (a KillJob), so the caller (i.e. the log parser) is never held up by it.
+
+    On Windows, psutil sends both SIGTERM and SIGKILL as TerminateProcess(), so the escalation is only
+    a second attempt there.
+
+    psutil is only imported once a kill is under way, since it is one of the slower modules to import, and
+    nothing needs it at startup.  By then the ProcessTracker will nearly always have imported it already
+    """
+
+    def __init__(self, terminate_deadline: float = TERMINATE_DEADLINE, kill_deadline: float = KILL_DEADLINE) -> None:
+        """
+        ctor
+
+        :param terminate_deadline: number of seconds the processes are given to exit after SIGTERM
+        :param kill_deadline: number of seconds to wait for the processes to exit after SIGKILL
+        """
+        self.terminate_deadline = terminate_deadline
+        self.kill_deadline = kill_deadline
+
+        # the jobs started by kill(), while they are running
+        self._jobs = list()
+
+    def kill(self, processes: list['psutil.Process'], detect_time: float = None) -> 'KillJob':
+        """
+        send SIGTERM to every process, and start a background job to confirm they exit (escalating to SIGKILL)
+
+        :param processes: processes to be killed.  psutil.Process objects know when their process was created,
+        so a process ID that has since been reused by some other process is never signalled
+        :param detect_time: time.perf_counter() of the detection that led to this kill, to log the latency, or None
+        :return: the job, which can be join()'ed to wait for the outcome
+        """
+        # a process that an earlier job is still waiting on (e.g. a hung client, found again by the next death loop)
+        # is left to that job, which will get to SIGKILL sooner
+        self._jobs = [job for job in self._jobs if job.is_alive()]
+        pending = set()
+        for job in self._jobs:
+            pending.update(job.pending())
+        for p in processes:
+            if p.pid in pending:
+                EverquestLogFile.starprint(f'Process [{p.pid}] is already being killed')
+
+        job = KillJob([p for p in processes if p.pid not in pending], self.terminate_deadline, self.kill_deadline,
+                      detect_time)
+        job.signal()
+        job.start()
+        self._jobs.append(job)
+        return job
+
+
+class KillJob(threading.Thread):
+    """
+    class to carry out one kill for KillExecutor, see KillExecutor.kill()
+    """
+
+    def __init__(self, processes: list['psutil.Process'], terminate_deadline: float, kill_deadline: float,
+                 detect_time: float = None) -> None:
+        """
+        ctor
+
+        :param processes: processes to be killed
+        :param terminate_deadline: see KillExecutor
+        :param kill_deadline: see KillExecutor
+        :param detect_time: see KillExecutor.kill()
+        """
+        super().__init__(daemon=True)
+        self.processes = list(processes)
+        self.terminate_deadline = terminate_deadline
+        self.kill_deadline = kill_deadline
+        self.detect_time = detect_time
+
+        # pid -> (outcome, seconds from SIGTERM to exit, or None if it didn't exit), see the outcomes above
+        self.results = dict()
+
+        # the processes that were sent SIGTERM, and when
+        self._signalled = list()
+        self._term_time = None
+
+    def signal(self) -> None:
+        """
+        send SIGTERM to every process, all in one go
+        """
+        import psutil
+
+        self._term_time = time.perf_counter()
+        for p in self.processes:
+            try:
+                p.terminate()
+                self._signalled.append(p)
+            except psutil.NoSuchProcess:
+                self.results[p.pid] = (GONE, None)
+            except psutil.AccessDenied as err:
+                self.results[p.pid] = (DENIED, None)
+                EverquestLogFile.starprint(f'Unable to kill process [{p.pid}]: {err}', Console.QUIET)
+
+        if self._signalled:
+            pids = [p.pid for p in self._signalled]
+            if self.detect_time is not None:
+                latency_ms = (self._term_time - self.detect_time) * 1000.0
+                EverquestLogFile.starprint(f'SIGTERM sent to {pids}, {latency_ms:.2f} msec after detection')
+            else:
+                EverquestLogFile.starprint(f'SIGTERM sent to {pids}')
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        import psutil
+
+        if not self._signalled:
+            return
+
+        # wait for the processes to exit on their own, up to the deadline
+        alive = self.wait(self._signalled, self.terminate_deadline, EXITED)
+        if not alive:
+            return
+
+        # and then some more forcefully
+        EverquestLogFile.starprint(f'{[p.pid for p in alive]} still running {self.terminate_deadline:.1f} seconds '
+                                   f'after SIGTERM, sending SIGKILL', Console.QUIET)
+        for p in alive:
+            try:
+                p.kill()
+            except psutil.NoSuchProcess:
+                # exited in the meantime, after all
+                self.exited(p, EXITED)
+            except psutil.AccessDenied as err:
+                EverquestLogFile.starprint(f'Unable to kill process [{p.pid}]: {err}', Console.QUIET)
+
+        alive = [p for p in alive if p.pid not in self.results]
+        alive = self.wait(alive, self.kill_deadline, KILLED)
+        for p in alive:
+            self.results[p.pid] = (SURVIVED, None)
+            EverquestLogFile.starprint(f'Process [{p.pid}] is still running, even after SIGKILL', Console.QUIET)
+
+    def wait(self, processes: list['psutil.Process'], deadline: float, outcome: str) -> list['psutil.Process']:
+        """
+        wait for processes to exit
+
+        :param processes: the processes
+        :param deadline: maximum number of seconds to wait
+        :param outcome: outcome to record for the processes that exit, EXITED or KILLED
+        :return: list of the processes still running at the deadline
+        """
+        import psutil
+
+        end = time.perf_counter() + deadline
+        alive = processes
+        while alive:
+            remaining = end - time.perf_counter()
+            if remaining <= 0:
+                break
+            _, alive = psutil.wait_procs(alive, timeout=min(WAIT_SLICE, remaining),
+                                         callback=lambda p: self.exited(p, outcome))
+        return alive
+
+    def exited(self, p: 'psutil.Process', outcome: str) -> None:
+        """
+        record and log a process exiting
+
+        :param p: the process
+        :param outcome: EXITED or KILLED
+        """
+        seconds = time.perf_counter() - self._term_time
+        self.results[p.pid] = (outcome, seconds)
+        how = '' if outcome == EXITED else f', once sent SIGKILL at {self.terminate_deadline:.1f} seconds'
+        EverquestLogFile.starprint(f'Process [{p.pid}] exited {seconds * 1000.0:.0f} msec after SIGTERM{how}')
+
+    def pending(self) -> list[int]:
+        """
+        :return: list of the process ID's whose outcome isn't known yet
+        """
+        return [p.pid for p in self.processes if p.pid not in self.results]
+
+    def confirmed(self) -> bool:
+        """
+        :return: True if every process is known to be gone.  Only meaningful once the job has finished
+        """
+        return all(outcome in (EXITED, KILLED, GONE) for outcome, _ in self.results.values())
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+# dummy eqgame.exe behaviors for the self test, each a python script.  All of them exit after a minute regardless,
+# so that a failed test can't leave them behind for long
+DUMMIES = {
+    # exits right away on SIGTERM, like a healthy client
+    'polite': 'import time\n'
+              'time.sleep(60)\n',
+
+    # takes a while to shut down after SIGTERM, but less than the deadline
+    'slow': 'import signal, sys, time\n'
+            'signal.signal(signal.SIGTERM, lambda *args: (time.sleep(0.5), sys.exit(0)))\n'
+            'time.sleep(60)\n',
+
+    # ignores SIGTERM altogether, like a hung client, so only SIGKILL will do
+    'hung': 'import signal, time\n'
+            'signal.signal(signal.SIGTERM, signal.SIG_IGN)\n'
+            'time.sleep(60)\n',
+}
+
+# the outcome expected for each dummy
+EXPECTED = {'polite': EXITED, 'slow': EXITED, 'hung': KILLED}
+
+
+def spawn_dummies(directory: str, counts: dict[str, int]) -> dict[int, str]:
+    """
+    utility function to start stand-in eqgame.exe processes, for testing.  Each one is the python interpreter,
+    run through a link named eqgame.exe, so the process name is eqgame.exe as far as psutil is concerned (Linux)
+
+    :param directory: directory to create the eqgame.exe link in
+    :param counts: dummy behavior (see DUMMIES) -> number of dummies with that behavior
+    :return: pid -> dummy behavior
+    """
+    import subprocess
+
+    exe = os.path.join(directory, 'eqgame.exe')
+    if not os.path.exists(exe):
+        os.symlink(sys.executable, exe)
+
+    rv = dict()
+    for behavior, count in counts.items():
+        for _ in range(count):
+            rv[subprocess.Popen([exe, '-c', DUMMIES[behavior]]).pid] = behavior
+    return rv
+
+
+def main():
+    import tempfile
+
+    import psutil
+
+    # self test, on Linux, against dummy eqgame.exe processes, i.e.
+    #   python3 KillExecutor.py --polite 2 --slow 1 --hung 2
+    parser = argparse.ArgumentParser(description='Self test of the eqgame.exe kill, using dummy eqgame.exe processes')
+    parser.add_argument('--polite', type=int, default=2, help='number of dummies that exit on SIGTERM')
+    parser.add_argument('--slow', type=int, default=1, help='number of dummies that take a while to exit on SIGTERM')
+    parser.add_argument('--hung', type=int, default=2, help='number of dummies that ignore SIGTERM')
+    parser.add_argument('--deadline', type=float, default=2.0, help='seconds between SIGTERM and SIGKILL')
+    args = parser.parse_args()
+
+    if os.name != 'posix':
+        EverquestLogFile.starprint('The self test needs Linux (or another posix system)', Console.QUIET)
+        sys.exit(2)
+
+    with tempfile.TemporaryDirectory() as directory:
+        dummies = spawn_dummies(directory, {'polite': args.polite, 'slow': args.slow, 'hung': args.hung})
+        EverquestLogFile.starprint(f'Started dummy eqgame.exe processes: {dummies}')
+
+        # give the dummies time to install their signal handlers
+        time.sleep(0.5)
+
+        # find them the way DeathLoopVaccine does, by name
+        tracker = ProcessTracker.ProcessTracker()
+        tracker.refresh()
+        processes = [p for p in tracker.processes() if p.pid in dummies]
+        if len(processes) != len(dummies):
+            EverquestLogFile.starprint(f'FAIL: found {len(processes)} of the {len(dummies)} dummies by name', Console.QUIET)
+            sys.exit(1)
+
+        job = KillExecutor(terminate_deadline=args.deadline).kill(processes, time.perf_counter())
+        job.join()
+
+    failures = 0
+    for pid, behavior in dummies.items():
+        outcome, seconds = job.results.get(pid, (None, None))
+        ok = outcome == EXPECTED[behavior] and not psutil.pid_exists(pid)
+        failures += not ok
+        exit_time = f'{seconds:.3f} seconds' if seconds is not None else 'n/a'
+        EverquestLogFile.starprint(f'{"ok  " if ok else "FAIL"} [{pid}] {behavior:<6} -> {outcome}, time to exit {exit_time}')
+
+    EverquestLogFile.starprint(f'{len(dummies) - failures} of {len(dummies)} dummies killed as expected')
+    Console.console.flush()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import gzip
+import io
+import os
+
+# zstandard is optional, and only needed to read .zst archives
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# file name suffixes of the archive formats that can be read
+SUFFIX_GZIP = '.gz'
+SUFFIX_ZSTD = '.zst'
+ARCHIVE_SUFFIXES = (SUFFIX_GZIP, SUFFIX_ZSTD)
+
+# number of bytes of decompressed data buffered at a time.  Big enough that line iteration runs almost
+# entirely in C, small enough that memory use stays flat however large the archive is
+READ_BUFFER = 1024 * 1024
+
+
+#
+# transparent reading of archived (compressed) Everquest logs
+#
+# Old logs are often rotated into .gz or .zst archives.  open_log() opens a log in binary mode whatever
+# form it is in, and decompresses it as a stream, one buffer at a time, so an archive is never inflated
+# in memory or on disk.  The result reads (and iterates line by line) exactly like a plain log opened
+# with open(filename, 'rb'), so anything that reads historical logs, i.e. Replay, can take archives as they are.
+#
+# Live logs are never compressed, so the tailing parser (EverquestLogFile) continues to open them directly.
+#
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def is_archive(filename: str) -> bool:
+    """
+    utility function to tell an archived log from a plain one
+
+    :param filename: log filename
+    :return: True if the file name has one of the ARCHIVE_SUFFIXES
+    """
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def log_name(filename: str) -> str:
+    """
+    utility function to get the name of the log inside an archive, e.g. eqlog_Char_P1999Green.txt
+    from eqlog_Char_P1999Green.txt.gz
+
+    :param filename: log filename, archived or not
+    :return: the base file name, without any archive suffix
+    """
+    name = os.path.basename(filename)
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def open_log(filename: str) -> io.BufferedIOBase:
+    """
+    utility function to open a log for reading in binary mode, decompressing it on the fly if it is an archive
+
+    :param filename: log filename, plain, .gz, or .zst
+    :return: file object, opened for reading in binary mode.  Archives can't be seeked efficiently
+    """
+    lower = filename.lower()
+    if lower.endswith(SUFFIX_GZIP):
+        return io.BufferedReader(gzip.GzipFile(filename, 'rb'), buffer_size=READ_BUFFER)
+
+    if lower.endswith(SUFFIX_ZSTD):
+        if zstandard is None:
+            raise OSError(f'Unable to read [{filename}], the zstandard package is needed for .zst archives '
+                          f'(pip install zstandard)')
+        raw = open(filename, 'rb', buffering=READ_BUFFER)
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=READ_BUFFER, closefd=True)
+        return io.BufferedReader(reader, buffer_size=READ_BUFFER)
+
+    return open(filename, 'rb')
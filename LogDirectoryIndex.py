@@ -0,0 +1,177 @@
+import heapq
+import os
+import re
+
+
+class LogDirectoryIndex:
+    """
+    class to keep track of the character logs in the Everquest logs directory, and which was most recently written.
+
+    A full scan uses os.scandir(), which on windows gets the file times along with the directory listing,
+    rather than one stat() call per file.  The (mtime, size) of every log is cached, and the logs are
+    kept in a heap ordered by mtime, so finding the latest log never needs a sort.  Between full scans,
+    the index can be kept current by passing it the names of the files that changed, as reported by the
+    directory watcher, at the cost of one stat() per changed file.
+
+    Heap entries are invalidated lazily, i.e. an entry is only discarded when it reaches the top of the
+    heap and no longer matches the cached mtime.  The heap is rebuilt if too many stale entries pile up.
+    """
+
+    def __init__(self, directory: str, server_name: str) -> None:
+        """
+        ctor
+
+        :param directory: logs directory, including the trailing path separator (base directory + logs directory)
+        :param server_name: Name of the server, i.e. 'P1999Green'
+        """
+        self.directory = directory
+        self.server_name = server_name
+
+        # matches the name (not the full path) of a character log for this server, compiled just once
+        self._regexp = re.compile(r'eqlog_(?P<charname>[\w ]+)_' + re.escape(server_name) + r'\.txt$')
+
+        # full filename -> (mtime, size, charname)
+        self._entries = dict()
+
+        # (-mtime, full filename), so the newest log is at the top
+        self._heap = list()
+
+        # full filename -> size of the file before its most recently observed change (0 for a new file)
+        self._previous = dict()
+
+        self.scanned = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rescan(self) -> None:
+        """
+        full scan of the logs directory
+        """
+        entries = dict()
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    m = self._regexp.match(entry.name)
+                    if m:
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        entries[self.directory + entry.name] = (st.st_mtime, st.st_size, m.group('charname'))
+        except OSError:
+            pass
+
+        # remember where the files that changed since the last scan used to end
+        if self.scanned:
+            for filename, (_, size, _) in entries.items():
+                cached = self._entries.get(filename)
+                if cached is None:
+                    self._previous[filename] = 0
+                elif cached[1] != size:
+                    self._previous[filename] = cached[1]
+
+        self._entries = entries
+        self._heap = [(-mtime, filename) for filename, (mtime, _, _) in entries.items()]
+        heapq.heapify(self._heap)
+        self.scanned = True
+
+    def update(self, names: set[str]) -> bool:
+        """
+        incremental update, for the files reported as changed by the directory watcher
+
+        :param names: set of file names (without the directory) that have changed
+        :return: True if any character log was affected
+        """
+        if not self.scanned:
+            self.rescan()
+            return True
+
+        rv = False
+        for name in names:
+            m = self._regexp.match(name)
+            if not m:
+                continue
+
+            rv = True
+            filename = self.directory + name
+            try:
+                st = os.stat(filename)
+            except OSError:
+                # the file has gone away
+                self._entries.pop(filename, None)
+                continue
+
+            cached = self._entries.get(filename)
+            if cached is None or cached[0] != st.st_mtime:
+                heapq.heappush(self._heap, (-st.st_mtime, filename))
+            if cached is None:
+                self._previous[filename] = 0
+            elif cached[1] != st.st_size:
+                self._previous[filename] = cached[1]
+            self._entries[filename] = (st.st_mtime, st.st_size, m.group('charname'))
+
+        # keep the pile of stale heap entries under control
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(-mtime, filename) for filename, (mtime, _, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+
+        return rv
+
+    def latest(self) -> tuple[str, str] or None:
+        """
+        :return: tuple of (full filename, character name) of the most recently written log, or None if there are none
+        """
+        if not self.scanned:
+            self.rescan()
+
+        while self._heap:
+            neg_mtime, filename = self._heap[0]
+            cached = self._entries.get(filename)
+            if cached is not None and cached[0] == -neg_mtime:
+                return filename, cached[2]
+
+            # stale entry
+            heapq.heappop(self._heap)
+
+        return None
+
+    def active(self, since: float) -> list[tuple[str, str, int]]:
+        """
+        :param since: epoch seconds
+        :return: list of (full filename, character name, size) tuples for every log written to at or after 'since'
+        """
+        if not self.scanned:
+            self.rescan()
+
+        return [(filename, charname, size) for filename, (mtime, size, charname) in self._entries.items()
+                if mtime >= since]
+
+    def charname(self, filename: str) -> str or None:
+        """
+        work out the character name from a log filename, without needing a scan
+
+        :param filename: full filename
+        :return: character name, or None if the file isn't a character log for this server in the logs directory
+        """
+        if not filename.startswith(self.directory):
+            return None
+
+        m = self._regexp.match(filename[len(self.directory):])
+        return m.group('charname') if m else None
+
+    def previous_size(self, filename: str) -> int or None:
+        """
+        :param filename: full filename
+        :return: size of the file before its most recently observed change, i.e. where the new data begins,
+        or None if no change has been observed
+        """
+        return self._previous.get(filename)
+
+    def size(self, filename: str) -> int or None:
+        """
+        :param filename: full filename
+        :return: size of the file as of the last scan or update, or None if it isn't known
+        """
+        cached = self._entries.get(filename)
+        return cached[1] if cached else None
@@ -0,0 +1,202 @@
+import EventHistory
+import EverquestLogFile
+import LogRules
+
+
+class LogEvent:
+    """
+    class to hold a single log line, parsed once into the parts that detectors care about
+    """
+
+    __slots__ = ('epoch', 'body', 'kind', 'rule', 'line')
+
+    def __init__(self, epoch: int or None, body: str, rule: LogRules.Rule or None, line: str) -> None:
+        """
+        ctor
+
+        :param epoch: time of the line, epoch seconds, or None if the line has no timestamp
+        :param body: the line with the leading timestamp removed
+        :param rule: the rule the line matched, or None
+        :param line: the complete line, as read from the log
+        """
+        self.epoch = epoch
+        self.body = body
+        self.kind = rule.kind if rule else None
+        self.rule = rule
+        self.line = line
+
+    def __repr__(self) -> str:
+        return f'LogEvent({self.epoch!r}, {self.body!r}, {self.rule!r})'
+
+
+class Detector:
+    """
+    base class for anything that watches the stream of log events, e.g. the death loop detector.
+
+    Child classes overload process_event(), and if they have state that should survive a restart,
+    checkpoint_state() and restore_state() as well.
+
+    Sliding window rules can be built on the pipeline's event history (self.history, once registered),
+    which remembers the times of recent events of every kind, so a detector needn't keep lines of its own
+    """
+
+    # key for this detector's state in the checkpoint, must be unique among the detectors in a pipeline
+    name = 'detector'
+
+    def __init__(self, parser: EverquestLogFile.EverquestLogFile, rules: list[LogRules.Rule] = None) -> None:
+        """
+        ctor
+
+        :param parser: the parser feeding this detector, for the character name, catch-up state, etc
+        :param rules: any rules this detector needs, over and above those already in the pipeline
+        """
+        self.parser = parser
+        self.rules = list(rules) if rules else list()
+
+        # the history of the pipeline this detector is registered with
+        self.history = None
+
+    def process_event(self, event: LogEvent) -> None:
+        """
+        virtual method, called once for every line of the log
+
+        :param event: the parsed line
+        """
+        pass
+
+    def checkpoint_state(self) -> dict:
+        """
+        virtual method, see EverquestLogFile.checkpoint_state()
+
+        :return: json serializable dict of detector state
+        """
+        return dict()
+
+    def restore_state(self, state: dict) -> None:
+        """
+        virtual method, see EverquestLogFile.restore_state()
+
+        :param state: dict of detector state from the checkpoint
+        """
+        pass
+
+
+class EventPipeline:
+    """
+    class to turn each log line into a LogEvent, exactly once, and hand it to every registered detector.
+
+    The line is split from its timestamp, and classified against the rules of every detector in a single
+    pass, so adding a detector costs nothing more than its own process_event() calls: no extra tail of the
+    log file, and no extra parse of the line.
+
+    The time of every classified line is also recorded in an event history, shared by all the detectors
+    """
+
+    def __init__(self, parser: EverquestLogFile.EverquestLogFile, rules: LogRules.RuleSet = None,
+                 history_size: int = EventHistory.HISTORY_SIZE) -> None:
+        """
+        ctor
+
+        :param parser: the parser feeding this pipeline, for the name of the character being parsed
+        :param rules: rules to classify the lines against, if None, only the rules the detectors bring with them
+        :param history_size: number of events of each kind remembered in the event history
+        """
+        self.parser = parser
+        self.rules = rules if rules is not None else LogRules.RuleSet(list())
+        self.detectors = list()
+        self.history = EventHistory.EventHistory(history_size)
+
+    def register(self, detector: Detector) -> None:
+        """
+        subscribe a detector to the events
+
+        :param detector: detector object
+        """
+        if any(d.name == detector.name for d in self.detectors):
+            raise ValueError(f'A detector named [{detector.name}] is already registered')
+        self.detectors.append(detector)
+        detector.history = self.history
+        if detector.rules:
+            self.rules.add(detector.rules)
+
+    def make_event(self, line: str) -> LogEvent:
+        """
+        parse a line
+
+        :param line: line from the logfile
+        :return: LogEvent object
+        """
+        # the rules can refer to the character name, so rebuild them whenever the character changes
+        if self.rules.char_name != self.parser.char_name:
+            self.rules.bind(self.parser.char_name)
+
+        # cut off the leading date-time stamp info
+        body = line[27:]
+        return LogEvent(EverquestLogFile.parse_timestamp(line), body, self.rules.classify(body), line)
+
+    def process_line(self, line: str) -> LogEvent:
+        """
+        parse a line, and pass it to every detector
+
+        :param line: line from the logfile
+        :return: LogEvent object
+        """
+        event = self.make_event(line)
+        if event.kind is not None and event.epoch is not None:
+            self.history.record(event.kind, event.epoch)
+        for detector in self.detectors:
+            detector.process_event(event)
+        return event
+
+    def checkpoint_state(self) -> dict:
+        """
+        :return: json serializable dict of the state of every detector, by detector name
+        """
+        return {detector.name: detector.checkpoint_state() for detector in self.detectors}
+
+    def restore_state(self, state: dict) -> None:
+        """
+        :param state: dict of detector state from the checkpoint, by detector name
+        """
+        for detector in self.detectors:
+            if detector.name in state:
+                detector.restore_state(state[detector.name])
+
+
+class AlertDetector(Detector):
+    """
+    detector that announces every line matching one of the alert rules, e.g. low health or going linkdead.
+    A rule that keeps matching is only announced once every repeat_seconds, so a burst of the same message
+    makes one alert
+    """
+
+    name = 'alert'
+
+    def __init__(self, parser: EverquestLogFile.EverquestLogFile, repeat_seconds: int = 10) -> None:
+        """
+        ctor
+
+        :param parser: the parser feeding this detector
+        :param repeat_seconds: minimum number of seconds (by the log timestamps) between alerts for the same rule
+        """
+        super().__init__(parser)
+        self.repeat_seconds = repeat_seconds
+
+        # rule name -> time of the last alert, epoch seconds
+        self._last_alert = dict()
+
+    def process_event(self, event: LogEvent) -> None:
+        """
+        announce the alert lines
+
+        :param event: the parsed line
+        """
+        if event.kind != LogRules.KIND_ALERT or self.parser.catching_up:
+            return
+
+        last = self._last_alert.get(event.rule.name)
+        if last is not None and event.epoch is not None and event.epoch - last < self.repeat_seconds:
+            return
+
+        self._last_alert[event.rule.name] = event.epoch
+        EverquestLogFile.starprint(f'ALERT ({event.rule.name}) for [{self.parser.char_name}]: {event.line}')
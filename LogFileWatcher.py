@@ -0,0 +1,264 @@
+import ctypes
+import os
+import select
+import struct
+import sys
+import threading
+
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+# inotify_init1() flags, which share their values with the matching O_ flags
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# events of interest in the logs directory
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# layout of the fixed part of struct inotify_event, which is followed by the (null padded) file name
+EVENT_HEADER = struct.Struct('iIII')
+
+# names of the available watcher backends
+BACKEND_AUTO = 'auto'
+BACKEND_INOTIFY = 'inotify'
+BACKEND_POLL = 'poll'
+
+
+class PollingWatcher:
+    """
+    class to wait for changes in the Everquest logs directory, by simply sleeping for a fixed poll interval.
+
+    This is the portable fallback, used on any platform that doesn't have a change notification backend
+    """
+
+    name = BACKEND_POLL
+
+    # polling can't tell which files changed, see pop_changes()
+    reports_changes = False
+
+    def __init__(self, directory: str, poll_interval: float) -> None:
+        """
+        ctor
+
+        :param directory: directory to be watched
+        :param poll_interval: number of seconds to sleep between checks of the log file
+        """
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        block until it is time to check the log file again
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if the log file should be checked for new data, False if the wait timed out
+        """
+        self._wakeup.wait(max(min(timeout, self.poll_interval), 0))
+        self._wakeup.clear()
+
+        # there is no way to know, so the log file always needs to be checked
+        return True
+
+    def pop_changes(self) -> None:
+        """
+        polling can't tell which files changed
+
+        :return: None, meaning unknown
+        """
+        return None
+
+    def wakeup(self) -> None:
+        """
+        cause any thread blocked in wait() to return immediately
+        """
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """
+        release any resources
+        """
+        pass
+
+
+class InotifyWatcher:
+    """
+    class to wait for changes in the Everquest logs directory, using the linux inotify API.
+
+    The whole logs directory is watched, rather than just the current log file, so that a new
+    character log being created or written to also wakes up the watcher
+    """
+
+    name = BACKEND_INOTIFY
+
+    # the names of the changed files are available from pop_changes()
+    reports_changes = True
+
+    def __init__(self, directory: str, poll_interval: float) -> None:
+        """
+        ctor
+
+        :param directory: directory to be watched
+        :param poll_interval: unused, present for compatibility with PollingWatcher
+        """
+        self.directory = directory
+        self.poll_interval = poll_interval
+
+        libc = _load_libc()
+
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f'inotify_init1 failed: {os.strerror(err)}')
+
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, f'inotify_add_watch failed for [{directory}]: {os.strerror(err)}')
+
+        # names of the files that have changed since the last call to pop_changes()
+        self._changes = set()
+
+        # self-pipe, used by wakeup() to interrupt a blocked wait()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        block until something in the logs directory is written to
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if the log file should be checked for new data, False if the wait timed out
+        """
+        readable, _, _ = select.select([self._fd, self._wakeup_r], [], [], max(timeout, 0))
+
+        # collect the names of the files that changed
+        if self._fd in readable:
+            self.read_events()
+        if self._wakeup_r in readable:
+            _drain(self._wakeup_r)
+
+        return len(readable) > 0
+
+    def fileno(self) -> int:
+        """
+        :return: the inotify file descriptor, which becomes readable when the logs directory is written to.
+        This allows an event loop to wait on the watcher, with read_events() called once it is readable
+        """
+        return self._fd
+
+    def read_events(self) -> None:
+        """
+        read all pending inotify events, and note the names of the files they refer to
+        """
+        try:
+            while True:
+                buffer = os.read(self._fd, 64 * 1024)
+                if not buffer:
+                    break
+                pos = 0
+                while pos + EVENT_HEADER.size <= len(buffer):
+                    _, _, _, length = EVENT_HEADER.unpack_from(buffer, pos)
+                    pos += EVENT_HEADER.size
+                    name = buffer[pos:pos + length].rstrip(b'\0')
+                    pos += length
+                    if name:
+                        self._changes.add(os.fsdecode(name))
+        except BlockingIOError:
+            pass
+
+    def pop_changes(self) -> set[str]:
+        """
+        :return: set of the names of the files in the directory that changed since the last call
+        """
+        rv = self._changes
+        self._changes = set()
+        return rv
+
+    def wakeup(self) -> None:
+        """
+        cause any thread blocked in wait() to return immediately
+        """
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except OSError:
+            # the pipe is already full of wakeups, or the watcher has been closed
+            pass
+
+    def close(self) -> None:
+        """
+        release the inotify and pipe file descriptors
+        """
+        for fd in (self._fd, self._wakeup_r, self._wakeup_w):
+            os.close(fd)
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def _drain(fd: int) -> None:
+    """
+    utility function to read and discard everything waiting on a non-blocking file descriptor
+
+    :param fd: file descriptor
+    """
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def _load_libc() -> ctypes.CDLL:
+    """
+    utility function to get at the C library functions, for inotify.
+
+    The symbols of the running python, which is linked against the C library, are tried first.  Looking the library
+    up by name with ctypes.util.find_library() works too, but it runs ldconfig to do it, which is slow enough
+    to hold up startup noticeably
+
+    :return: the C library
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    if hasattr(libc, 'inotify_init1'):
+        return libc
+
+    from ctypes.util import find_library
+    libc_name = find_library('c')
+    if libc_name is None:
+        raise OSError('Unable to locate the C library for inotify')
+    return ctypes.CDLL(libc_name, use_errno=True)
+
+
+def make_watcher(backend: str, directory: str, poll_interval: float) -> PollingWatcher or InotifyWatcher:
+    """
+    create a logs directory watcher.
+    The 'auto' backend uses inotify when it is available, and falls back to polling otherwise
+
+    :param backend: one of 'auto', 'inotify', or 'poll'
+    :param directory: directory to be watched
+    :param poll_interval: number of seconds between checks, for the polling backend
+    :return: watcher object
+    """
+    backend = backend.lower()
+    if backend not in (BACKEND_AUTO, BACKEND_INOTIFY, BACKEND_POLL):
+        raise ValueError(f'Unknown log watcher backend [{backend}]')
+
+    if backend != BACKEND_POLL and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory, poll_interval)
+        except OSError:
+            # fall back to polling
+            pass
+
+    return PollingWatcher(directory, poll_interval)
@@ -0,0 +1,305 @@
+import configparser
+import re
+
+
+# rule kinds
+KIND_DEATH = 'death'
+KIND_TEST_DEATH = 'test_death'
+KIND_LIFE = 'life'
+KIND_ALERT = 'alert'
+
+# ini file section holding the rules for each kind
+RULE_SECTIONS = {
+    KIND_DEATH: 'DeathRules',
+    KIND_TEST_DEATH: 'TestDeathRules',
+    KIND_LIFE: 'LifeRules',
+    KIND_ALERT: 'AlertRules',
+}
+
+# placeholder in a rule pattern, replaced with the (escaped) name of the character being parsed
+CHAR_NAME = '{char_name}'
+
+# default rules, used for any kind that has no section in the ini file.
+# patterns are matched against the log line with the leading timestamp removed
+DEFAULT_RULES = {
+    KIND_DEATH: [
+        ('slain', r'You have been slain'),
+    ],
+
+    # a way to test - send a tell to death_loop
+    KIND_TEST_DEATH: [
+        ('death_loop', r'death_loop'),
+    ],
+
+    # proof of life, i.e. things that indicate the player is not actually AFK
+    KIND_LIFE: [
+        ('casting', r'You begin casting'),
+
+        # communication - tells, say, group, auction, and shout channels
+        ('told', r'You told'),
+        ('say', r'You say'),
+        ('tell', r'You tell'),
+        ('auction', r'You auction'),
+        ('shout', r'You shout'),
+        ('channel', CHAR_NAME + r' ->'),
+
+        # melee
+        ('melee', r'You (try to )?(hit|slash|pierce|crush|claw|bite|sting|maul|gore|punch|kick|backstab|bash)'),
+    ],
+
+    # messages that are simply announced on the console, e.g. low health or going linkdead.  None by default
+    KIND_ALERT: [],
+}
+
+# the literal first word of a pattern, if it has one, i.e. a run of word characters followed by a space
+FIRST_TOKEN_REGEXP = re.compile(r"([\w']+) ")
+
+
+class Rule:
+    """
+    class to hold a single line classification rule
+    """
+
+    __slots__ = ('name', 'kind', 'pattern')
+
+    def __init__(self, name: str, kind: str, pattern: str) -> None:
+        """
+        ctor
+
+        :param name: rule name, reported when the rule matches
+        :param kind: one of KIND_DEATH, KIND_TEST_DEATH, KIND_LIFE
+        :param pattern: regular expression, anchored at the start of the line (after the timestamp)
+        """
+        self.name = name
+        self.kind = kind
+        self.pattern = pattern
+
+    def __repr__(self) -> str:
+        return f'Rule({self.name!r}, {self.kind!r}, {self.pattern!r})'
+
+
+class RuleSet:
+    """
+    class to classify log lines against a set of rules, in a single pass.
+
+    The rules are grouped by the literal first word of their pattern (e.g. 'You'), and each group is compiled
+    into a single regular expression, as an alternation of one named group per rule.  Classifying a line
+    costs one dictionary lookup on the first word of the line, plus (only if some rule starts with that word)
+    one regex match.  Most log traffic is combat spam and chat that begins with some other word, and is
+    rejected by the dictionary lookup alone, no matter how many rules there are.
+
+    Rules whose pattern has no literal first word go in a catch-all group that is tried against every line,
+    so those should be kept to a minimum.
+
+    Patterns may contain the {char_name} placeholder, so the compiled matchers are rebuilt by bind()
+    whenever the character being parsed changes
+    """
+
+    def __init__(self, rules: list[Rule]) -> None:
+        """
+        ctor
+
+        :param rules: list of Rule objects
+        """
+        self.rules = list(rules)
+        self.char_name = None
+
+        # first word -> (compiled regex, {group name: Rule})
+        self._dispatch = dict()
+
+        # rules without a literal first word
+        self._catchall = None
+
+        # the literal text that a line must begin with to match some rule, see bind()
+        self.prefixes = None
+
+    def add(self, rules: list[Rule]) -> None:
+        """
+        add more rules to the set.  The compiled matchers are rebuilt on the next bind()
+
+        :param rules: list of Rule objects
+        """
+        self.rules.extend(rules)
+        self.char_name = None
+
+    def bind(self, char_name: str) -> None:
+        """
+        (re)build the compiled matchers for the passed character name
+
+        :param char_name: name of the character being parsed
+        """
+        self.char_name = char_name
+
+        # group the rules by the literal first word of their pattern
+        buckets = dict()
+        for rule in self.rules:
+            pattern = rule.pattern.replace(CHAR_NAME, re.escape(char_name))
+            token = _first_token(pattern)
+            buckets.setdefault(token, list()).append((rule, pattern))
+
+        self._dispatch = dict()
+        self._catchall = None
+        for token, entries in buckets.items():
+            compiled = _compile(entries)
+            if token is None:
+                self._catchall = compiled
+            else:
+                self._dispatch[token] = compiled
+
+        # the literal prefixes of all the rules, so lines can be screened before they are even decoded.
+        # A prefix that begins with another one adds nothing, and a rule with no prefix at all means any line could match
+        prefixes = sorted(_literal_prefix(rule.pattern.replace(CHAR_NAME, re.escape(char_name))) for rule in self.rules)
+        if '' in prefixes:
+            self.prefixes = None
+        else:
+            self.prefixes = list()
+            for prefix in prefixes:
+                if not any(prefix.startswith(shorter) for shorter in self.prefixes):
+                    self.prefixes.append(prefix)
+
+    def classify(self, trunc_line: str) -> Rule or None:
+        """
+        find the rule that matches the passed line
+
+        :param trunc_line: log line, with the leading timestamp removed
+        :return: the matching Rule, or None if no rule matches
+        """
+        entry = self._dispatch.get(trunc_line.split(' ', 1)[0])
+        if entry:
+            regexp, rules = entry
+            m = regexp.match(trunc_line)
+            if m:
+                return rules[m.lastgroup]
+
+        if self._catchall:
+            regexp, rules = self._catchall
+            m = regexp.match(trunc_line)
+            if m:
+                return rules[m.lastgroup]
+
+        return None
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def _first_token(pattern: str) -> str or None:
+    """
+    utility function to find the literal first word that every line matching the pattern must begin with
+
+    :param pattern: regular expression
+    :return: the first word, or None if the pattern does not begin with a literal word
+    """
+    m = FIRST_TOKEN_REGEXP.match(pattern)
+    if not m:
+        return None
+
+    # a top level alternation means some lines can match without the first word
+    if _top_level_alternation(pattern):
+        return None
+
+    return m.group(1)
+
+
+def _literal_prefix(pattern: str) -> str:
+    """
+    utility function to find the literal text that every line matching the pattern must begin with,
+    e.g. 'You have been slain' for r'You have been slain', or 'You ' for r'You (try to )?hit'
+
+    :param pattern: regular expression
+    :return: the literal prefix, empty if there isn't one
+    """
+    if _top_level_alternation(pattern):
+        return ''
+
+    rv = list()
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        step = 1
+        if c == '\\':
+            # an escaped punctuation character is literal, but \d, \w, \b etc are not
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break
+            c = pattern[i + 1]
+            step = 2
+        elif c in '.^$*+?{}[]|()':
+            break
+
+        # a quantifier makes the character optional (or repeatable), so the prefix ends before (or with) it
+        quantifier = pattern[i + step] if i + step < len(pattern) else ''
+        if quantifier in ('*', '?', '{'):
+            break
+        rv.append(c)
+        if quantifier == '+':
+            break
+        i += step
+
+    return ''.join(rv)
+
+
+def _top_level_alternation(pattern: str) -> bool:
+    """
+    utility function to check a pattern for a '|' outside of any group
+
+    :param pattern: regular expression
+    :return: True if the pattern has a top level alternation
+    """
+    depth = 0
+    escaped = False
+    for c in pattern:
+        if escaped:
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return True
+    return False
+
+
+def _compile(entries: list[tuple[Rule, str]]) -> tuple[re.Pattern, dict[str, Rule]]:
+    """
+    utility function to compile a list of rules into a single named-group alternation
+
+    :param entries: list of (Rule, pattern with placeholders substituted) tuples
+    :return: tuple of (compiled regex, dictionary of group name -> Rule)
+    """
+    rules = dict()
+    alternatives = list()
+    for n, (rule, pattern) in enumerate(entries):
+        group_name = f'rule{n}'
+        rules[group_name] = rule
+        alternatives.append(f'(?P<{group_name}>{pattern})')
+    return re.compile('|'.join(alternatives)), rules
+
+
+def load_rules(config: configparser.ConfigParser) -> RuleSet:
+    """
+    build the rule set from the ini file.
+
+    Each rule kind has its own section ([DeathRules], [TestDeathRules], [LifeRules], [AlertRules]), in which each entry
+    is 'name = pattern'.  A kind with no section in the ini file gets the default rules
+
+    :param config: parsed ini file contents
+    :return: RuleSet object
+    """
+    rules = list()
+    for kind, section in RULE_SECTIONS.items():
+        if config.has_section(section):
+            for name, pattern in config.items(section, raw=True):
+                # validate now, so a typo is reported against the rule rather than the combined pattern
+                try:
+                    re.compile(pattern.replace(CHAR_NAME, 'Name'))
+                except re.error as err:
+                    raise ValueError(f'Invalid pattern for rule [{section}] {name} = {pattern}: {err}')
+                rules.append(Rule(name, kind, pattern))
+        else:
+            for name, pattern in DEFAULT_RULES[kind]:
+                rules.append(Rule(name, kind, pattern))
+    return RuleSet(rules)
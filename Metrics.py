@@ -0,0 +1,322 @@
+import bisect
+import functools
+import http.server
+import threading
+import time
+from collections import deque
+
+import EverquestLogFile
+import EverquestMultiLogFile
+
+
+# upper bounds of the log-to-processing lag histogram buckets, in seconds.
+# log timestamps only have one second resolution, so the smallest useful bucket is about a second
+LAG_BUCKETS = (1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# number of seconds of history used for the lines per second gauge
+RATE_WINDOW = 10.0
+
+# name used for classifications that matched no rule
+NO_RULE = '(none)'
+
+
+class Metrics:
+    """
+    class to collect statistics on how the parsing thread is doing, and render them in the Prometheus text format.
+
+    Nothing in the parsing code refers to this class.  Instead, instrument() wraps the methods of a parser
+    object (on that one object only) with versions that count and time the calls, so when metrics are
+    turned off, the parser runs exactly the same code it always did, at no cost at all.
+
+    Lines are counted twice over.  Lines read are counted by the parser's reader, and include any lines that the line
+    filter screened out without decoding them.  Lines processed are only those passed on to the detectors, i.e. with
+    the line filter on, the lines that begin with the prefix of some rule.  The lag histogram is of the lines processed
+    """
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        # updated by the parsing thread, read by the http server thread
+        self._lock = threading.Lock()
+
+        self.parser_starts = 0
+        self.parsers_running = 0
+        self.read_batches = 0
+        self.idle_polls = 0
+
+        # character name -> count
+        self.lines_read = dict()
+        self.lines = dict()
+        self.file_opens = dict()
+
+        # rule name -> [number of classifications that ended with this rule, total seconds spent on them]
+        self.rules = dict()
+
+        # lag histogram, with one extra bucket for +Inf
+        self.lag_counts = [0] * (len(LAG_BUCKETS) + 1)
+        self.lag_sum = 0.0
+
+        # (monotonic time, total lines read) samples, for the lines per second gauge.  A sample is taken on every scrape
+        self._samples = deque([(time.monotonic(), 0)])
+        self._total_lines_read = 0
+
+    def instrument(self, parser: EverquestLogFile.EverquestLogFile or EverquestMultiLogFile.EverquestMultiLogFile) -> None:
+        """
+        wrap the methods of a parser object with counting and timing versions.
+        For a multi log parser, every per-character parser it creates is instrumented too
+
+        :param parser: parser object, before its thread is started
+        """
+        parser.run = self._wrap_run(parser.run)
+
+        if isinstance(parser, EverquestMultiLogFile.EverquestMultiLogFile):
+            parser.factory = self.instrument_factory(parser.factory)
+            return
+
+        parser.readlines = self._wrap_readlines(parser, parser.readlines)
+        parser.process_line = self._wrap_process_line(parser, parser.process_line)
+        parser.open = self._wrap_open(parser.open)
+
+        # the rules of the event pipeline, if the parser has one
+        pipeline = getattr(parser, 'pipeline', None)
+        if pipeline is not None:
+            pipeline.rules.classify = self._wrap_classify(pipeline.rules.classify)
+
+    def instrument_factory(self, factory):
+        """
+        :param factory: callable that creates a new parser object
+        :return: callable that creates a new parser object, and instruments it
+        """
+        @functools.wraps(factory)
+        def wrapper(*args, **kwargs):
+            parser = factory(*args, **kwargs)
+            self.instrument(parser)
+            return parser
+        return wrapper
+
+    def _wrap_run(self, run):
+        @functools.wraps(run)
+        def wrapper():
+            with self._lock:
+                self.parser_starts += 1
+                self.parsers_running += 1
+            try:
+                run()
+            finally:
+                with self._lock:
+                    self.parsers_running -= 1
+        return wrapper
+
+    def _wrap_readlines(self, parser, readlines):
+        @functools.wraps(readlines)
+        def wrapper():
+            before = parser.lines_read
+            lines = readlines()
+            count = parser.lines_read - before
+            with self._lock:
+                if count > 0:
+                    self.lines_read[parser.char_name] = self.lines_read.get(parser.char_name, 0) + count
+                    self._total_lines_read += count
+                if lines or count > 0:
+                    self.read_batches += 1
+                else:
+                    self.idle_polls += 1
+            return lines
+        return wrapper
+
+    def _wrap_open(self, open_):
+        @functools.wraps(open_)
+        def wrapper(charname, *args, **kwargs):
+            rv = open_(charname, *args, **kwargs)
+            if rv:
+                with self._lock:
+                    self.file_opens[charname] = self.file_opens.get(charname, 0) + 1
+            return rv
+        return wrapper
+
+    def _wrap_process_line(self, parser, process_line):
+        @functools.wraps(process_line)
+        def wrapper(line):
+            process_line(line)
+
+            # lag between the time the game wrote the line, and now that it has been dealt with
+            # lines being caught up on are late by design, so they don't count
+            stamp = EverquestLogFile.parse_timestamp(line)
+            now = time.time()
+            with self._lock:
+                self.lines[parser.char_name] = self.lines.get(parser.char_name, 0) + 1
+                if stamp is not None and not parser.catching_up:
+                    lag = max(0.0, now - stamp)
+                    self.lag_counts[bisect.bisect_left(LAG_BUCKETS, lag)] += 1
+                    self.lag_sum += lag
+        return wrapper
+
+    def _wrap_classify(self, classify):
+        @functools.wraps(classify)
+        def wrapper(trunc_line):
+            start = time.perf_counter()
+            rule = classify(trunc_line)
+            elapsed = time.perf_counter() - start
+
+            name = rule.name if rule else NO_RULE
+            with self._lock:
+                entry = self.rules.get(name)
+                if entry is None:
+                    entry = self.rules[name] = [0, 0.0]
+                entry[0] += 1
+                entry[1] += elapsed
+            return rule
+        return wrapper
+
+    def lines_per_second(self) -> float:
+        """
+        :return: lines read per second, over the last RATE_WINDOW seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, self._total_lines_read))
+            while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+                self._samples.popleft()
+            then, lines_then = self._samples[0]
+            lines_now = self._total_lines_read
+
+        if now - then <= 0:
+            return 0.0
+        return (lines_now - lines_then) / (now - then)
+
+    def render(self) -> str:
+        """
+        :return: the metrics, in the Prometheus text exposition format
+        """
+        rate = self.lines_per_second()
+
+        rv = list()
+        with self._lock:
+            _metric(rv, 'dlvax_parser_starts_total', 'counter', 'Number of times a parsing thread was started',
+                    [('', self.parser_starts)])
+            _metric(rv, 'dlvax_parsers_running', 'gauge', 'Number of parsing threads currently running',
+                    [('', self.parsers_running)])
+            _metric(rv, 'dlvax_lines_read_total', 'counter',
+                    'Number of log lines read, including those the line filter screened out',
+                    [(_labels(char=char), count) for char, count in sorted(self.lines_read.items())])
+            _metric(rv, 'dlvax_lines_processed_total', 'counter',
+                    'Number of log lines passed to the detectors, i.e. with the line filter on, only those that begin with a rule prefix',
+                    [(_labels(char=char), count) for char, count in sorted(self.lines.items())])
+            _metric(rv, 'dlvax_lines_per_second', 'gauge', f'Log lines read per second, over the last {RATE_WINDOW:.0f} seconds',
+                    [('', f'{rate:.3f}')])
+            _metric(rv, 'dlvax_read_batches_total', 'counter', 'Number of log reads that found new lines',
+                    [('', self.read_batches)])
+            _metric(rv, 'dlvax_idle_polls_total', 'counter', 'Number of log reads that found nothing new',
+                    [('', self.idle_polls)])
+            _metric(rv, 'dlvax_file_opens_total', 'counter', 'Number of times a character log was opened, i.e. file switches',
+                    [(_labels(char=char), count) for char, count in sorted(self.file_opens.items())])
+            _metric(rv, 'dlvax_rule_classifications_total', 'counter', 'Number of line classifications, by the rule that matched',
+                    [(_labels(rule=name), entry[0]) for name, entry in sorted(self.rules.items())])
+            _metric(rv, 'dlvax_rule_seconds_total', 'counter', 'Time spent on line classifications, by the rule that matched',
+                    [(_labels(rule=name), f'{entry[1]:.6f}') for name, entry in sorted(self.rules.items())])
+
+            # histogram buckets are cumulative
+            samples = list()
+            cumulative = 0
+            for bound, count in zip(LAG_BUCKETS + (float('inf'),), self.lag_counts):
+                cumulative += count
+                samples.append(('_bucket' + _labels(le='+Inf' if bound == float('inf') else f'{bound:g}'), cumulative))
+            samples.append(('_sum', f'{self.lag_sum:.3f}'))
+            samples.append(('_count', cumulative))
+            _metric(rv, 'dlvax_line_lag_seconds', 'histogram', 'Lag between the timestamp of a processed log line and when it was processed',
+                    samples)
+
+        return '\n'.join(rv) + '\n'
+
+
+class MetricsServer(threading.Thread):
+    """
+    class to serve the metrics over http, on the local machine only, for a Prometheus scraper (or a browser)
+    """
+
+    def __init__(self, metrics: Metrics, port: int, host: str = '127.0.0.1') -> None:
+        """
+        ctor
+
+        :param metrics: metrics to be served
+        :param port: tcp port to listen on
+        :param host: address to listen on.  Defaults to the loopback address, so the metrics aren't visible to the network
+        """
+        super().__init__(daemon=True)
+        self.metrics = metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # keep the console for the log
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        self.server.serve_forever()
+
+    def shutdown(self) -> None:
+        """
+        stop serving
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def _labels(**labels) -> str:
+    """
+    utility function to format Prometheus labels
+
+    :param labels: label names and values
+    :return: string of the form '{name="value",...}'
+    """
+    text = ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return '{' + text + '}'
+
+
+def _escape(value: str) -> str:
+    """
+    utility function to escape a Prometheus label value
+
+    :param value: label value
+    :return: escaped value
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metric(rv: list[str], name: str, kind: str, help_text: str, samples: list[tuple[str, object]]) -> None:
+    """
+    utility function to format one metric, with its HELP and TYPE lines
+
+    :param rv: list of output lines, appended to
+    :param name: metric name
+    :param kind: metric type, i.e. 'counter', 'gauge', or 'histogram'
+    :param help_text: description of the metric
+    :param samples: list of (name suffix and/or labels, value) tuples
+    """
+    rv.append(f'# HELP {name} {help_text}')
+    rv.append(f'# TYPE {name} {kind}')
+    for suffix, value in samples:
+        rv.append(f'{name}{suffix} {value}')
@@ -0,0 +1,122 @@
+import threading
+from typing import TYPE_CHECKING
+
+# psutil is imported where it's used, see ProcessTracker.  This is only for the type hints
+if TYPE_CHECKING:
+    import psutil
+
+
+class ProcessTracker(threading.Thread):
+    """
+    class to keep an up-to-date set of the running eqgame.exe processes, in the background.
+
+    Looking up process names is the expensive part of a process scan, so each refresh only fetches the
+    bare list of PIDs, and only looks up the name of a PID it hasn't seen before.  PIDs that have gone
+    away are simply dropped.  That way the list of processes to kill is already known at the moment
+    a death loop is confirmed, and no process enumeration is needed then.
+
+    A PID that has been seen before may since have been reused by a new process (Windows in particular
+    reuses PIDs quickly), so every known PID is checked to still be the same process, by its creation
+    time, which is much cheaper than looking up its name again.  A reused PID is looked up as if it were new.
+
+    psutil is one of the slower modules to import, so it isn't imported until the first refresh.  When the
+    tracker thread is started early on, that means psutil is imported in the background, while the parser starts up
+    """
+
+    def __init__(self, process_name: str = 'eqgame.exe', refresh_interval: float = 2.0) -> None:
+        """
+        ctor
+
+        :param process_name: name of the processes to be tracked
+        :param refresh_interval: number of seconds between refreshes
+        """
+        super().__init__(daemon=True)
+        self.process_name = process_name
+        self.refresh_interval = refresh_interval
+
+        # pid -> psutil.Process, for the matching processes
+        self._processes = dict()
+
+        # pid -> psutil.Process, for every pid whose name has already been checked, matching or not
+        self._known = dict()
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def refresh(self) -> None:
+        """
+        bring the set of tracked processes up to date
+        """
+        import psutil
+
+        pids = set(psutil.pids())
+
+        # the processes that have appeared since the last refresh, including any that have taken over
+        # the pid of a process that has exited since (is_running() compares the creation time)
+        known = dict()
+        new = set()
+        for pid in pids:
+            p = self._known.get(pid)
+            try:
+                running = p is not None and p.is_running()
+            except psutil.Error:
+                running = False
+            if running:
+                known[pid] = p
+            else:
+                new.add(pid)
+
+        # look up only those
+        found = dict()
+        for pid in new:
+            try:
+                p = psutil.Process(pid)
+                known[pid] = p
+                if p.name() == self.process_name:
+                    found[pid] = p
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+
+        with self._lock:
+            for pid in [pid for pid in self._processes if pid not in pids or pid in new]:
+                del self._processes[pid]
+            self._processes.update(found)
+
+        self._known = known
+
+    def pids(self) -> list[int]:
+        """
+        :return: list of process ID's of the tracked processes, as of the last refresh
+        """
+        with self._lock:
+            return list(self._processes.keys())
+
+    def processes(self) -> list['psutil.Process']:
+        """
+        :return: list of psutil.Process objects for the tracked processes, as of the last refresh
+        """
+        with self._lock:
+            return list(self._processes.values())
+
+    def stop(self) -> None:
+        """
+        cause the refresh thread to exit
+        """
+        self._stop_event.set()
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        import psutil
+
+        while True:
+            try:
+                self.refresh()
+            except psutil.Error:
+                # try again next time around
+                pass
+
+            if self._stop_event.wait(self.refresh_interval):
+                break
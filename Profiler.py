@@ -0,0 +1,422 @@
+import functools
+import io
+import os
+import signal
+import sys
+import threading
+import time
+import weakref
+
+import Console
+import EverquestLogFile
+import EverquestMultiLogFile
+
+
+# profiling modes.  Every mode times the parser stages, and the sample and cprofile modes also profile the parsing thread
+MODE_STAGES = 'stages'          # stage timing histograms only
+MODE_SAMPLE = 'sample'          # plus a statistical profile, from sampling the parsing thread's stack
+MODE_CPROFILE = 'cprofile'      # plus a deterministic profile of every call on the parsing thread, with cProfile
+MODES = (MODE_STAGES, MODE_SAMPLE, MODE_CPROFILE)
+
+# default number of seconds a profiling session lasts
+PROFILE_SECONDS = 30.0
+
+# number of seconds between stack samples, in sample mode
+SAMPLE_INTERVAL = 0.005
+
+# python thread switch interval while sampling, in seconds.  The sampler can only take a sample once the parsing
+# thread lets go of the GIL, which by default it need only do every 5 msec, or when it waits on i/o, so
+# the samples would pile up on the i/o.  A shorter interval spreads them out where the time is really spent
+SAMPLE_SWITCH_INTERVAL = 0.0002
+
+# cProfile can only be turned off by the thread it is profiling, which only happens when that thread next reads
+# the log.  An idle parser does so at least once a heartbeat, so this is how long the report waits on it
+HANDBACK_TIMEOUT = 20.0
+
+# number of functions listed in each table of the report
+REPORT_TOP = 30
+
+# the parser methods that are timed, see Profiler.targets()
+PARSER_STAGES = ('readlines', 'process_lines')
+DETECTOR_STAGES = ('process_event', 'check_for_death', 'check_not_afk', 'deathloop_response')
+
+
+class StageHistogram:
+    """
+    class to hold a histogram of the durations of one stage of the parser, in power of 2 microsecond buckets,
+    i.e. bucket n counts the calls that took less than 2**n microseconds (and at least 2**(n-1))
+    """
+
+    __slots__ = ('counts', 'total', 'max')
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        self.counts = [0] * 40
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """
+        add a call
+
+        :param seconds: duration of the call
+        """
+        self.counts[min(int(seconds * 1e6).bit_length(), 39)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def calls(self) -> int:
+        """
+        :return: number of calls recorded
+        """
+        return sum(self.counts)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        :param fraction: e.g. 0.99 for the 99th percentile
+        :return: upper bound of the bucket the percentile falls in, in seconds
+        """
+        target = fraction * self.calls()
+        running = 0
+        for n, count in enumerate(self.counts):
+            running += count
+            if running >= target and count:
+                return (1 << n) / 1e6
+        return 0.0
+
+
+class Profiler:
+    """
+    class to find out where the parsing thread spends its time, for a given number of seconds at a time,
+    e.g. when it falls behind during heavy log traffic.  The result is written to a text file, for a bug report.
+
+    Like Metrics, nothing in the parsing code refers to this class.  While a profiling session is running, the
+    methods of each stage of the parser (reading, processing a batch of lines, and each detector check) are
+    wrapped, on the parser objects only, with versions that time the calls into histograms.  The rest of the time
+    the wrappers aren't there at all, so profiling costs nothing until it is switched on, by a signal (see
+    install_signal_handler()) or the [Profiling] section of the ini file.
+
+    In sample mode, a background thread also samples the parsing thread's stack every SAMPLE_INTERVAL seconds,
+    which costs the parser very little.  In cprofile mode, every call on the parsing thread is profiled, which
+    is exact, but makes the parser several times slower while it lasts
+    """
+
+    def __init__(self, directory: str = 'profiles', seconds: float = PROFILE_SECONDS, mode: str = MODE_SAMPLE) -> None:
+        """
+        ctor
+
+        :param directory: directory the reports are written to
+        :param seconds: number of seconds each profiling session lasts
+        :param mode: one of MODES
+        """
+        mode = mode.lower()
+        if mode not in MODES:
+            raise ValueError(f'Unknown profiling mode [{mode}], expected one of {list(MODES)}')
+        self.directory = directory
+        self.seconds = seconds
+        self.mode = mode
+
+        # every parser object created through instrument_factory(), for as long as it exists
+        self._parsers = weakref.WeakSet()
+
+        self._lock = threading.Lock()
+        self._session = None
+
+        # state of the running session, see start()
+        self._stages = dict()
+        self._installed = list()
+        self._threads = dict()
+        self._collecting = False
+        self._profiles = dict()
+        self._handed_back = list()
+        self._handback = threading.Condition(self._lock)
+        self._samples = 0
+        self._self_counts = dict()
+        self._total_counts = dict()
+
+    def instrument(self, parser: EverquestLogFile.EverquestLogFile or EverquestMultiLogFile.EverquestMultiLogFile) -> None:
+        """
+        remember a parser object, so it can be profiled.  For a multi log parser, every per-character parser
+        it creates is remembered too.  Nothing about the parser is changed until a session is started
+
+        :param parser: parser object
+        """
+        if isinstance(parser, EverquestMultiLogFile.EverquestMultiLogFile):
+            parser.factory = self.instrument_factory(parser.factory)
+            return
+
+        self._parsers.add(parser)
+        with self._lock:
+            if self._session is not None:
+                self._attach(parser)
+
+    def instrument_factory(self, factory):
+        """
+        :param factory: callable that creates a new parser object
+        :return: callable that creates a new parser object, and instruments it
+        """
+        @functools.wraps(factory)
+        def wrapper(*args, **kwargs):
+            parser = factory(*args, **kwargs)
+            self.instrument(parser)
+            return parser
+        return wrapper
+
+    def install_signal_handler(self) -> None:
+        """
+        start a profiling session on SIGUSR1 (i.e. kill -USR1 <pid>), or on Windows, on ctrl-break.
+        Must be called from the main thread
+        """
+        signum = getattr(signal, 'SIGUSR1', None) or getattr(signal, 'SIGBREAK', None)
+        if signum is not None:
+            # the session is started from another thread, since the main thread may be holding a lock (i.e. the
+            # console's) at the moment the signal arrives
+            signal.signal(signum, lambda *args: threading.Thread(target=self.start, daemon=True).start())
+
+    def start(self) -> bool:
+        """
+        start a profiling session, which lasts self.seconds, and then writes its report
+
+        :return: True if a session was started, False if one is already running
+        """
+        with self._lock:
+            if self._session is not None:
+                return False
+
+            self._stages = dict()
+            self._installed = list()
+            self._threads = dict()
+            self._collecting = True
+            self._profiles = dict()
+            self._handed_back = list()
+            self._samples = 0
+            self._self_counts = dict()
+            self._total_counts = dict()
+            for parser in list(self._parsers):
+                self._attach(parser)
+
+            self._session = threading.Thread(target=self._run_session, daemon=True)
+            self._session.start()
+
+        EverquestLogFile.starprint(f'Profiler: profiling the parser for {self.seconds:g} seconds, in {self.mode} mode')
+        return True
+
+    def targets(self, parser: EverquestLogFile.EverquestLogFile) -> list[tuple[object, str, str]]:
+        """
+        :param parser: parser object
+        :return: list of the (object, method name, stage name) of each stage of the parser to be timed
+        """
+        rv = [(parser, name, name) for name in PARSER_STAGES if hasattr(parser, name)]
+
+        pipeline = getattr(parser, 'pipeline', None)
+        if pipeline is not None:
+            rv.append((pipeline, 'make_event', 'make_event'))
+            for detector in pipeline.detectors:
+                rv.extend((detector, name, f'{detector.name}.{name}') for name in DETECTOR_STAGES if hasattr(detector, name))
+        return rv
+
+    def _attach(self, parser: EverquestLogFile.EverquestLogFile) -> None:
+        """
+        wrap the stage methods of a parser object, with the lock held
+
+        :param parser: parser object
+        """
+        for obj, name, stage in self.targets(parser):
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = StageHistogram()
+
+            # remember whether the method was the class's own, or already wrapped on the object (e.g. by Metrics)
+            self._installed.append((obj, name, obj.__dict__.get(name)))
+            method = getattr(obj, name)
+            if name == 'readlines':
+                setattr(obj, name, self._wrap_readlines(method, histogram))
+            else:
+                setattr(obj, name, self._wrap(method, histogram))
+
+    def _detach(self) -> None:
+        """
+        put back the methods wrapped by _attach(), with the lock held
+        """
+        for obj, name, previous in reversed(self._installed):
+            if previous is None:
+                obj.__dict__.pop(name, None)
+            else:
+                setattr(obj, name, previous)
+        self._installed = list()
+
+    def _wrap(self, method, histogram: StageHistogram):
+        perf_counter = time.perf_counter
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                with self._lock:
+                    histogram.record(elapsed)
+        return wrapper
+
+    def _wrap_readlines(self, method, histogram: StageHistogram):
+        timed = self._wrap(method, histogram)
+
+        @functools.wraps(method)
+        def wrapper():
+            # readlines() is called by whichever thread is doing the parsing, so this is where it is found,
+            # and where cProfile is turned on and off for it
+            self._parsing_thread()
+            return timed()
+        return wrapper
+
+    def _parsing_thread(self) -> None:
+        """
+        called on the parsing thread, at every read
+        """
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = threading.current_thread().name
+            if self.mode != MODE_CPROFILE:
+                return
+
+            profile = self._profiles.get(ident)
+            if self._collecting and profile is None:
+                import cProfile
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError as err:
+                    # only one profiler can be active at a time in newer pythons, so one of the threads goes without
+                    EverquestLogFile.starprint(f'Profiler: unable to profile thread [{ident}]: {err}', Console.QUIET)
+                    profile = False
+                self._profiles[ident] = profile
+
+            elif not self._collecting and profile:
+                profile.disable()
+                self._profiles[ident] = False
+                self._handed_back.append(profile)
+                self._handback.notify_all()
+
+    def _run_session(self) -> None:
+        """
+        body of the session thread: sample (if need be) until the time is up, then write the report
+        """
+        started = time.time()
+        end = time.perf_counter() + self.seconds
+        if self.mode == MODE_SAMPLE:
+            switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(SAMPLE_SWITCH_INTERVAL)
+            try:
+                while time.perf_counter() < end:
+                    self._sample()
+                    time.sleep(SAMPLE_INTERVAL)
+            finally:
+                sys.setswitchinterval(switch_interval)
+        else:
+            time.sleep(self.seconds)
+
+        with self._lock:
+            self._collecting = False
+
+            # the profiled threads turn cProfile off themselves, the next time they read the log
+            if self.mode == MODE_CPROFILE:
+                self._handback.wait_for(lambda: not any(self._profiles.values()), HANDBACK_TIMEOUT)
+            self._detach()
+
+        try:
+            filename = self.write_report(started)
+            EverquestLogFile.starprint(f'Profiler: report written to [{filename}]')
+        except OSError as err:
+            EverquestLogFile.starprint(f'Profiler: unable to write report: {err}', Console.QUIET)
+
+        with self._lock:
+            self._session = None
+
+    def _sample(self) -> None:
+        """
+        take one sample of the stack of each parsing thread
+        """
+        frames = sys._current_frames()
+        with self._lock:
+            for ident in self._threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                self._samples += 1
+
+                # the innermost function has the time to itself, and every function on the stack has it in total
+                leaf = True
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    key = (code.co_filename, code.co_firstlineno, code.co_name)
+                    if leaf:
+                        self._self_counts[key] = self._self_counts.get(key, 0) + 1
+                        leaf = False
+                    if key not in seen:
+                        seen.add(key)
+                        self._total_counts[key] = self._total_counts.get(key, 0) + 1
+                    frame = frame.f_back
+
+    def write_report(self, started: float) -> str:
+        """
+        write the report for the session that just ended
+
+        :param started: time the session started, epoch seconds
+        :return: report filename
+        """
+        # these are only needed for the report, and pstats in particular is slow to import, so they aren't imported
+        # until a report is written, rather than every time the program starts
+        import platform
+        import pstats
+
+        os.makedirs(self.directory, exist_ok=True)
+        basename = os.path.join(self.directory, 'profile_' + time.strftime('%Y%m%d_%H%M%S', time.localtime(started)))
+
+        out = io.StringIO()
+        out.write(f'DeathLoopVaccine profile, {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started))}, '
+                  f'{self.seconds:g} seconds, {self.mode} mode\n')
+        out.write(f'python {platform.python_version()} on {platform.platform()}\n')
+        out.write(f'parsing threads: {self._threads}\n\n')
+
+        # stage timings
+        out.write('stage timings, in microseconds (percentiles are the upper bound of their power of 2 bucket)\n')
+        out.write(f'{"stage":<36}{"calls":>10}{"total ms":>12}{"mean":>10}{"p50":>10}{"p90":>10}{"p99":>10}{"max":>10}\n')
+        for stage, h in self._stages.items():
+            calls = h.calls()
+            mean = h.total / calls * 1e6 if calls else 0.0
+            out.write(f'{stage:<36}{calls:>10}{h.total * 1e3:>12.1f}{mean:>10.1f}{h.percentile(0.5) * 1e6:>10.0f}'
+                      f'{h.percentile(0.9) * 1e6:>10.0f}{h.percentile(0.99) * 1e6:>10.0f}{h.max * 1e6:>10.0f}\n')
+        out.write('\nstage histograms, as <2**n microseconds: calls\n')
+        for stage, h in self._stages.items():
+            buckets = '  '.join(f'<{1 << n}: {count}' for n, count in enumerate(h.counts) if count)
+            out.write(f'{stage:<36}{buckets}\n')
+
+        if self.mode == MODE_SAMPLE:
+            out.write(f'\n{self._samples} stack samples of the parsing thread(s), every {SAMPLE_INTERVAL * 1000:.0f} msec\n')
+            for title, counts in (('self', self._self_counts), ('total (including callees)', self._total_counts)):
+                out.write(f'\ntop functions by {title}\n')
+                top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:REPORT_TOP]
+                for (filename, lineno, name), count in top:
+                    share = 100.0 * count / max(self._samples, 1)
+                    out.write(f'{share:>7.1f}%  {count:>8}  {name} ({os.path.basename(filename)}:{lineno})\n')
+
+        elif self.mode == MODE_CPROFILE:
+            if self._handed_back:
+                # the raw profile too, for tools like snakeviz
+                stats = pstats.Stats(*self._handed_back, stream=out)
+                stats.dump_stats(basename + '.prof')
+                for sort in ('cumulative', 'tottime'):
+                    out.write(f'\ncProfile, by {sort}\n')
+                    stats.sort_stats(sort).print_stats(REPORT_TOP)
+            else:
+                out.write('\nno cProfile data: the parsing thread did not read the log before the session ended\n')
+
+        filename = basename + '.txt'
+        with open(filename, 'w') as f:
+            f.write(out.getvalue())
+        return filename
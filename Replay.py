@@ -0,0 +1,349 @@
+import argparse
+import configparser
+import csv
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import Console
+import DeathLoopVaccine
+import EverquestLogFile
+import LogArchive
+import LogEvents
+import LogRules
+import TimeIndex
+
+
+#
+# offline replay / backtest of the DeathLoopVaccine detector
+#
+# Runs the detector over one or more historical eqlog files, as fast as the disk allows, and writes
+# a report of every death loop episode that would have triggered a process kill.  Kills are only simulated.
+# Files are spread across a pool of worker processes, one file per worker at a time.
+#
+# Several DEATHS and SECONDS values can be given at once, and every combination is evaluated in the
+# same pass over each file, which makes it cheap to tune the death loop definition against years of logs, i.e.
+#
+#   py Replay.py c:\Everquest\logs\eqlog_*_P1999Green.txt --deaths 3 4 5 --seconds 60 120 180
+#
+# Archived logs (.gz, or .zst if the zstandard package is installed) are read as they are, decompressed on the fly.
+#
+# A time range can be given with --since and --until, in which case each log's time index (see TimeIndex)
+# is used to go straight to the start of the range, rather than reading the whole log to get there.
+#
+# Only the lines that begin with the literal prefix of some rule can affect the detector, so once in the range,
+# the log is read in large chunks, and only those lines are found (with bytes.find()) and decoded.  The other
+# lines, nearly all of them, are counted, and nothing more
+#
+
+# character name from a log filename, e.g. eqlog_Charname_P1999Green.txt
+CHARNAME_REGEXP = re.compile(r'eqlog_(?P<charname>[\w ]+)_[\w ]+\.txt$')
+
+# number of bytes read at a time, when only the candidate lines are being decoded
+REPLAY_CHUNK = 4 * 1024 * 1024
+
+
+class ReplayDeathLoopDetector(DeathLoopVaccine.DeathLoopDetector):
+    """
+    death loop detector, for use on historical log files.
+
+    Rather than killing eqgame.exe, deathloop_response() records each death loop episode
+    """
+
+    def __init__(self, parser: DeathLoopVaccine.DeathLoopVaccine, deaths: int, seconds: int) -> None:
+        """
+        ctor
+
+        :param parser: the parser feeding this detector
+        :param deaths: number of deaths that define a death loop
+        :param seconds: number of seconds that define a death loop
+        """
+        super().__init__(parser, deaths, seconds)
+
+        # several of these share one pipeline, one per combination being evaluated
+        self.name = f'deathloop_{deaths}_{seconds}'
+
+        # list of episode dictionaries, see deathloop_response()
+        self.episodes = list()
+
+    def deathloop_response(self) -> None:
+        """
+        are we death looping?  if so, record the episode, and simulate the kill
+        """
+        if len(self.death_list) >= self.deathloop_deaths:
+            first_time, _ = self.death_list[0]
+            last_time, last_line = self.death_list[-1]
+            self.episodes.append({
+                'trigger_time': last_time,
+                'first_death_time': first_time,
+                'character': self.parser.char_name,
+                'filename': self.parser.filename,
+                'line_number': self.parser.line_number,
+                'byte_offset': self.parser.line_offset,
+                'deaths': self.deathloop_deaths,
+                'seconds': self.deathloop_seconds,
+                'simulated': not self.kill_armed,
+                'line': last_line.rstrip(),
+            })
+
+            # purge any death messages from the list
+            self.reset()
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def make_replay_parser(config: configparser.ConfigParser, combinations: list[tuple[int, int]],
+                       char_name: str = 'Unknown', filename: str = '') -> DeathLoopVaccine.DeathLoopVaccine:
+    """
+    create a parser (which is never started) whose pipeline feeds one recording detector per combination
+
+    :param config: parsed ini file contents (for the rules)
+    :param combinations: list of (deaths, seconds) tuples
+    :param char_name: character name, for the report
+    :param filename: log filename, for the report
+    :return: parser object, with the detectors in parser.pipeline.detectors
+    """
+    parser = DeathLoopVaccine.DeathLoopVaccine(config)
+    parser.char_name = char_name
+    parser.filename = filename
+
+    # position of the line being processed, for the report
+    parser.line_number = 0
+    parser.line_offset = 0
+
+    # the same rules, but only the recording detectors
+    parser.pipeline = LogEvents.EventPipeline(parser, LogRules.load_rules(config))
+    for deaths, seconds in combinations:
+        parser.pipeline.register(ReplayDeathLoopDetector(parser, deaths, seconds))
+    return parser
+
+
+def replay_file(filename: str, ini_filename: str, combinations: list[tuple[int, int]],
+                since: float = None, until: float = None) -> tuple[str, int, list[dict]]:
+    """
+    run the detector over a single log file, for every (deaths, seconds) combination at once.
+    This is the worker function, and executes in a pool process
+
+    :param filename: log filename
+    :param ini_filename: ini filename, for the rules (optional, the built-in rules are used if it can't be read)
+    :param combinations: list of (deaths, seconds) tuples
+    :param since: if not None, only the lines at or after this time (epoch seconds) are replayed
+    :param until: if not None, only the lines at or before this time (epoch seconds) are replayed
+    :return: tuple of (filename, number of lines, list of episode dictionaries)
+    """
+    config = configparser.ConfigParser()
+    config.read(ini_filename)
+
+    m = CHARNAME_REGEXP.search(LogArchive.log_name(filename))
+    char_name = m.group('charname') if m else 'Unknown'
+    parser = make_replay_parser(config, combinations, char_name, filename)
+
+    # the detectors' status messages are of no interest here
+    Console.console.configure(verbosity=Console.QUIET)
+
+    # each line is parsed once, and shared with every detector
+    process_line = parser.pipeline.process_line
+    needles = parser.line_filter()
+    with LogArchive.open_log(filename) as f:
+
+        # go straight to the start of the time range, using (and bringing up to date) the log's time index.
+        # Archives can't be seeked, so they are read from the beginning
+        if since is not None and not LogArchive.is_archive(filename):
+            try:
+                index = TimeIndex.open_index(filename, config.get('TimeIndex', 'DIRECTORY', fallback='timeindex'))
+                index.update()
+                parser.line_offset = index.seek(since)
+                f.seek(parser.line_offset)
+            except OSError:
+                # no index, so the lines before the range are read and skipped
+                pass
+
+        # from the index entry, skip ahead to the first line of the range, and stop at the end of it
+        started = since is None
+        remaining = False
+        for raw in f:
+            line = EverquestLogFile.decode_lines(raw)
+            if not started or until is not None:
+                epoch = EverquestLogFile.parse_timestamp(line)
+                if not started:
+                    if epoch is None or epoch < since:
+                        parser.line_offset += len(raw)
+                        continue
+                    started = True
+                if epoch is not None and until is not None and epoch > until:
+                    break
+
+            parser.line_number += 1
+            process_line(line)
+            parser.line_offset += len(raw)
+
+            # once in the range, only the lines that could match a rule need to be looked at
+            if needles is not None:
+                remaining = True
+                break
+
+        if remaining:
+            replay_candidates(f, parser, needles, until)
+
+    episodes = list()
+    for detector in parser.pipeline.detectors:
+        episodes.extend(detector.episodes)
+    return filename, parser.line_number, episodes
+
+
+def replay_candidates(f, parser: DeathLoopVaccine.DeathLoopVaccine, needles: tuple[bytes], until: float = None) -> None:
+    """
+    replay the rest of a log, decoding and processing only the lines that begin with one of the needles,
+    see EverquestLogFile.candidate_starts().  The other lines are only counted, so the line numbers stay true
+
+    :param f: log file object, opened in binary mode, positioned at parser.line_offset
+    :param parser: the replay parser, see make_replay_parser()
+    :param needles: see DeathLoopVaccine.line_filter()
+    :param until: if not None, only the lines at or before this time (epoch seconds) are replayed
+    """
+    process_line = parser.pipeline.process_line
+    base = parser.line_offset
+    partial = b''
+    while True:
+        chunk = f.read(REPLAY_CHUNK)
+        data = partial + chunk
+
+        # only the data up through the last newline is complete, except at the very end of the log
+        end = data.rfind(b'\n') + 1 if chunk else len(data)
+        if end == 0:
+            if not chunk:
+                break
+            partial = data
+            continue
+
+        # counted is how far the newlines in data have been counted
+        counted = 0
+        for start in EverquestLogFile.candidate_starts(data, end, needles):
+            stop = data.find(b'\n', start, end) + 1 or end
+            line = EverquestLogFile.decode_lines(data[start:stop])
+            if until is not None:
+                epoch = EverquestLogFile.parse_timestamp(line)
+                if epoch is not None and epoch > until:
+                    # the range may have ended in one of the lines before this one, so count those one at a time
+                    for raw in data[counted:start].splitlines():
+                        epoch = EverquestLogFile.parse_timestamp(EverquestLogFile.decode_lines(raw))
+                        if epoch is not None and epoch > until:
+                            break
+                        parser.line_number += 1
+                    return
+
+            parser.line_number += data.count(b'\n', counted, start) + 1
+            counted = stop
+            parser.line_offset = base + start
+            process_line(line)
+
+        parser.line_number += data.count(b'\n', counted, end)
+        if not chunk:
+            # a last line with no newline of its own
+            if counted < end and not data.endswith(b'\n'):
+                parser.line_number += 1
+            break
+        base += end
+        partial = data[end:]
+
+    parser.line_offset = base + end
+
+
+def parse_time(text: str) -> float:
+    """
+    utility function to read a local date and time from the command line
+
+    :param text: date and time, i.e. 'YYYY-MM-DD HH:MM:SS', 'YYYY-MM-DD HH:MM', or 'YYYY-MM-DD'
+    :return: epoch seconds
+    """
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f'[{text}] is not a date and time of the form YYYY-MM-DD HH:MM:SS')
+
+
+def write_report(report_filename: str, episodes: list[dict]) -> None:
+    """
+    write the merged episode report, in CSV format, oldest episode first
+
+    :param report_filename: report filename
+    :param episodes: list of episode dictionaries
+    """
+    fields = ['trigger_time', 'first_death_time', 'character', 'deaths', 'seconds', 'simulated',
+              'filename', 'line_number', 'byte_offset', 'line']
+    with open(report_filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for episode in sorted(episodes, key=lambda e: (e['trigger_time'] or 0, e['filename'], e['line_number'])):
+            row = dict(episode)
+            for key in ('trigger_time', 'first_death_time'):
+                if row[key] is not None:
+                    row[key] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row[key]))
+            writer.writerow(row)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Replay historical Everquest logs through the DeathLoopVaccine '
+                                                 'detector, and report the death loops that would have triggered')
+    parser.add_argument('files', nargs='+', help='log files or wildcard masks')
+    parser.add_argument('--ini', default='DeathLoopVaccine.ini', help='ini file to read the rules and death loop definition from')
+    parser.add_argument('--deaths', type=int, nargs='+', help='one or more DEATHS values to evaluate')
+    parser.add_argument('--seconds', type=int, nargs='+', help='one or more SECONDS values to evaluate')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--report', default='replay_report.csv', help='report filename')
+    parser.add_argument('--since', type=parse_time, help='only replay from this time, i.e. "2024-01-30 21:14" '
+                                                          '(line numbers in the report then count from here)')
+    parser.add_argument('--until', type=parse_time, help='only replay up to this time')
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.ini)
+    deaths_list = args.deaths or [config.getint('DeathLoop', 'DEATHS', fallback=DeathLoopVaccine.DEATHLOOP_DEATHS)]
+    seconds_list = args.seconds or [config.getint('DeathLoop', 'SECONDS', fallback=DeathLoopVaccine.DEATHLOOP_SECONDS)]
+    combinations = [(deaths, seconds) for deaths in deaths_list for seconds in seconds_list]
+
+    # expand any wildcards (the windows shell doesn't do it for us)
+    files = list()
+    for mask in args.files:
+        files.extend(sorted(glob.glob(mask)) or [mask])
+
+    jobs = max(1, min(args.jobs or 1, len(files)))
+    EverquestLogFile.starprint(f'Replaying {len(files)} log file(s) using {jobs} worker process(es)')
+    start = time.perf_counter()
+
+    total_lines = 0
+    episodes = list()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(replay_file, filename, args.ini, combinations, args.since, args.until) for filename in files]
+        for future in as_completed(futures):
+            try:
+                filename, lines, file_episodes = future.result()
+            except OSError as err:
+                EverquestLogFile.starprint(f'Unable to replay: {err}')
+                continue
+            total_lines += lines
+            episodes.extend(file_episodes)
+            EverquestLogFile.starprint(f'{filename}: {lines} lines, {len(file_episodes)} episode(s)')
+
+    elapsed = time.perf_counter() - start
+    write_report(args.report, episodes)
+
+    # summary, per death loop definition
+    EverquestLogFile.starprint('')
+    for deaths, seconds in combinations:
+        count = sum(1 for e in episodes if e['deaths'] == deaths and e['seconds'] == seconds)
+        EverquestLogFile.starprint(f'{deaths} deaths in {seconds} seconds: {count} episode(s)')
+    EverquestLogFile.starprint(f'{total_lines} lines in {elapsed:.2f} seconds '
+                               f'({total_lines / max(elapsed, 1e-9):.0f} lines/sec), report written to [{args.report}]')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import signal
+import threading
+import time
+from typing import Callable
+
+import Console
+import EverquestLogFile
+
+
+class Supervisor:
+    """
+    class to keep a log parsing thread alive for the length of a play session.
+
+    The main thread blocks in run() until a shutdown is requested, either by SIGINT/SIGTERM or by
+    a call to shutdown().  While it waits, it checks on the parsing thread, and replaces the thread
+    with a fresh one from the factory if it has died with an exception.  It also periodically reports
+    how much CPU the process is using, which should be close to zero while the game is idle, and reports
+    once how long it took from startup for the parser to be ready, and to read the first log line.
+    """
+
+    def __init__(self, factory: Callable[[], EverquestLogFile.EverquestLogFile],
+                 check_interval: float = 1.0, restart_delay: float = 5.0, cpu_report_interval: float = 300.0,
+                 start_time: float = None) -> None:
+        """
+        ctor
+
+        :param factory: callable that creates a new, not yet started, parser object
+        :param check_interval: number of seconds between checks on the health of the parsing thread
+        :param restart_delay: minimum number of seconds between attempts to (re)start the parsing thread
+        :param cpu_report_interval: number of seconds between CPU usage reports, 0 to disable
+        :param start_time: time.perf_counter() when the program started, for the startup report.
+        If None, the time the supervisor is created
+        """
+        self.factory = factory
+        self.check_interval = check_interval
+        self.restart_delay = restart_delay
+        self.cpu_report_interval = cpu_report_interval
+
+        self.parser = None
+        self.restarts = 0
+
+        self._shutdown = threading.Event()
+        self._last_start = 0.0
+
+        # CPU usage bookkeeping, for the periodic reports
+        self._start_wall = time.monotonic()
+        self._start_cpu = time.process_time()
+        self._report_wall = self._start_wall
+        self._report_cpu = self._start_cpu
+
+        # startup report bookkeeping, see check_startup()
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self._ready_reported = False
+        self._first_line_reported = False
+
+    def install_signal_handlers(self) -> None:
+        """
+        route SIGINT and SIGTERM to shutdown().  Must be called from the main thread
+        """
+        signal.signal(signal.SIGINT, self._signal_handler)
+        signal.signal(signal.SIGTERM, self._signal_handler)
+
+    def _signal_handler(self, signum: int, frame) -> None:
+        """
+        signal handler
+
+        :param signum: signal number
+        :param frame: current stack frame (unused)
+        """
+        EverquestLogFile.starprint(f'Supervisor: received {signal.Signals(signum).name}, shutting down')
+        self.shutdown()
+
+    def start(self) -> bool:
+        """
+        create the parser and kick off parsing
+
+        :return: True if the parser was started successfully
+        """
+        self.parser = self.factory()
+        return self._go()
+
+    def _go(self) -> bool:
+        """
+        utility function to start (or retry starting) the current parser
+
+        :return: True if the parser is parsing
+        """
+        self._last_start = time.monotonic()
+        try:
+            return self.parser.go()
+        except (OSError, ValueError) as err:
+            EverquestLogFile.starprint(f'Supervisor: unable to start parsing: {err}', Console.QUIET)
+            return False
+
+    def shutdown(self) -> None:
+        """
+        stop the parser, and cause run() to return
+        """
+        self._shutdown.set()
+        if self.parser:
+            self.parser.shutdown()
+
+    def run(self) -> None:
+        """
+        block until shutdown is requested, keeping the parsing thread alive in the meantime
+        """
+        if self.parser is None:
+            self.start()
+
+        while not self._shutdown.wait(self.check_interval):
+            self.check_parser()
+            self.check_startup()
+            self.check_cpu_report()
+
+        # give the parsing thread a moment to wind down
+        if self.parser.is_alive():
+            self.parser.join(timeout=2.0)
+
+        self.report_cpu('CPU usage for session', self._start_wall, self._start_cpu)
+
+    def check_parser(self) -> None:
+        """
+        restart the parsing thread if it died, or retry go() if it never got going (e.g. no log file yet)
+        """
+        if self.parser.is_alive():
+            return
+
+        if time.monotonic() - self._last_start < self.restart_delay:
+            return
+
+        # a thread object can only be started once, so a crashed parser is replaced with a new one
+        if self.parser.exception is not None:
+            self.restarts += 1
+            EverquestLogFile.starprint(f'Supervisor: parsing thread died ({self.parser.exception!r}), '
+                                       f'restarting (restart #{self.restarts})', Console.QUIET)
+            self.parser = self.factory()
+
+        self._go()
+
+    def check_startup(self) -> None:
+        """
+        report, once each, how long it took from the start of the program for the parser to be ready (i.e. the cold
+        start time), and for the first log line to be read.  The second also depends on when the game next
+        writes to the log, so it may be much later.  It counts any line, even one that the line filter screens out
+        """
+        if not self._ready_reported:
+            ready_time = getattr(self.parser, 'ready_time', None)
+            if ready_time is not None:
+                self._ready_reported = True
+                EverquestLogFile.starprint(f'Supervisor: parser ready {(ready_time - self.start_time) * 1000.0:.0f} msec '
+                                           f'after startup')
+
+        if not self._first_line_reported:
+            first_line_time = getattr(self.parser, 'first_line_time', None)
+            if first_line_time is not None:
+                self._first_line_reported = True
+                EverquestLogFile.starprint(f'Supervisor: first log line read '
+                                           f'{(first_line_time - self.start_time) * 1000.0:.0f} msec after startup')
+
+    def check_cpu_report(self) -> None:
+        """
+        issue the periodic CPU usage report, if one is due
+        """
+        if self.cpu_report_interval <= 0:
+            return
+
+        if time.monotonic() - self._report_wall >= self.cpu_report_interval:
+            self.report_cpu('CPU usage', self._report_wall, self._report_cpu)
+            self._report_wall = time.monotonic()
+            self._report_cpu = time.process_time()
+
+    @staticmethod
+    def report_cpu(label: str, since_wall: float, since_cpu: float) -> None:
+        """
+        print the CPU usage of the whole process (all threads) since the passed reference point
+
+        :param label: description for the report
+        :param since_wall: time.monotonic() value at the start of the period
+        :param since_cpu: time.process_time() value at the start of the period
+        """
+        wall = time.monotonic() - since_wall
+        cpu = time.process_time() - since_cpu
+        if wall > 0:
+            EverquestLogFile.starprint(f'Supervisor: {label} = {100.0 * cpu / wall:.2f}% of one core '
+                                       f'({cpu:.2f} CPU seconds in {wall:.0f} seconds)')
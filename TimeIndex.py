@@ -0,0 +1,368 @@
+import argparse
+import bisect
+import glob
+import os
+import struct
+import threading
+import time
+import weakref
+from array import array
+
+import Checkpoint
+import Console
+import EverquestLogFile
+
+
+# one index entry is taken for every INDEX_BLOCK bytes of log
+INDEX_BLOCK = 64 * 1024
+
+# number of bytes read at each block boundary, to find the first complete line and its timestamp
+SAMPLE_BYTES = 4096
+
+# number of new entries that are written to the index file at a time, while building
+FLUSH_ENTRIES = 1024
+
+# suffix added to the log filename to make the index filename
+INDEX_SUFFIX = '.tidx'
+
+# index file header: magic, block size, and the length and crc32 of the head of the log it indexes
+MAGIC = b'DLVTIDX1'
+HEADER = struct.Struct('<8sIII')
+
+# index file entry: time of the first line starting in the block (epoch seconds), and its byte offset
+ENTRY = struct.Struct('<qq')
+
+# the TimeIndex objects in use in this process, by index filename, see open_index().  Only one object may write to
+# an index file.  An index whose background build is still running is kept alive by the build thread, so it stays here
+# until the build is done, even if the parser that opened it has moved on to another log
+_open_indexes = weakref.WeakValueDictionary()
+_open_indexes_lock = threading.Lock()
+
+
+class TimeIndex:
+    """
+    class to map times to byte offsets in an Everquest log, so that reading can begin at a given time
+    without reading everything before it.
+
+    The index is sparse: entry i holds the time and offset of the first line that begins in the i'th block
+    of INDEX_BLOCK bytes.  Building it only needs one small read at each block boundary, so a multi-GB log
+    is indexed in one streaming pass of small reads, rather than a full read.  Entries are appended to a
+    sidecar file as they are made, so a build that is interrupted resumes where it stopped, and a log that
+    keeps on growing only ever has its new blocks indexed.
+
+    The times are kept non-decreasing, so they can be binary searched.  A block whose first line has no
+    timestamp (or an earlier one, e.g. when daylight saving time ends) repeats the previous entry
+    """
+
+    def __init__(self, log_filename: str, index_filename: str = None, block: int = INDEX_BLOCK) -> None:
+        """
+        ctor
+
+        :param log_filename: full log filename
+        :param index_filename: full index filename, if None, the log filename with INDEX_SUFFIX added.
+        :param block: number of bytes of log per index entry
+        """
+        self.log_filename = log_filename
+        self.index_filename = index_filename or log_filename + INDEX_SUFFIX
+        self.block = block
+
+        self._epochs = array('q')
+        self._offsets = array('q')
+        self._head = None
+
+        # True when the index file doesn't match the entries in memory, and must be rewritten before appending to it
+        self._stale_file = True
+
+        # one writer at a time, see update() and catch_up()
+        self._lock = threading.Lock()
+        self._builder = None
+
+        # False once the index file turns out not to be writable, after which the index is kept in memory only
+        self._writable = True
+
+    def __len__(self) -> int:
+        return len(self._epochs)
+
+    def covered(self) -> int:
+        """
+        :return: number of bytes at the start of the log that the index covers
+        """
+        return len(self._epochs) * self.block
+
+    def load(self) -> bool:
+        """
+        read the index file, if there is one, and it belongs to the log as it is now.
+        Otherwise, the index starts out empty, and the index file is rewritten by the next update()
+
+        :return: True if an existing index was loaded
+        """
+        self._epochs = array('q')
+        self._offsets = array('q')
+        self._head = None
+        self._stale_file = True
+        try:
+            with open(self.log_filename, 'rb') as log:
+                size = os.fstat(log.fileno()).st_size
+                with open(self.index_filename, 'rb') as f:
+                    magic, block, head_length, head_crc = HEADER.unpack(f.read(HEADER.size))
+                    if magic != MAGIC or block != self.block:
+                        return False
+                    if Checkpoint.fingerprint(log, head_length) != (head_length, head_crc):
+                        return False
+                    data = f.read()
+        except (OSError, struct.error):
+            return False
+
+        # ignore any partly written entry at the end, and any entries beyond the end of the log (i.e. truncated)
+        count = min(len(data) // ENTRY.size, size // self.block)
+        for epoch, offset in ENTRY.iter_unpack(data[:count * ENTRY.size]):
+            self._epochs.append(epoch)
+            self._offsets.append(offset)
+        self._head = (head_length, head_crc)
+        self._stale_file = len(data) != count * ENTRY.size
+        return True
+
+    def update(self, limit: int = None, max_blocks: int = None) -> int:
+        """
+        index the complete blocks of the log that aren't indexed yet, appending to the index file
+
+        :param limit: only index blocks that end at or before this offset, if None, the current size of the log
+        :param max_blocks: maximum number of blocks to index in this call, if None, all of them
+        :return: number of blocks indexed
+        """
+        with self._lock:
+            try:
+                with open(self.log_filename, 'rb') as log:
+                    return self._update(log, limit, max_blocks)
+            except OSError as err:
+                EverquestLogFile.starprint(f'Unable to index [{self.log_filename}]: {err}', Console.QUIET)
+                return 0
+
+    def _update(self, log, limit: int or None, max_blocks: int or None) -> int:
+        """
+        see update(), with the lock held and the log open
+
+        :param log: log file object, opened in binary mode
+        :param limit: see update()
+        :param max_blocks: see update()
+        :return: number of blocks indexed
+        """
+        size = os.fstat(log.fileno()).st_size
+        if limit is None or limit > size:
+            limit = size
+
+        # the head fingerprint only becomes stable once the log is longer than it, so wait for a whole block
+        first = len(self._epochs)
+        last = limit // self.block
+        if max_blocks is not None:
+            last = min(last, first + max_blocks)
+        if last <= first:
+            return 0
+
+        # a new index, or a log that has been replaced or truncated since the index was loaded
+        head = Checkpoint.fingerprint(log)
+        if self._head != head or first * self.block > size:
+            self._epochs = array('q')
+            self._offsets = array('q')
+            self._head = head
+            self._stale_file = True
+            first = 0
+        if self._stale_file:
+            self._rewrite()
+
+        entries = list()
+        epoch = self._epochs[-1] if first > 0 else 0
+        offset = self._offsets[-1] if first > 0 else 0
+        for i in range(first, last):
+            # a sample with no usable time repeats the previous entry, offset and all, since the lines in between
+            # could have any time at all, and a seek must never skip over them
+            sample_epoch, sample_offset = _sample(log, i * self.block)
+            if sample_epoch is not None and sample_epoch >= epoch:
+                epoch, offset = sample_epoch, sample_offset
+            self._epochs.append(epoch)
+            self._offsets.append(offset)
+            entries.append(ENTRY.pack(epoch, offset))
+
+            # save as we go, so that an interrupted build of a large log resumes from about where it stopped
+            if len(entries) >= FLUSH_ENTRIES:
+                self._append(b''.join(entries))
+                entries.clear()
+
+        self._append(b''.join(entries))
+        return last - first
+
+    def catch_up(self, limit: int) -> None:
+        """
+        bring the index up to limit in a background thread, if it has fallen at least a block behind, and it
+        isn't being brought up to date already.  Cheap enough to call after every batch of lines
+
+        :param limit: offset the index should reach, i.e. the parser's read position
+        """
+        if limit < self.covered() + self.block:
+            return
+        if self._builder is not None and self._builder.is_alive():
+            return
+
+        self._builder = threading.Thread(target=self._build, args=(limit,), daemon=True)
+        self._builder.start()
+
+    def _build(self, limit: int) -> None:
+        """
+        body of the background thread started by catch_up()
+
+        :param limit: see catch_up()
+        """
+        start = time.perf_counter()
+        covered = self.covered()
+        blocks = self.update(limit)
+
+        # only a sizeable build is worth a mention
+        if blocks > 1000:
+            elapsed = time.perf_counter() - start
+            EverquestLogFile.starprint(f'Indexed [{os.path.basename(self.log_filename)}] from {covered} to {self.covered()} bytes, '
+                                       f'{blocks} blocks in {elapsed:.2f} seconds')
+
+    def seek(self, epoch: float) -> int:
+        """
+        find where to begin reading, to see every line at or after the passed time.
+        Reading must still skip over any earlier lines from there, at most about a block's worth
+
+        :param epoch: epoch seconds
+        :return: byte offset of the beginning of a line
+        """
+        # the last entry before the time.  An entry at exactly that time may have more lines of the same second before it
+        index = bisect.bisect_left(self._epochs, epoch) - 1
+        return self._offsets[index] if index >= 0 else 0
+
+    def _rewrite(self) -> None:
+        """
+        write the index file afresh, with the header and the entries in memory
+        """
+        self._stale_file = False
+        if not self._writable:
+            return
+        try:
+            with open(self.index_filename, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, self.block, self._head[0], self._head[1]))
+                f.write(b''.join(ENTRY.pack(epoch, offset) for epoch, offset in zip(self._epochs, self._offsets)))
+        except OSError as err:
+            self._not_writable(err)
+
+    def _append(self, data: bytes) -> None:
+        """
+        append entries to the index file
+
+        :param data: packed entries
+        """
+        if not self._writable:
+            return
+        try:
+            with open(self.index_filename, 'ab') as f:
+                f.write(data)
+        except OSError as err:
+            self._not_writable(err)
+
+    def _not_writable(self, err: OSError) -> None:
+        """
+        carry on without the index file
+
+        :param err: the error writing it
+        """
+        self._writable = False
+        EverquestLogFile.starprint(f'Unable to write time index [{self.index_filename}], keeping it in memory only: {err}',
+                                   Console.QUIET)
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def index_filename(log_filename: str, directory: str = '') -> str:
+    """
+    utility function to build the name of the index file for a log
+
+    :param log_filename: full log filename
+    :param directory: directory for the index files, if empty, they are kept alongside the logs
+    :return: full index filename
+    """
+    if not directory:
+        return log_filename + INDEX_SUFFIX
+    return os.path.join(directory, os.path.basename(log_filename) + INDEX_SUFFIX)
+
+
+def open_index(log_filename: str, directory: str = '') -> TimeIndex:
+    """
+    utility function to get the index for a log, loading it from its index file if it isn't already in use.
+
+    A log that is opened again (e.g. a character switch and back, or a log that was replaced) gets the same TimeIndex
+    object back, so there is only ever one writer to the index file, and one background build at a time.  The object
+    itself notices if the log has been truncated or replaced, and starts the index over
+
+    :param log_filename: full log filename
+    :param directory: directory for the index files, if empty, they are kept alongside the logs
+    :return: TimeIndex object, not necessarily up to date, see TimeIndex.update()
+    """
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    filename = index_filename(log_filename, directory)
+
+    with _open_indexes_lock:
+        rv = _open_indexes.get(filename)
+        if rv is None:
+            rv = TimeIndex(log_filename, filename)
+            rv.load()
+            _open_indexes[filename] = rv
+    return rv
+
+
+def _sample(log, block_start: int) -> tuple[int or None, int or None]:
+    """
+    utility function to find the first line that begins at or after a block boundary, and its time
+
+    :param log: log file object, opened in binary mode
+    :param block_start: offset of the block boundary
+    :return: tuple of (epoch seconds or None if the line has no timestamp, offset of the line or None if not found)
+    """
+    if block_start == 0:
+        log.seek(0)
+        data = log.read(SAMPLE_BYTES)
+        offset = 0
+    else:
+        # start one byte early, so that a line beginning exactly on the boundary is found
+        log.seek(block_start - 1)
+        data = log.read(SAMPLE_BYTES)
+        start = data.find(b'\n') + 1
+        if start == 0:
+            return None, None
+        data = data[start:]
+        offset = block_start - 1 + start
+
+    # the line must be complete, else the game client may still be writing it
+    if b'\n' not in data:
+        return None, None
+    return EverquestLogFile.parse_timestamp(data[:26].decode('ascii', errors='ignore')), offset
+
+
+def main():
+    # build or bring up to date the index of each log named on the command line, e.g.
+    #   py TimeIndex.py c:\Everquest\logs\eqlog_*_P1999Green.txt
+    parser = argparse.ArgumentParser(description='Build (or bring up to date) the time index of Everquest logs')
+    parser.add_argument('files', nargs='+', help='log files or wildcard masks')
+    parser.add_argument('--directory', default='', help='directory for the index files, default alongside the logs')
+    args = parser.parse_args()
+
+    for mask in args.files:
+        for filename in sorted(glob.glob(mask)) or [mask]:
+            start = time.perf_counter()
+            index = open_index(filename, args.directory)
+            covered = index.covered()
+            blocks = index.update()
+            elapsed = time.perf_counter() - start
+            EverquestLogFile.starprint(f'[{filename}]: {len(index)} entries, {blocks} new, '
+                                       f'resumed from {covered} bytes, in {elapsed:.2f} seconds')
+    Console.console.flush()
+
+
+if __name__ == '__main__':
+    main()